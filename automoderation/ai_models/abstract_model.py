@@ -1,16 +1,82 @@
 """Abstract model"""
 
+import asyncio
+import functools
 from abc import abstractmethod
 
-from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus
+from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus, MQContentModel
+from msfwk.metrics import push_metric
+from msfwk.utils.logging import get_logger
 
 from automoderation.ai_models.abstract_thresholds import ToxicityThresholds
+from automoderation.ai_models.exceptions import ModelError, ModelTimeoutError, ModelUnavailableError
+from automoderation.ai_models.result_cache import ToxicityResultCache
+from automoderation.ai_models.sentence_store import SentenceStatusStore, fingerprint
+from automoderation.ai_models.threshold_matrix import ThresholdMatrix
+from automoderation.models.interfaces import SentenceStatusModel, TextToxicityRiskModel
+from automoderation.utils.batching import MicroBatcher
+from automoderation.utils.cache import CACHE_HIT, CACHE_MISS
+from automoderation.utils.concurrency import SingleFlight
+from automoderation.utils.metrics import CacheEventsTotal
+from automoderation.utils.settings import ChunkingSettings, IncrementalModerationSettings, ResultCacheSettings
+from automoderation.utils.text_utils import split_into_chunks, split_into_sentences
+from automoderation.utils.timing import count_backend_error, timed_stage
+
+logger = get_logger(__name__)
+
+TOXICITY_LABEL = "toxicity"
+SENTENCE_STORE_NAME = "sentences_reused"
+WARM_UP_TEXT = "Warming up the toxicity model."
 
 
 class AbstractModel:
-    """Abstract class for AI Model"""
+    """Abstract class for AI Model
+
+    Child classes implement score_batch. The texts of concurrent evaluations
+    are scored together, and the resulting statuses are cached.
+    Long texts are scored chunk by chunk, and scoring stops at the first Failed chunk.
+    With incremental moderation, long texts are scored sentence by sentence instead, and
+    the sentences already scored in the previous version of a content are not scored again.
+    """
 
     toxic_thresholds: ToxicityThresholds
+    thresholds: ThresholdMatrix
+    batcher: MicroBatcher[str, AutoModerationStatus | None]
+    result_cache: ToxicityResultCache
+
+    def __init__(
+        self,
+        batch_size: int,
+        batch_max_wait: float,
+        cache_settings: ResultCacheSettings,
+        chunking: ChunkingSettings,
+        thresholds: dict[str, dict[AutoModerationStatus, float]] | None = None,
+        incremental: IncrementalModerationSettings | None = None,
+    ) -> "AbstractModel":
+        """Create the batcher and the cache of the model
+
+        Args:
+            batch_size (int): max number of texts scored at once
+            batch_max_wait (float): max time (in seconds) a text waits for its batch
+            cache_settings (ResultCacheSettings): settings of the status cache
+            chunking (ChunkingSettings): split of the long texts
+            thresholds (dict[str, dict[AutoModerationStatus, float]] | None): min score of each status,
+                for each label. Default to None -> toxic_thresholds on the toxicity label
+            incremental (IncrementalModerationSettings | None): re-moderation of edited texts. Default to None -> off
+        """
+        self.chunking = chunking
+        self.thresholds = ThresholdMatrix(thresholds or {TOXICITY_LABEL: self.toxic_thresholds.to_status_thresholds()})
+        self.batcher = MicroBatcher(self.status_batch, max_batch_size=batch_size, max_wait=batch_max_wait)
+        self.result_cache = ToxicityResultCache(cache_settings, self.version)
+        self.in_flight: SingleFlight[AutoModerationStatus | None] = SingleFlight("toxicity")
+        self.sentence_store = (
+            SentenceStatusStore(incremental, self.version) if incremental is not None and incremental.enabled else None
+        )
+
+    @property
+    def version(self) -> str:
+        """Identify the model and its thresholds, statuses of different versions are not comparable"""
+        return f"{self.__class__.__name__}[{self.thresholds}]"
 
     def match_score_with_status(self, score: int) -> AutoModerationStatus:
         """Return the risk associated with a score
@@ -21,11 +87,213 @@ class AbstractModel:
         return self.toxic_thresholds.match_score_to_status(score)
 
     @abstractmethod
-    def evaluate_content(self, text: str) -> AutoModerationStatus:
-        """Loops around all the given content.
-        Should fill the rejected_reasons for content that failed to pass
+    async def score_batch(self, texts: list[str]) -> list[dict[str, dict[str, float]]]:
+        """Score several texts at once
 
         Args:
-            text (str): will test toxicity on this text
+            texts (list[str]): texts to score
+
+        Returns:
+            list[dict[str, dict[str, float]]]: for each text, the score of each label for each part of the text
+
+        Raises:
+            ModelError: the model could not score the texts
         """
         raise NotImplementedError
+
+    async def warm_up(self) -> None:
+        """Score a synthetic text, to load the backend and open its connections before the first message
+
+        The text bypasses the batcher and the caches, its status is not stored
+
+        Raises:
+            ModelError: the model could not score the text
+        """
+        await self.score_batch([WARM_UP_TEXT])
+
+    def check_available(self) -> None:
+        """Refuse a text before it is queued for scoring, when the backend is known to be degraded
+
+        Raises:
+            ModelUnavailableError: the text must not be scored now
+        """
+
+    async def status_batch(self, texts: list[str]) -> list[AutoModerationStatus | None]:
+        """Score several texts at once, and evaluate the thresholds on all their scores at once
+
+        Returns:
+            list[AutoModerationStatus | None]: status of each text, None if the model did not score all its labels
+        """
+        batch_scores = await self.score_batch(texts)
+        if len(batch_scores) != len(texts):
+            message = f"{self} returned {len(batch_scores)} scores for {len(texts)} texts"
+            raise ModelError(message)
+        statuses = self.thresholds.evaluate_batch(batch_scores)
+        if unscored := statuses.count(None):
+            labels = ", ".join(self.thresholds.labels)
+            logger.warning("%s returned no score of %s for %s/%s texts", self, labels, unscored, len(texts))
+        return statuses
+
+    async def score_text(self, text: str) -> AutoModerationStatus | None:
+        """Score a text with the model and cache its status, None if the model returned no scores
+
+        Raises:
+            ModelError: the model could not score the text
+        """
+        try:
+            self.check_available()
+            with timed_stage("backend"):
+                status = await self.batcher.submit(text)
+        except ModelError as e:
+            count_backend_error(str(self), e.error)
+            raise
+        if status is not None:
+            await self.result_cache.set(text, status)
+        return status
+
+    async def evaluate_text(self, text: str) -> AutoModerationStatus:
+        """Return the toxicity status of a text, Need_Manual if the model could not score it
+
+        Concurrent evaluations of the same normalized text share one scoring
+
+        Args:
+            text (str): will test toxicity on this text
+        """
+        if (status := await self.result_cache.get(text)) is not None:
+            logger.debug("Toxicity of %s found in cache: %s", text, status)
+            return status
+        try:
+            status = await self.in_flight.do(self.result_cache.make_key(text), functools.partial(self.score_text, text))
+        except ModelUnavailableError as e:
+            logger.debug("%s is unavailable (%s), text set to Need_Manual", self, e)
+            return AutoModerationStatus.Need_Manual
+        except ModelTimeoutError:
+            logger.warning("Timed out in request to %s for text = %s. Set to Need_Manual", self, text)
+            return AutoModerationStatus.Need_Manual
+        except ModelError as e:
+            message = f"{self} failed to score text {text}. Set to Need_Manual"
+            logger.exception(message, exc_info=e)
+            return AutoModerationStatus.Need_Manual
+        return status if status is not None else AutoModerationStatus.Need_Manual
+
+    def split_text(self, text: str) -> list[str]:
+        """Split a text into the chunks scored by the model"""
+        if not self.chunking.enabled or len(text) <= self.chunking.max_chunk_chars:
+            return [text]
+        return split_into_chunks(text, self.chunking.max_chunk_chars) or [text]
+
+    def split_sentences(self, text: str) -> list[str]:
+        """Split a text into its sentences, the ones longer than a chunk are cut"""
+        max_chars = self.chunking.max_chunk_chars
+        sentences = [
+            part
+            for sentence in split_into_sentences(text)
+            for part in (split_into_chunks(sentence, max_chars) if len(sentence) > max_chars else [sentence])
+        ]
+        return sentences or [text]
+
+    async def evaluate_chunk(self, chunk: str, known: dict[str, AutoModerationStatus] | None) -> AutoModerationStatus:
+        """Return the known status of a chunk, or evaluate it"""
+        if known and (status := known.get(fingerprint(chunk))) is not None:
+            return status
+        return await self.evaluate_text(chunk)
+
+    async def evaluate_chunks(
+        self, chunks: list[str], known: dict[str, AutoModerationStatus] | None = None
+    ) -> TextToxicityRiskModel:
+        """Return the toxicity risk of each chunk
+
+        Chunks are scored chunking.batch_size at a time, the chunks following
+        a Failed batch are not scored and do not appear in the result.
+
+        Args:
+            chunks (list[str]): chunks of a text
+            known (dict[str, AutoModerationStatus] | None): status of already scored chunks, by fingerprint
+        """
+        step = max(1, self.chunking.batch_size)
+        risks = TextToxicityRiskModel(sentences=[])
+        for start in range(0, len(chunks), step):
+            batch = chunks[start : start + step]
+            statuses = await asyncio.gather(*(self.evaluate_chunk(chunk, known) for chunk in batch))
+            risks.sentences.extend(
+                SentenceStatusModel(sentence=chunk, risk=status) for chunk, status in zip(batch, statuses, strict=True)
+            )
+            if AutoModerationStatus.Failed in statuses:
+                logger.debug("Stopped scoring after %s/%s chunks, content is Failed", len(risks.sentences), len(chunks))
+                break
+        return risks
+
+    async def locate_risks(self, risks: TextToxicityRiskModel) -> TextToxicityRiskModel:
+        """Replace each chunk that did not pass by its sentences that did not pass
+
+        Only the sentences of these chunks are scored. A chunk whose sentences all pass alone
+        keeps its own risk, as a whole: the risk comes from their context.
+
+        Args:
+            risks (TextToxicityRiskModel): risk of each chunk of a text
+        """
+        located = TextToxicityRiskModel(sentences=[])
+        for chunk in risks.sentences:
+            sentences = self.split_sentences(chunk.sentence) if chunk.risk != AutoModerationStatus.Pass else []
+            if len(sentences) <= 1:
+                located.sentences.append(chunk)
+                continue
+            sentence_risks = await self.evaluate_chunks(sentences)
+            risky = [sentence for sentence in sentence_risks.sentences if sentence.risk != AutoModerationStatus.Pass]
+            located.sentences.extend(risky or [chunk])
+        return located
+
+    async def evaluate_sentences(self, text: str, content_key: str) -> TextToxicityRiskModel:
+        """Return the toxicity risk of each sentence of a text, scoring only the sentences
+        which were not in the previous version of the content
+
+        Args:
+            text (str): text of the content
+            content_key (str): identify the content across its versions
+        """
+        sentences = self.split_sentences(text)
+        known = await self.sentence_store.get(content_key)
+        risks = await self.evaluate_chunks(sentences, known)
+        fingerprints = [fingerprint(sentence.sentence) for sentence in risks.sentences]
+        reused = sum(sentence_fingerprint in known for sentence_fingerprint in fingerprints)
+        push_metric(CacheEventsTotal, [SENTENCE_STORE_NAME, CACHE_HIT], reused)
+        push_metric(CacheEventsTotal, [SENTENCE_STORE_NAME, CACHE_MISS], len(fingerprints) - reused)
+        logger.debug("%s/%s sentences of %s were already scored", reused, len(fingerprints), content_key)
+        # Sentences left unscored after a Failed batch keep their previous status,
+        # Need_Manual is not stored as it may come from a backend error
+        record = {
+            sentence_fingerprint: status
+            for sentence_fingerprint in map(fingerprint, sentences)
+            if (status := known.get(sentence_fingerprint)) is not None
+        }
+        record.update(
+            (sentence_fingerprint, sentence.risk)
+            for sentence_fingerprint, sentence in zip(fingerprints, risks.sentences, strict=True)
+            if sentence.risk != AutoModerationStatus.Need_Manual
+        )
+        await self.sentence_store.set(content_key, record)
+        return risks
+
+    async def evaluate_risks(self, content: MQContentModel, content_key: str | None = None) -> TextToxicityRiskModel:
+        """Return the toxicity risk of each chunk of a content
+
+        Args:
+            content (MQContentModel): will test toxicity on this content
+            content_key (str | None): identify the content across its versions, for incremental moderation.
+                Default to None -> the content is scored as a new one
+        """
+        text = content.value if isinstance(content.value, str) else str(content.value)
+        if self.sentence_store is not None and content_key is not None and len(text) > self.chunking.max_chunk_chars:
+            return await self.evaluate_sentences(text, content_key)
+        return await self.evaluate_chunks(self.split_text(text))
+
+    async def evaluate_content(self, content: MQContentModel) -> AutoModerationStatus:
+        """Return the toxicity status of a content, Need_Manual if the model could not score it
+
+        Args:
+            content (MQContentModel): will test toxicity on this content
+        """
+        return (await self.evaluate_risks(content)).status
+
+    def __str__(self) -> str:
+        return self.__class__.__name__
@@ -1,5 +1,7 @@
 """Abstract thresholds"""
 
+import functools
+from bisect import bisect_right
 from enum import Enum
 
 from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus
@@ -16,6 +18,25 @@ class ScoreToStatus:
         self.status = status
 
 
+class CompiledThresholds:
+    """Thresholds sorted once, a score is matched by binary search"""
+
+    def __init__(self, thresholds: dict[AutoModerationStatus, float]) -> "CompiledThresholds":
+        """Sort the thresholds
+
+        Args:
+            thresholds (dict[AutoModerationStatus, float]): min score of each status
+        """
+        ordered = sorted(thresholds.items(), key=lambda item: item[1])
+        self.bounds = [threshold for _, threshold in ordered]
+        self.statuses = [status for status, _ in ordered]
+
+    def match(self, score: float) -> AutoModerationStatus | None:
+        """Return the status of the highest threshold reached by score, None if it reaches none"""
+        index = bisect_right(self.bounds, score) - 1
+        return self.statuses[index] if index >= 0 else None
+
+
 class ToxicityThresholds(Enum):
     """Base class for toxicity thresholds"""
 
@@ -24,11 +45,18 @@ class ToxicityThresholds(Enum):
         """Convert the enum values to a dictionary"""
         return {threshold.name: threshold.value for threshold in cls}
 
+    @classmethod
+    def to_status_thresholds(cls) -> dict[AutoModerationStatus, float]:
+        """Return the min score of each status"""
+        return {threshold.value.status: threshold.value.threshold for threshold in cls}
+
     @classmethod
     def match_score_to_status(cls, score: int) -> "AutoModerationStatus| None":
         """Get the toxicity level based on a given value"""
-        sorted_risks = sorted(cls, key=lambda x: x.value.threshold, reverse=True)
-        for score_risk in sorted_risks:
-            if score >= score_risk.value.threshold:
-                return score_risk.value.status
-        return None
+        return compile_thresholds(cls).match(score)
+
+
+@functools.cache
+def compile_thresholds(thresholds: type[ToxicityThresholds]) -> CompiledThresholds:
+    """Compile the thresholds of an enum, once"""
+    return CompiledThresholds(thresholds.to_status_thresholds())
@@ -1,64 +1,224 @@
 """Detoxify model"""
 
+import asyncio
 import json
+import time
 
-import requests
-from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus, MQContentModel
-from msfwk.utils.config import read_config
+import httpx
+from msfwk.metrics import push_metric
 from msfwk.utils.logging import get_logger
 
-from automoderation.ai_models.abstract_model import AbstractModel
+from automoderation.ai_models.abstract_model import WARM_UP_TEXT, AbstractModel
 from automoderation.ai_models.detoxify.threshold import DetoxifyToxicityThresholds
-from automoderation.utils.status_utils import aggregate_status
+from automoderation.ai_models.exceptions import (
+    BackendOverloadedError,
+    CircuitOpenError,
+    ModelError,
+    ModelTimeoutError,
+)
+from automoderation.utils.http_client import get_http_client
+from automoderation.utils.metrics import HedgedRequestsTotal
+from automoderation.utils.resilience import CircuitBreaker, LatencyTracker
+from automoderation.utils.settings import get_settings
 
 logger = get_logger(__name__)
 
 RESPONSE_TEXT_NOT_AVAILABLE = "[Response text not available]"
 
 
+class DetoxifyResponseError(ModelError):
+    """The Detoxify service answered with an unexpected payload"""
+
+
 class DetoxifyModel(AbstractModel):
-    """Detoxify model"""
+    """Detoxify model
+
+    Texts of concurrent evaluations are grouped and sent in a single request:
+    POST {detoxify_service} {"texts": [...]} answering one score dict per text, in the same order.
+    Requests are spread over the endpoints, time out after a multiple of the observed latency,
+    and can be hedged on the next endpoint. Texts are set to Need_Manual without queuing
+    while too many batches are in flight, or while the circuit breaker is open.
+    """
 
     toxic_thresholds: DetoxifyToxicityThresholds = DetoxifyToxicityThresholds
 
-    def evaluate_content(self, content: MQContentModel) -> AutoModerationStatus:
-        """Return the toxicity risk for each sentence of a text
+    def __init__(self) -> "DetoxifyModel":
+        settings = get_settings()
+        self.endpoints = list(dict.fromkeys(filter(None, [settings.detoxify_service, *settings.detoxify_services])))
+        self.model_version = settings.detoxify_model_version
+        self.timeout = settings.detoxify_timeout
+        self.resilience = settings.detoxify_resilience
+        self.latencies = LatencyTracker(self.resilience.latency_window)
+        self.breaker = CircuitBreaker(
+            "detoxify", self.resilience.breaker_failure_threshold, self.resilience.breaker_recovery_timeout
+        )
+        self._requests = 0
+        super().__init__(
+            settings.detoxify_batch_size,
+            settings.detoxify_batch_max_wait_ms / 1000,
+            settings.toxicity_cache,
+            settings.toxicity_chunking,
+            settings.toxicity_thresholds,
+            settings.toxicity_incremental,
+        )
+
+    @property
+    def version(self) -> str:
+        """Identify the model served by Detoxify and the thresholds"""
+        return f"{super().version}{self.model_version}"
+
+    def check_available(self) -> None:
+        """Shed the texts while the circuit is open, or while max_in_flight_batches are in flight
+
+        Raises:
+            ModelUnavailableError: the text must not be queued
+        """
+        if self.resilience.breaker_enabled and self.breaker.rejecting:
+            message = f"Circuit of {self} is open"
+            raise CircuitOpenError(message)
+        max_in_flight = self.resilience.max_in_flight_batches
+        if max_in_flight and self.batcher.running >= max_in_flight:
+            message = f"{self.batcher.running} batches are in flight to {self}"
+            raise BackendOverloadedError(message)
+
+    def request_timeout(self) -> float:
+        """Timeout of a request: a multiple of the observed latency, at most detoxify_timeout"""
+        settings = self.resilience
+        if not settings.adaptive_timeout or len(self.latencies) < settings.min_samples:
+            return self.timeout
+        latency = self.latencies.percentile(settings.timeout_percentile)
+        return min(self.timeout, max(settings.min_timeout, settings.timeout_multiplier * latency))
+
+    def hedge_delay(self) -> float | None:
+        """Time to wait for a request before sending a second one, None to never hedge"""
+        settings = self.resilience
+        if not settings.hedging or len(self.latencies) < settings.min_samples:
+            return None
+        return max(settings.min_hedge_delay, self.latencies.percentile(settings.hedge_percentile))
+
+    async def score_batch(self, texts: list[str]) -> list[dict[str, dict[str, float]]]:
+        """Ask the Detoxify service for the scores of several texts at once
+
+        Args:
+            texts (list[str]): texts to score
+
+        Returns:
+            list[dict[str, dict[str, float]]]: the Detoxify scores of each text
+        """
+        if not self.resilience.breaker_enabled:
+            return await self.request_scores(texts)
+        if not self.breaker.allow():
+            message = f"Circuit of {self} is {self.breaker.state.value}"
+            raise CircuitOpenError(message)
+        try:
+            toxicity_scores = await self.request_scores(texts)
+        except ModelError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return toxicity_scores
+
+    async def warm_up(self) -> None:
+        """Send a synthetic text to every endpoint, to open a pooled connection to each of them
+
+        Raises:
+            ModelError: no endpoint answered
+        """
+        if not self.endpoints:
+            message = "No detoxify_service configured"
+            raise ModelError(message)
+        results = await asyncio.gather(
+            *(self.post(endpoint, [WARM_UP_TEXT], self.timeout) for endpoint in self.endpoints), return_exceptions=True
+        )
+        for endpoint, result in zip(self.endpoints, results, strict=True):
+            if isinstance(result, BaseException):
+                logger.warning("Detoxify (%s) failed to warm up: %s", endpoint, result)
+        if all(isinstance(result, BaseException) for result in results):
+            message = f"None of the {len(self.endpoints)} Detoxify endpoints answered"
+            raise ModelError(message)
+
+    async def request_scores(self, texts: list[str]) -> list[dict[str, dict[str, float]]]:
+        """Send the request to the next endpoint, and hedge it on the following one if it is slow
+
+        The latency of a hedged request cancelled before answering is not known, only the one
+        of a cancelled primary request is recorded, as the time it ran: a lower bound.
+        """
+        if not self.endpoints:
+            message = "No detoxify_service configured"
+            raise ModelError(message)
+        timeout = self.request_timeout()
+        first = self.endpoints[self._requests % len(self.endpoints)]
+        self._requests += 1
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self.post(first, texts, timeout)
+        start = time.perf_counter()
+        primary = asyncio.create_task(self.post(first, texts, timeout))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+            second = self.endpoints[self._requests % len(self.endpoints)]
+            logger.debug("Detoxify (%s) is slower than %.3fs, hedging on %s", first, delay, second)
+            hedge = asyncio.create_task(self.post(second, texts, timeout))
+            return await self.first_answer(primary, hedge)
+        finally:
+            if not primary.done():
+                # A primary request cancelled for its hedge took at least this long,
+                # leaving it out of the latencies would bias their percentiles low
+                self.latencies.add(time.perf_counter() - start)
+            primary.cancel()
+
+    async def first_answer(self, primary: asyncio.Task, hedge: asyncio.Task) -> list[dict[str, dict[str, float]]]:
+        """Return the first successful answer of two requests, or the error of the primary one if both fail"""
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        push_metric(HedgedRequestsTotal, [str(self), "primary" if task is primary else "hedge"])
+                        return task.result()
+            push_metric(HedgedRequestsTotal, [str(self), "none"])
+            raise primary.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def post(self, endpoint: str, texts: list[str], timeout: float) -> list[dict[str, dict[str, float]]]:
+        """Ask a Detoxify endpoint for the scores of the texts, and record its latency
 
         Args:
-            content (MQContentModel): will test toxicity on this content
+            endpoint (str): url of the Detoxify service
+            texts (list[str]): texts to score
+            timeout (float): timeout of the request, in seconds
         """
-        text = content.value
-        response_text = None
+        logger.debug("Asking Detoxify API (%s) for %s texts", endpoint, len(texts))
+        start = time.perf_counter()
         try:
-            detoxify_service = read_config().get("services", {}).get("automoderation", {}).get("detoxify_service", "")
-            logger.debug("Asking Detoxify API (%s) for %s", detoxify_service, text)
-            response = requests.get(f"{detoxify_service}?text={text}", timeout=30)
+            response = await get_http_client().post(endpoint, json={"texts": texts}, timeout=timeout)
             response.raise_for_status()
+        except httpx.TimeoutException as e:
+            # A timed out request took at least the timeout, so the next timeouts can grow back
+            self.latencies.add(time.perf_counter() - start)
+            message = f"Request to detoxify ({endpoint}) timed out after {timeout:.3f}s"
+            raise ModelTimeoutError(message) from e
+        except httpx.HTTPStatusError as e:
+            message = f"Request to detoxify failed | response_text = {e.response.text}"
+            raise ModelError(message) from e
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
+            message = f"Request to detoxify failed | response_text = {RESPONSE_TEXT_NOT_AVAILABLE}"
+            raise ModelError(message) from e
+        self.latencies.add(time.perf_counter() - start)
+        try:
             toxicity_scores = response.json()
-            if toxicity_scores == {}:
-                return AutoModerationStatus.Need_Manual
-            # convert detoxify scores intp automod status
-            all_status = [self.match_score_with_status(score["toxicity"]) for score in toxicity_scores.values()]
-            logger.debug(all_status)
-            return aggregate_status(all_status)
-        except requests.exceptions.Timeout:
-            if response_text is None:
-                response_text = RESPONSE_TEXT_NOT_AVAILABLE
-            logger.warning(
-                "Timed out in request to detoxify for text = %s | response_text = %s. Set to Need_Manual",
-                text,
-                response_text,
-            )
-            return AutoModerationStatus.Need_Manual
-        except requests.exceptions.RequestException as e:
-            if response_text is None:
-                response_text = RESPONSE_TEXT_NOT_AVAILABLE
-            message = f"Request to detoxify failed for text {text} | response_text = {response_text}"
-            logger.exception(message, exc_info=e)
-            return AutoModerationStatus.Need_Manual
         except json.JSONDecodeError as e:
-            if response_text is None:
-                response_text = RESPONSE_TEXT_NOT_AVAILABLE
-            message = f"Failed to decode json for result of http on {text} | response_text = {response_text}"
-            logger.exception(message, exc_info=e)
-            return AutoModerationStatus.Need_Manual
+            message = f"Failed to decode json | response_text = {response.text or RESPONSE_TEXT_NOT_AVAILABLE}"
+            raise DetoxifyResponseError(message) from e
+        if not isinstance(toxicity_scores, list):
+            message = f"Expected a list of scores | response_text = {response.text}"
+            raise DetoxifyResponseError(message)
+        return toxicity_scores
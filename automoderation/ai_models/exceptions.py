@@ -0,0 +1,32 @@
+"""AI models exceptions"""
+
+
+class ModelError(Exception):
+    """The model could not score a text"""
+
+    # Label of the backend errors metric
+    error = "error"
+
+
+class ModelTimeoutError(ModelError):
+    """The model did not answer in time"""
+
+    error = "timeout"
+
+
+class ModelUnavailableError(ModelError):
+    """The model was not asked to score a text, to protect a degraded backend"""
+
+    error = "unavailable"
+
+
+class CircuitOpenError(ModelUnavailableError):
+    """The backend failed repeatedly, it is not called until its circuit breaker recovers"""
+
+    error = "circuit_open"
+
+
+class BackendOverloadedError(ModelUnavailableError):
+    """Too many requests are in flight to the backend, the text is shed instead of queued"""
+
+    error = "overloaded"
@@ -0,0 +1,19 @@
+"""Model factory"""
+
+from automoderation.ai_models.abstract_model import AbstractModel
+from automoderation.utils.settings import ModelBackend, get_settings
+
+
+def create_toxicity_model() -> AbstractModel:
+    """Create the toxicity model of the configured backend
+
+    The local backend is only imported when selected, its dependencies are optional.
+    """
+    if get_settings().model_backend == ModelBackend.Local:
+        from automoderation.ai_models.onnx.model import OnnxToxicityModel
+
+        return OnnxToxicityModel()
+
+    from automoderation.ai_models.detoxify.model import DetoxifyModel
+
+    return DetoxifyModel()
@@ -0,0 +1 @@
+"""ONNX"""
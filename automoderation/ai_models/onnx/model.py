@@ -0,0 +1,118 @@
+"""ONNX model"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import onnxruntime
+from msfwk.utils.logging import get_logger
+from tokenizers import Tokenizer
+
+from automoderation.ai_models.abstract_model import AbstractModel
+from automoderation.ai_models.detoxify.threshold import DetoxifyToxicityThresholds
+from automoderation.ai_models.exceptions import ModelError
+from automoderation.utils.settings import LocalModelSettings, get_settings
+
+logger = get_logger(__name__)
+
+MODEL_INPUTS = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def load_session(settings: LocalModelSettings) -> onnxruntime.InferenceSession:
+    """Load the model for CPU inference
+
+    Weights stored as ONNX external data are memory mapped by ONNX Runtime.
+
+    Args:
+        settings (LocalModelSettings): path and threads of the model
+    """
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = settings.intra_op_threads
+    return onnxruntime.InferenceSession(settings.model_path, options, providers=["CPUExecutionProvider"])
+
+
+def load_tokenizer(settings: LocalModelSettings) -> Tokenizer:
+    """Load the tokenizer, padding and truncating to the model input size
+
+    Args:
+        settings (LocalModelSettings): path and max length of the tokenizer
+    """
+    tokenizer = Tokenizer.from_file(settings.tokenizer_path)
+    tokenizer.enable_truncation(settings.max_length)
+    tokenizer.enable_padding()
+    return tokenizer
+
+
+class OnnxToxicityModel(AbstractModel):
+    """Toxicity classifier running in process on CPU, with ONNX Runtime
+
+    The model (Detoxify exported to ONNX for instance) outputs one logit per label.
+    Its session is shared by the inference threads, and the texts of concurrent
+    evaluations are scored in one forward pass.
+    """
+
+    toxic_thresholds: DetoxifyToxicityThresholds = DetoxifyToxicityThresholds
+
+    def __init__(self) -> "OnnxToxicityModel":
+        settings = get_settings()
+        self.settings = settings.local_model
+        self.session = load_session(self.settings)
+        self.tokenizer = load_tokenizer(self.settings)
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.executor = ThreadPoolExecutor(self.settings.inference_threads, thread_name_prefix="onnx-inference")
+        logger.info("Loaded local toxicity model %s (inputs: %s)", self.settings.model_path, self.input_names)
+        super().__init__(
+            self.settings.batch_size,
+            self.settings.batch_max_wait_ms / 1000,
+            settings.toxicity_cache,
+            settings.toxicity_chunking,
+            settings.toxicity_thresholds,
+            settings.toxicity_incremental,
+        )
+
+    @property
+    def version(self) -> str:
+        """Identify the model file and the thresholds"""
+        return f"{super().version}{self.settings.model_version or Path(self.settings.model_path).name}"
+
+    def infer(self, texts: list[str]) -> list[dict[str, dict[str, float]]]:
+        """Run one forward pass over the texts
+
+        Args:
+            texts (list[str]): texts to score
+
+        Returns:
+            list[dict[str, dict[str, float]]]: the score of each label, for each text
+        """
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        logits = self.session.run(None, {name: inputs[name] for name in self.input_names if name in MODEL_INPUTS})[0]
+        if logits.shape != (len(texts), len(self.settings.labels)):
+            message = f"Expected scores of shape {(len(texts), len(self.settings.labels))}, got {logits.shape}"
+            raise ModelError(message)
+        scores = 1 / (1 + np.exp(-logits)) if self.settings.apply_sigmoid else logits
+        return [
+            {text: dict(zip(self.settings.labels, row.tolist(), strict=True))}
+            for text, row in zip(texts, scores, strict=True)
+        ]
+
+    async def score_batch(self, texts: list[str]) -> list[dict[str, dict[str, float]]]:
+        """Score the texts in an inference thread
+
+        Args:
+            texts (list[str]): texts to score
+        """
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.infer, texts)
+        except ModelError:
+            raise
+        except Exception as e:
+            # The errors of ONNX Runtime (Fail, InvalidArgument, RuntimeException...) only subclass Exception
+            message = f"Local inference failed on {len(texts)} texts"
+            raise ModelError(message) from e
@@ -0,0 +1,80 @@
+"""Toxicity result cache"""
+
+import hashlib
+
+from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus
+from msfwk.metrics import push_metric
+from msfwk.utils.logging import get_logger
+
+from automoderation.utils.cache import CACHE_HIT, CACHE_MISS, LocalCache
+from automoderation.utils.metrics import CacheEventsTotal
+from automoderation.utils.settings import ResultCacheSettings
+from automoderation.utils.text_utils import normalize_text
+
+logger = get_logger(__name__)
+
+LOCAL_CACHE_NAME = "toxicity"
+REDIS_CACHE_NAME = "toxicity_redis"
+
+
+class ToxicityResultCache:
+    """Cache the status of already evaluated texts
+
+    Keys are a hash of the normalized text and of the model version,
+    so changing the model or its thresholds never reuses an old status.
+    An in-process LRU is checked first, then the optional shared redis tier.
+    """
+
+    def __init__(self, settings: ResultCacheSettings, version: str) -> "ToxicityResultCache":
+        """Create the cache
+
+        Args:
+            settings (ResultCacheSettings): sizes and time to live
+            version (str): version of the model producing the cached status
+        """
+        self.enabled = settings.enabled
+        self.version = version
+        self.local = LocalCache(LOCAL_CACHE_NAME, settings.maxsize, settings.ttl)
+        self.redis = None
+        if settings.redis_host:
+            # The redis client is only imported when a redis tier is configured, it is slow to import
+            from msfwk.redis import RedisClient
+
+            self.redis = RedisClient(
+                settings.redis_host, str(settings.redis_port), ttl=int(settings.ttl), db=settings.redis_db
+            )
+
+    def make_key(self, text: str) -> str:
+        """Return the cache key of a text"""
+        digest = hashlib.sha256(f"{self.version}\0{normalize_text(text)}".encode()).hexdigest()
+        return f"automoderation:toxicity:{digest}"
+
+    async def get(self, text: str) -> AutoModerationStatus | None:
+        """Return the cached status of a text, None if unknown"""
+        if not self.enabled:
+            return None
+        key = self.make_key(text)
+        if (status := self.local.get(key)) is not None:
+            return status
+        if self.redis is None:
+            return None
+        value = await self.redis.get(key)
+        push_metric(CacheEventsTotal, [REDIS_CACHE_NAME, CACHE_MISS if value is None else CACHE_HIT])
+        if value is None:
+            return None
+        try:
+            status = AutoModerationStatus(value.decode() if isinstance(value, bytes) else value)
+        except ValueError:
+            logger.warning("Ignoring unexpected cached toxicity status %s", value)
+            return None
+        self.local.set(key, status)
+        return status
+
+    async def set(self, text: str, status: AutoModerationStatus) -> None:
+        """Cache the status of a text"""
+        if not self.enabled:
+            return
+        key = self.make_key(text)
+        self.local.set(key, status)
+        if self.redis is not None:
+            await self.redis.set(key, status.value)
@@ -0,0 +1,75 @@
+"""Sentence status store"""
+
+import hashlib
+import json
+
+from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus
+from msfwk.utils.logging import get_logger
+
+from automoderation.utils.cache import LocalCache
+from automoderation.utils.settings import IncrementalModerationSettings
+from automoderation.utils.text_utils import normalize_text
+
+logger = get_logger(__name__)
+
+LOCAL_STORE_NAME = "sentences"
+
+
+def fingerprint(sentence: str) -> str:
+    """Return the fingerprint of a sentence, equal for sentences differing only by unicode forms or whitespaces"""
+    return hashlib.blake2b(normalize_text(sentence).encode(), digest_size=8).hexdigest()
+
+
+class SentenceStatusStore:
+    """Status of the sentences of the last moderated version of each content
+
+    A record maps the fingerprint of each sentence of a content to its status. It is replaced
+    at each moderation of the content, so the sentences removed by an edit are forgotten.
+    Keys include the model version like ToxicityResultCache keys, an in-process LRU
+    is checked first, then the optional shared redis tier.
+    """
+
+    def __init__(self, settings: IncrementalModerationSettings, version: str) -> "SentenceStatusStore":
+        """Create the store
+
+        Args:
+            settings (IncrementalModerationSettings): sizes and time to live
+            version (str): version of the model producing the stored status
+        """
+        self.version = version
+        self.local = LocalCache(LOCAL_STORE_NAME, settings.maxsize, settings.ttl)
+        self.redis = None
+        if settings.redis_host:
+            # The redis client is only imported when a redis tier is configured, it is slow to import
+            from msfwk.redis import RedisClient
+
+            self.redis = RedisClient(
+                settings.redis_host, str(settings.redis_port), ttl=int(settings.ttl), db=settings.redis_db
+            )
+
+    def make_key(self, content_key: str) -> str:
+        """Return the store key of a content"""
+        digest = hashlib.sha256(f"{self.version}\0{content_key}".encode()).hexdigest()
+        return f"automoderation:sentences:{digest}"
+
+    async def get(self, content_key: str) -> dict[str, AutoModerationStatus]:
+        """Return the status of each sentence fingerprint of the last version of a content, empty if unknown"""
+        key = self.make_key(content_key)
+        if (record := self.local.get(key)) is not None:
+            return record
+        if self.redis is None or (value := await self.redis.get(key)) is None:
+            return {}
+        try:
+            record = {sentence: AutoModerationStatus(status) for sentence, status in json.loads(value).items()}
+        except (ValueError, AttributeError):
+            logger.warning("Ignoring unexpected sentence statuses %s", value)
+            return {}
+        self.local.set(key, record)
+        return record
+
+    async def set(self, content_key: str, record: dict[str, AutoModerationStatus]) -> None:
+        """Replace the record of a content"""
+        key = self.make_key(content_key)
+        self.local.set(key, record)
+        if self.redis is not None:
+            await self.redis.set(key, json.dumps({sentence: status.value for sentence, status in record.items()}))
@@ -0,0 +1,96 @@
+"""Threshold matrix"""
+
+import math
+
+import numpy as np
+from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus
+
+# Statuses a score can reach, from the least to the most important, see aggregate_status
+SEVERITIES = [AutoModerationStatus.Pass, AutoModerationStatus.Need_Manual, AutoModerationStatus.Failed]
+SEVERITY = {status: severity for severity, status in enumerate(SEVERITIES)}
+
+
+class ThresholdMatrix:
+    """Thresholds of several labels, evaluated at once on the scores of a batch of texts
+
+    A text reaches the most important status reached by one of its parts on one of the labels.
+    Below every threshold of a label, a part Pass for this label. A part without a numeric score
+    for one of the labels cannot be evaluated, and its text gets no status.
+    """
+
+    def __init__(self, thresholds: dict[str, dict[AutoModerationStatus, float]]) -> "ThresholdMatrix":
+        """Compile the thresholds into sorted arrays
+
+        Args:
+            thresholds (dict[str, dict[AutoModerationStatus, float]]): min score of each status, for each label
+        """
+        self.labels = list(thresholds)
+        width = max((len(statuses) for statuses in thresholds.values()), default=0)
+        # bounds[label, i]: i-th smallest threshold of label, padded with unreachable thresholds
+        self.bounds = np.full((len(self.labels), width), np.inf)
+        # severities[label, n]: severity of a score reaching the n smallest thresholds of label
+        self.severities = np.zeros((len(self.labels), width + 1), dtype=np.int8)
+        for row, label in enumerate(self.labels):
+            ordered = sorted(thresholds[label].items(), key=lambda item: item[1])
+            self.bounds[row, : len(ordered)] = [threshold for _, threshold in ordered]
+            for count, (status, _) in enumerate(ordered, start=1):
+                self.severities[row, count:] = SEVERITY.get(status, 0)
+        self.thresholds = thresholds
+
+    def __str__(self) -> str:
+        return ";".join(
+            f"{label}:" + ",".join(f"{status.value}>={threshold}" for status, threshold in statuses.items())
+            for label, statuses in self.thresholds.items()
+        )
+
+    def to_matrix(self, parts_scores: list[dict[str, float]]) -> np.ndarray:
+        """Scores of each part (rows) for each label (columns), NaN when a label has no numeric score"""
+        return np.array(
+            [[to_score(scores.get(label)) for label in self.labels] for scores in parts_scores], dtype=np.float64
+        ).reshape(len(parts_scores), len(self.labels))
+
+    def evaluate(self, scores: np.ndarray) -> np.ndarray:
+        """Return the severity of each part, its most important status on all the labels
+
+        Args:
+            scores (np.ndarray): scores of each part (rows) for each label (columns)
+        """
+        if scores.size == 0:
+            return np.zeros(scores.shape[0], dtype=np.int8)
+        # Number of thresholds reached by each score, NaN reaches none
+        reached = (scores[:, :, np.newaxis] >= self.bounds[np.newaxis, :, :]).sum(axis=2)
+        return self.severities[np.arange(len(self.labels))[np.newaxis, :], reached].max(axis=1)
+
+    def evaluate_batch(self, batch_scores: list[dict[str, dict[str, float]]]) -> list[AutoModerationStatus | None]:
+        """Return the status of each text of a batch, None for a text without scores or missing the score of a label
+
+        Args:
+            batch_scores (list[dict[str, dict[str, float]]]): for each text, the score of each label for each part
+        """
+        parts = [
+            list(text_scores.values())
+            if isinstance(text_scores, dict) and all(isinstance(part, dict) for part in text_scores.values())
+            else []
+            for text_scores in batch_scores
+        ]
+        counts = np.array([len(text_parts) for text_parts in parts])
+        matrix = self.to_matrix([part for text_parts in parts for part in text_parts])
+        severities = self.evaluate(matrix)
+        missing = np.isnan(matrix).any(axis=1)
+        statuses: list[AutoModerationStatus | None] = [None] * len(parts)
+        if severities.size:
+            offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            scored = np.flatnonzero(counts)
+            text_severities = np.maximum.reduceat(severities, offsets[scored])
+            text_missing = np.logical_or.reduceat(missing, offsets[scored])
+            for index, severity, incomplete in zip(scored, text_severities, text_missing, strict=True):
+                # Never Pass a text on a missing score: a renamed or null label must not accept the content
+                statuses[index] = None if incomplete else SEVERITIES[severity]
+        return statuses
+
+
+def to_score(value: object) -> float:
+    """Return a score as a float, NaN if it is missing or not a number"""
+    if isinstance(value, bool) or not isinstance(value, int | float):
+        return math.nan
+    return float(value)
@@ -7,8 +7,9 @@ from msfwk.utils.config import add_reliability_check
 from msfwk.utils.logging import get_logger
 
 from automoderation.modules.moderation_module import add_module, start_modules, stop_modules
-from automoderation.modules.text_toxicity import TextToxicityModule
-from automoderation.modules.url_validation import UrlValidationModule
+from automoderation.modules.registry import create_modules
+from automoderation.utils.http_client import close_http_client, start_http_client
+from automoderation.utils.settings import load_settings
 
 logger = get_logger("application")
 
@@ -23,11 +24,15 @@ async def init(config: dict) -> bool:
     logger.info("Initialising Automoderation ...")
     load_succeded = load_default_rabbitmq_config()
     current_config.set(config)
+    settings = load_settings(config)
+    await start_http_client(settings.http_client)
     if load_succeded:
-        add_module(TextToxicityModule())
-        add_module(UrlValidationModule())
+        for module in create_modules():
+            add_module(module)
         logger.info("added all automoderation modules")
+        # /health reports the service ready once init returns, so only after the modules warmed up
         await start_modules()
+        logger.info("Automoderation modules warmed up and started")
     else:
         logger.error("Failed to load rabbitmq config")
     add_reliability_check("rabbitmq", config.get("rabbitmq", {}).get("mq_host"))
@@ -38,6 +43,7 @@ async def destroy(_: dict) -> bool:
     """Destroy"""
     logger.info("Destroying Automoderation ...")
     await stop_modules()
+    await close_http_client()
     return True
 
 
@@ -3,6 +3,8 @@
 from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus
 from pydantic import BaseModel
 
+from automoderation.utils.status_utils import aggregate_status
+
 
 class SentenceStatusModel(BaseModel):
     """Associate a sentence with a risk"""
@@ -15,3 +17,8 @@ class TextToxicityRiskModel(BaseModel):
     """All the sentence of a text, associated with their toxicity risk"""
 
     sentences: list[SentenceStatusModel]
+
+    @property
+    def status(self) -> AutoModerationStatus:
+        """The most important risk of the sentences"""
+        return aggregate_status([sentence.risk for sentence in self.sentences])
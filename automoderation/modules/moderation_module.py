@@ -1,7 +1,14 @@
 """Moderation module"""
 
 import asyncio
+import functools
+import inspect
+import time
 from abc import abstractmethod
+from collections.abc import Callable
+from concurrent.futures import Executor
+from contextvars import ContextVar
+from typing import TypeVar
 
 import aio_pika
 from msfwk.context import current_transaction
@@ -14,29 +21,70 @@ from msfwk.desp.rabbitmq.mq_message import (
     MQContentType,
     decode_consume_message,
 )
-from msfwk.mqclient import RabbitMQConfig, consume_mq_queue_async, send_mq_message
+from msfwk.metrics import push_metric
+from msfwk.mqclient import RabbitMQConfig, send_mq_message
 from msfwk.utils.logging import get_logger
 
+from automoderation.utils.concurrency import create_executor
+from automoderation.utils.lazy_message import decode_lazy_message
+from automoderation.utils.metrics import ModuleContentsTotal, ModuleInFlight, ModuleMessagesTotal
+from automoderation.utils.mq_consumer import consume_queue
+from automoderation.utils.settings import STOP_MARGIN, PipelineMode, get_settings
+from automoderation.utils.timing import MessageTiming, current_module, current_timing, timed_stage
+
 logger = get_logger(__name__)
 
+T = TypeVar("T")
+
 END_OF_AUTO_QUEUE = RabbitMQConfig.HANDLING_MODERATION_QUEUE
 
+SKIPPED_HISTORY = "Automoderation [{}]: skipped, verdict is final"
+NO_MODULE_HISTORY = "Automoderation [{}]: {} (no module to run it)"
+
+# RabbitMQConfig attribute of the routing key to the queue of each module, the config is loaded at startup
+QUEUE_RKEY_ATTRIBUTES: dict[AutoModerationType, str] = {
+    AutoModerationType.Text_Toxicity: "TO_AUTO_TEXT_TOXICITY_RKEY",
+    AutoModerationType.Url_Validation: "TO_AUTO_URL_VALIDATION_RKEY",
+}
+
 module_holder: dict[AutoModerationType, "ModerationModule"] = {}
 
+# Content id of the message being moderated, identifies a content across its edits
+current_content_id: ContextVar[str | None] = ContextVar("current_content_id", default=None)
+
+
+def get_following_moderation_types(
+    mq_message: DespMQMessage, automoderation_type: AutoModerationType
+) -> list[AutoModerationType]:
+    """Returns the auto moderations routed after the one with the given moderation_type"""
+    types = [moderation.moderation_type for moderation in mq_message.auto_mod_routing]
+    return types[types.index(automoderation_type) + 1 :] if automoderation_type in types else []
+
+
+def is_verdict_final(mq_message: DespMQMessage) -> bool:
+    """A message is rejected as soon as one auto moderation Failed, whatever the other ones return"""
+    return any(auto_mod.status == AutoModerationStatus.Failed for auto_mod in mq_message.auto_mod_routing)
+
+
+def skip_remaining_moderations(mq_message: DespMQMessage, automoderation_type: AutoModerationType) -> None:
+    """Record in the history that the auto moderations following automoderation_type will not run
 
-def get_next_moderation_queue(mq_message: DespMQMessage, automoderation_type: AutoModerationType) -> str | None:
-    """Returns the next item in the list after the one with the given moderation_type.
-    If the given type is not found or is the last item, returns None.
+    Their status stays Pending
     """
-    auto_moderations = mq_message.auto_mod_routing
-    for i, moderation in enumerate(auto_moderations):
-        if moderation.moderation_type == automoderation_type:
-            return (
-                get_queue_rkey_from_module_type(auto_moderations[i + 1].moderation_type)
-                if i + 1 < len(auto_moderations)
-                else None
-            )
-    return None
+    following_types = get_following_moderation_types(mq_message, automoderation_type)
+    for moderation in mq_message.auto_mod_routing:
+        if moderation.moderation_type in following_types and moderation.status == AutoModerationStatus.Pending:
+            mq_message.history.append(SKIPPED_HISTORY.format(moderation.moderation_type.value))
+
+
+def record_missing_module(mq_message: DespMQMessage, moderation_type: AutoModerationType) -> None:
+    """Set Need_Manual an auto moderation without a module to run it, the message is never Accepted without it"""
+    logger.warning("No %s module to moderate %s", moderation_type.value, mq_message.id)
+    status = AutoModerationStatus.Need_Manual
+    mq_message.history.append(NO_MODULE_HISTORY.format(moderation_type.value, status))
+    for moderation in mq_message.auto_mod_routing:
+        if moderation.moderation_type == moderation_type:
+            moderation.status = status
 
 
 def automod_to_moderation_status(mq_message: DespMQMessage) -> None:
@@ -44,14 +92,14 @@ def automod_to_moderation_status(mq_message: DespMQMessage) -> None:
 
     Rejected if one or more auto_mod_routing Failed
     Accepted if each auto_mod in auto_mod_routing Pass
-    Manual_Pending otherwise
+    Manual_Pending otherwise, a Pending auto_mod did not run
     """
     all_status = [auto_mod.status for auto_mod in mq_message.auto_mod_routing]
     if AutoModerationStatus.Failed in all_status:
         mq_message.status = ModerationEventStatus.Rejected
         return
 
-    if AutoModerationStatus.Need_Manual not in all_status:
+    if all(status == AutoModerationStatus.Pass for status in all_status):
         mq_message.status = ModerationEventStatus.Accepted
         return
 
@@ -62,6 +110,18 @@ def automod_to_moderation_status(mq_message: DespMQMessage) -> None:
     mq_message.status = ModerationEventStatus.Manual_Pending
 
 
+async def send_to_handling(mq_message: DespMQMessage) -> None:
+    """Set the final status of the mq_message, and send it to handling
+
+    Args:
+        mq_message (DespMQMessage): __desc__
+    """
+    automod_to_moderation_status(mq_message)
+    exchange = RabbitMQConfig.MODERATION_EXCHANGE
+    logger.info("Send to next queue: %s on exchange %s", RabbitMQConfig.TO_HANDLING_RKEY, exchange)
+    await send_mq_message(mq_message, exchange, RabbitMQConfig.TO_HANDLING_RKEY)
+
+
 class ModerationModule:
     """One module of moderation"""
 
@@ -70,62 +130,311 @@ class ModerationModule:
     consume_queue: str
     queue_rkey: str
     task: asyncio.Task | None = None
+    stopping: asyncio.Event | None = None
+    limit: asyncio.Semaphore | None = None
+    executor: Executor | None = None
+
+    @property
+    def fail_fast(self) -> bool:
+        """Stop the moderation of a message as soon as its verdict is final (see is_verdict_final)"""
+        return get_settings().fail_fast
+
+    @property
+    def pipeline_mode(self) -> PipelineMode:
+        """How the message goes to the following modules"""
+        return get_settings().pipeline_mode
 
     @abstractmethod
-    def analyze(self, content_list: list[MQContentModel]) -> AutoModerationStatus:
-        """Analyze content"""
+    async def analyze(self, content_list: list[MQContentModel]) -> AutoModerationStatus:
+        """Analyze content
+
+        Legacy modules may still implement a synchronous analyze, see run_analyze
+        """
+
+    async def run_analyze(self, content_list: list[MQContentModel]) -> AutoModerationStatus:
+        """Run self.analyze without blocking the event loop
+
+        A synchronous analyze is delegated to the default thread pool,
+        so a slow module cannot stall the other consumers of the process.
+
+        Args:
+            content_list (list[MQContentModel]): content to analyze
+        """
+        if inspect.iscoroutinefunction(self.analyze):
+            return await self.analyze(content_list)
+        return await asyncio.to_thread(self.analyze, content_list)
+
+    async def run_in_worker(self, func: Callable[..., T], *args: object) -> T:
+        """Run CPU bound preprocessing in the worker pool of the module, or the default thread pool
+
+        With a process pool, func and args must be picklable
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def moderate(self, mq_message: DespMQMessage) -> AutoModerationStatus:
+        """Analyze the contents of a message handled by this module
+
+        Args:
+            mq_message (DespMQMessage): message to moderate
+        """
+        module = self.automoderation_type.value
+        content_list = mq_message.content.data_by_type.get(self.content_type)
+        logger.info("%s module Start analysing %s content", module, mq_message.id)
+        token = current_module.set(module)
+        content_id_token = current_content_id.set(mq_message.content_id or None)
+        push_metric(ModuleInFlight, [module], 1)
+        try:
+            with timed_stage("analyze"):
+                status = await self.run_analyze(content_list)
+        finally:
+            push_metric(ModuleInFlight, [module], -1)
+            current_content_id.reset(content_id_token)
+            current_module.reset(token)
+        push_metric(ModuleMessagesTotal, [module, status.value])
+        push_metric(ModuleContentsTotal, [module], len(content_list or []))
+        logger.info("%s module Finished analysing %s content: %s", module, mq_message.id, status.value)
+        return status
+
+    def record_status(self, mq_message: DespMQMessage, status: AutoModerationStatus, details: str = "") -> None:
+        """Record the status of this module in the message, and in its history
+
+        Args:
+            mq_message (DespMQMessage): moderated message
+            status (AutoModerationStatus): status of this module
+            details (str): added to the history entry
+        """
+        mq_message.history.append(f"Automoderation [{self.automoderation_type.value}]: {status}{details}")
+        self.set_current_module_status(mq_message, status)
+
+    async def process(self, mq_message: DespMQMessage) -> AutoModerationStatus:
+        """Analyze the contents of a message, and record the status of this module in it
+
+        Args:
+            mq_message (DespMQMessage): message to moderate
+        """
+        status = await self.moderate(mq_message)
+        self.record_status(mq_message, status)
+        return status
+
+    async def process_following_modules(self, mq_message: DespMQMessage) -> None:
+        """Run in process the modules routed after this one (fused pipeline)
+
+        Auto moderations without a registered module are Need_Manual, see record_missing_module
+
+        Args:
+            mq_message (DespMQMessage): message to moderate
+        """
+        last_type = self.automoderation_type
+        for moderation_type in get_following_moderation_types(mq_message, self.automoderation_type):
+            if self.fail_fast and is_verdict_final(mq_message):
+                logger.debug("Verdict of %s is final", mq_message.id)
+                skip_remaining_moderations(mq_message, last_type)
+                return
+            if (module := module_holder.get(moderation_type)) is None:
+                record_missing_module(mq_message, moderation_type)
+                continue
+            await module.process(mq_message)
+            last_type = moderation_type
+
+    async def process_all_modules(self, mq_message: DespMQMessage) -> None:
+        """Run concurrently this module and the ones routed after it, then join their statuses (parallel pipeline)
+
+        A module raising an error, or running longer than module_timeout, is Need_Manual, like
+        an auto moderation without a registered module.
+        With fail_fast, the modules still running once one Failed are cancelled and stay Pending.
+
+        Args:
+            mq_message (DespMQMessage): message to moderate
+        """
+        modules = []
+        following_types = get_following_moderation_types(mq_message, self.automoderation_type)
+        for moderation_type in [self.automoderation_type, *following_types]:
+            if (module := module_holder.get(moderation_type)) is None:
+                record_missing_module(mq_message, moderation_type)
+                continue
+            modules.append(module)
+        timeout = get_settings().module_timeout
+        tasks = [asyncio.create_task(asyncio.wait_for(module.moderate(mq_message), timeout)) for module in modules]
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            failed = any(task.exception() is None and task.result() == AutoModerationStatus.Failed for task in done)
+            if self.fail_fast and failed and pending:
+                logger.debug("Verdict of %s is final, cancelling %s modules", mq_message.id, len(pending))
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                break
+        # Join in the routing order, so the history does not depend on the completion order
+        for module, task in zip(modules, tasks, strict=True):
+            if task.cancelled():
+                mq_message.history.append(SKIPPED_HISTORY.format(module.automoderation_type.value))
+            elif isinstance(error := task.exception(), TimeoutError):
+                logger.warning("%s module timed out on %s", module.automoderation_type.value, mq_message.id)
+                module.record_status(mq_message, AutoModerationStatus.Need_Manual, f" (timed out after {timeout}s)")
+            elif error is not None:
+                message = f"{module.automoderation_type.value} module failed on {mq_message.id}"
+                logger.exception(message, exc_info=error)
+                module.record_status(mq_message, AutoModerationStatus.Need_Manual, f" ({error.__class__.__name__})")
+            else:
+                module.record_status(mq_message, task.result())
 
     async def on_message(self, message: aio_pika.IncomingMessage) -> None:
         """Calls self.analyse on message received from the listened queue
 
+        In fused pipeline mode, the following modules run before the message is sent to handling.
+        In parallel pipeline mode, they run at the same time as this one.
+        With timing_logs, the duration of each stage is logged at debug level.
+
         Args:
             mq_message (DespMQMessage): _description_
             message (aio_pika.IncomingMessage): _description_
         """
-        mq_message = await decode_consume_message(message, DespMQMessage)
+        timing = MessageTiming()
+        token = current_timing.set(timing)
+        try:
+            mq_message = await self.handle_message(message)
+        finally:
+            current_timing.reset(token)
+        if get_settings().timing_logs and mq_message is not None:
+            logger.debug("Timing of %s: %s", mq_message.id, timing.summary())
+
+    def decoded_content_types(self) -> set[MQContentType]:
+        """Types of the contents read by this module, and by the following ones in fused and parallel modes"""
+        if self.pipeline_mode == PipelineMode.Chained:
+            return {self.content_type}
+        return {self.content_type} | {module.content_type for module in module_holder.values()}
+
+    async def decode(self, message: aio_pika.IncomingMessage) -> DespMQMessage | None:
+        """Decode a consumed message, only the contents read in this process are validated with lazy_decoding
+
+        Args:
+            message (aio_pika.IncomingMessage): message delivered by the consumer
+
+        Returns:
+            DespMQMessage | None: the message, None if it could not be decoded
+        """
+        if get_settings().lazy_decoding:
+            mq_message = decode_lazy_message(message, self.decoded_content_types())
+            if mq_message is not None:
+                return mq_message
+        return await decode_consume_message(message, DespMQMessage)
+
+    async def handle_message(self, message: aio_pika.IncomingMessage) -> DespMQMessage | None:
+        """Moderate a message with this module, and the following ones depending on the pipeline mode
+
+        Args:
+            message (aio_pika.IncomingMessage): message delivered by the consumer
+
+        Returns:
+            DespMQMessage | None: the moderated message, None if it could not be decoded
+        """
+        module = self.automoderation_type.value
+        with timed_stage("decode", module):
+            mq_message = await self.decode(message)
         logger.debug("current_transaction : %s", current_transaction.get())
         if mq_message is None:
             logger.warning("Cannot apply moderation on message due to decoding error")
-            return
-        logger.info("%s module Start analysing %s content", self.automoderation_type.value, mq_message.id)
-        status = self.analyze(mq_message.content.data_by_type.get(self.content_type))
-        mq_message.history.append(f"Automoderation [{self.automoderation_type.value}]: {status}")
-        logger.info(
-            "%s module Finished analysing %s content: %s", self.automoderation_type.value, mq_message.id, status.value
-        )
-        self.set_current_module_status(mq_message, status)
-        await message.ack()
-        await self.send_to_next_queue(mq_message)
+            return None
+        if self.pipeline_mode == PipelineMode.Parallel:
+            await self.process_all_modules(mq_message)
+        else:
+            await self.process(mq_message)
+        if self.pipeline_mode == PipelineMode.Fused:
+            await self.process_following_modules(mq_message)
+        with timed_stage("publish", module):
+            if self.pipeline_mode == PipelineMode.Chained:
+                await self.send_to_next_queue(mq_message)
+            else:
+                await send_to_handling(mq_message)
+        # Acked once published: a message interrupted before is redelivered rather than lost
+        with timed_stage("ack", module):
+            await message.ack()
+        return mq_message
 
     async def send_to_next_queue(self, mq_message: DespMQMessage) -> None:
         """Send the mq_message to the next queue, or handling if not next queue
 
+        With fail_fast, a message whose verdict is final goes straight to handling.
+        The following auto moderations without a queue are Need_Manual, see record_missing_module
+
         Args:
             mq_message (DespMQMessage): __desc__
         """
-        exchange = RabbitMQConfig.MODERATION_EXCHANGE
-        if (next_queue := get_next_moderation_queue(mq_message, self.automoderation_type)) is None:
-            logger.debug("Last element for %s: Sending to Handling", mq_message.id)
-            next_queue = RabbitMQConfig.TO_HANDLING_RKEY
-            automod_to_moderation_status(mq_message)
-        logger.info("Send to next queue: %s on exchange %s", next_queue, exchange)
-        await send_mq_message(mq_message, exchange, next_queue)
+        if self.fail_fast and is_verdict_final(mq_message):
+            logger.debug("Verdict of %s is final: Sending to Handling", mq_message.id)
+            skip_remaining_moderations(mq_message, self.automoderation_type)
+            await send_to_handling(mq_message)
+            return
+        for moderation_type in get_following_moderation_types(mq_message, self.automoderation_type):
+            if (next_queue := get_queue_rkey_from_module_type(moderation_type)) is not None:
+                exchange = RabbitMQConfig.MODERATION_EXCHANGE
+                logger.info("Send to next queue: %s on exchange %s", next_queue, exchange)
+                await send_mq_message(mq_message, exchange, next_queue)
+                return
+            record_missing_module(mq_message, moderation_type)
+        logger.debug("Last element for %s: Sending to Handling", mq_message.id)
+        await send_to_handling(mq_message)
+
+    async def consume(self, message: aio_pika.IncomingMessage) -> None:
+        """Handle a delivered message once one of the max_concurrency slots is free
+
+        Args:
+            message (aio_pika.IncomingMessage): message delivered by the consumer
+        """
+        if self.limit is None:
+            await self.on_message(message)
+            return
+        async with self.limit:
+            await self.on_message(message)
+
+    async def warm_up(self) -> None:
+        """Prepare the module before it consumes, so that its first messages are not slower than the next ones
+
+        Modules override it to open their connections and load their backends with a synthetic request
+        """
 
     async def start(self) -> None:
         """Start the module
 
-        Listen to "consume_queue" and analyse the incomming message.
+        Warm up the module, then listen to "consume_queue" and analyse the incomming message.
         Then redirect them in the next automod Queue, or handling
+        The consumer is tuned by services.automoderation.modules.<automoderation_type>, see ModuleSettings
+        A failed warm-up is logged, the module still starts.
         """
-        self.task = await consume_mq_queue_async(self.consume_queue, lambda msg: self.on_message(msg))
-        logger.info(
-            "Automoderation Module %s Start listening on %s", self.automoderation_type.value, self.consume_queue
+        module = self.automoderation_type.value
+        settings = get_settings().get_module_settings(module)
+        self.limit = asyncio.Semaphore(max(1, settings.max_concurrency))
+        self.executor = create_executor(settings.worker_pool, settings.workers, module)
+        if get_settings().warm_up:
+            start = time.perf_counter()
+            try:
+                await self.warm_up()
+                logger.info("Automoderation Module %s warmed up in %.3fs", module, time.perf_counter() - start)
+            except Exception as e:
+                logger.warning("Automoderation Module %s failed to warm up, starting cold: %s", module, e)
+        self.stopping = asyncio.Event()
+        self.task = asyncio.create_task(
+            consume_queue(
+                self.consume_queue, self.consume, settings.prefetch_count, self.stopping, get_settings().drain_timeout
+            )
         )
+        logger.info("Automoderation Module %s Start listening on %s with %s", module, self.consume_queue, settings)
 
     async def stop(self) -> None:
-        """Stop the module"""
+        """Stop consuming, and wait for the messages being handled, at most drain_timeout"""
         if self.task is not None:
-            self.task.cancel()
+            self.stopping.set()
+            # The consumer cancels the messages still running after drain_timeout, then closes its connection
+            try:
+                await asyncio.wait_for(asyncio.shield(self.task), get_settings().drain_timeout + STOP_MARGIN)
+            except TimeoutError:
+                logger.warning("Automoderation Module %s did not stop in time", self.automoderation_type.value)
+                self.task.cancel()
+            self.task = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
 
     def generate_reason_message(
         self, status: AutoModerationType, content: MQContentModel, additionnal_infos: list[str] | None = None
@@ -171,21 +480,22 @@ def add_module(module: ModerationModule) -> None:
     module_holder[module.automoderation_type] = module
 
 
-def get_queue_rkey_from_module_type(auto_mod_type: AutoModerationType) -> str:
-    """Return the queue routing key from the module of type auto_mod_type"""
-    module = module_holder.get(auto_mod_type)
-    return module.queue_rkey if module is not None else None
+def get_queue_rkey_from_module_type(auto_mod_type: AutoModerationType) -> str | None:
+    """Return the routing key to the queue of the auto_mod_type module, None if the service has no such module
+
+    Read from the RabbitMQ config, the module may run in another process
+    """
+    attribute = QUEUE_RKEY_ATTRIBUTES.get(auto_mod_type)
+    return getattr(RabbitMQConfig, attribute) if attribute is not None else None
 
 
 async def start_modules() -> None:
-    """Start a mod"""
-    for module in module_holder.values():
-        await module.start()
+    """Warm up and start all the modules concurrently"""
+    await asyncio.gather(*(module.start() for module in module_holder.values()))
     logger.debug("All Modules Started")
 
 
 async def stop_modules() -> None:
-    """Stop a mod"""
-    for module in module_holder.values():
-        module.stop()
+    """Stop all the modules concurrently, each one waits for its messages being handled"""
+    await asyncio.gather(*(module.stop() for module in module_holder.values()))
     logger.debug("All Modules Stopped")
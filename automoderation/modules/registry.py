@@ -0,0 +1,23 @@
+"""Module registry"""
+
+from msfwk.desp.rabbitmq.mq_message import AutoModerationType
+
+from automoderation.modules.moderation_module import ModerationModule
+from automoderation.modules.text_toxicity import TextToxicityModule
+from automoderation.modules.url_validation import UrlValidationModule
+
+MODULE_CLASSES: dict[AutoModerationType, type[ModerationModule]] = {
+    AutoModerationType.Text_Toxicity: TextToxicityModule,
+    AutoModerationType.Url_Validation: UrlValidationModule,
+}
+
+
+def create_modules(automoderation_types: list[AutoModerationType] | None = None) -> list[ModerationModule]:
+    """Create the moderation modules
+
+    Args:
+        automoderation_types (list[AutoModerationType] | None): modules to create. Default to None -> all of them
+    """
+    if automoderation_types is None:
+        automoderation_types = list(MODULE_CLASSES)
+    return [MODULE_CLASSES[automoderation_type]() for automoderation_type in automoderation_types]
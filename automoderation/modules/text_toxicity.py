@@ -1,41 +1,103 @@
 """Text toxicity module"""
 
-from bs4 import BeautifulSoup
-from markdown import markdown
 from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus, AutoModerationType, MQContentModel, MQContentType
 from msfwk.mqclient import RabbitMQConfig
 from msfwk.utils.logging import get_logger
 
-from automoderation.ai_models.detoxify.model import DetoxifyModel
-from automoderation.modules.moderation_module import ModerationModule
+from automoderation.ai_models.abstract_model import AbstractModel
+from automoderation.ai_models.factory import create_toxicity_model
+from automoderation.models.interfaces import TextToxicityRiskModel
+from automoderation.modules.moderation_module import ModerationModule, current_content_id
+from automoderation.utils.lexical_prefilter import LexicalPrefilter, PrefilterDecision
+from automoderation.utils.markdown_text import extract_text
+from automoderation.utils.settings import get_settings
 from automoderation.utils.status_utils import aggregate_status
+from automoderation.utils.timing import timed_stage
 
 logger = get_logger(__name__)
 
+# Goes through the markdown renderer, not only the plain text path
+WARM_UP_MARKDOWN = "# Warm-up\n\n*Rendering* a [markdown](https://example.com) text."
+# Length of the sentences quoted in the rejected reasons
+MAX_REASON_CHARS = 200
+
 
 class TextToxicityModule(ModerationModule):
     """Verify text toxicity"""
 
     automoderation_type: AutoModerationType = AutoModerationType.Text_Toxicity
     content_type: MQContentType = MQContentType.Text
-    detoxify_model: DetoxifyModel | None = None
+    toxicity_model: AbstractModel | None = None
+    prefilter: LexicalPrefilter | None = None
 
     def __init__(self) -> "TextToxicityModule":
-        self.detoxify_model = DetoxifyModel()
+        self.toxicity_model = create_toxicity_model()
+        prefilter_settings = get_settings().toxicity_prefilter
+        self.prefilter = LexicalPrefilter(prefilter_settings) if prefilter_settings.enabled else None
         self.consume_queue = RabbitMQConfig.TEXT_TOXICITY_AUTOMODERATION_QUEUE
         self.queue_rkey = RabbitMQConfig.TO_AUTO_TEXT_TOXICITY_RKEY
 
-    def analyze(self, content_list: list[MQContentModel]) -> AutoModerationStatus:
-        """Analyze content, and set reason of fails"""
+    async def warm_up(self) -> None:
+        """Render a markdown text in the worker pool, and score a synthetic text with the model"""
+        await self.run_in_worker(extract_text, WARM_UP_MARKDOWN)
+        await self.toxicity_model.warm_up()
+
+    async def analyze(self, content_list: list[MQContentModel]) -> AutoModerationStatus:
+        """Analyze content, and set reason of fails
+
+        With fail_fast, stops at the first Failed content
+        """
         all_status = []
         for content in content_list:
-            # Process markdown and extract text using BeautifulSoup
+            # Markdown rendering is CPU bound, keep it out of the event loop
             if isinstance(content.value, str):
-                html = markdown(content.value)
-                content.value = "".join(BeautifulSoup(html, features="html.parser").findAll(text=True))
-            status = self.detoxify_model.evaluate_content(content)
+                with timed_stage("preprocess"):
+                    content.value = await self.run_in_worker(extract_text, content.value)
+            status, reasons = await self.evaluate(content)
             all_status.append(status)
             if status != AutoModerationStatus.Pass:
-                self.generate_reason_message(status, content)
+                self.generate_reason_message(status, content, reasons)
+            if status == AutoModerationStatus.Failed and self.fail_fast:
+                logger.debug("Content %s Failed, the remaining contents are not analyzed", content.name)
+                break
 
         return aggregate_status(all_status)
+
+    async def evaluate(self, content: MQContentModel) -> tuple[AutoModerationStatus, list[str]]:
+        """Return the status of a content, and the reasons of a status other than Pass
+
+        The lexical pre-filter decides the obvious texts, the other ones are scored by the model
+        """
+        if self.prefilter is not None:
+            with timed_stage("prefilter"):
+                decision, term = self.prefilter.decide(str(content.value))
+            if decision == PrefilterDecision.Blocked:
+                return AutoModerationStatus.Failed, [f"contains the blocked term '{term}'"]
+            if decision == PrefilterDecision.Passed:
+                return AutoModerationStatus.Pass, []
+        risks = await self.toxicity_model.evaluate_risks(content, self.content_key(content))
+        if risks.status == AutoModerationStatus.Pass or len(risks.sentences) <= 1:
+            return risks.status, []
+        with timed_stage("locate_risks"):
+            located = await self.toxicity_model.locate_risks(risks)
+        return risks.status, self.risky_sentences(located)
+
+    @staticmethod
+    def content_key(content: MQContentModel) -> str | None:
+        """Identify a content of the message being moderated across its edits, None without a content id"""
+        content_id = current_content_id.get()
+        return f"{content_id}:{content.name}" if content_id else None
+
+    @staticmethod
+    def risky_sentences(risks: TextToxicityRiskModel) -> list[str]:
+        """Describe the sentences of a long text that did not pass, shortened to MAX_REASON_CHARS"""
+        return [
+            f"[{sentence.risk.value}] {shorten(sentence.sentence, MAX_REASON_CHARS)}"
+            for sentence in risks.sentences
+            if sentence.risk != AutoModerationStatus.Pass
+        ]
+
+
+def shorten(text: str, max_chars: int) -> str:
+    """Cut a text to max_chars characters, ending with an ellipsis when cut"""
+    return text if len(text) <= max_chars else f"{text[: max_chars - 1].rstrip()}…"
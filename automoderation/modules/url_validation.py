@@ -1,67 +1,177 @@
 """Url validation module"""
 
-import socket
+import asyncio
+import functools
+from collections.abc import Callable
 from urllib.parse import urlparse
 
-import requests
+import httpx
 from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus, AutoModerationType, MQContentModel, MQContentType
+from msfwk.metrics import push_metric
 from msfwk.mqclient import RabbitMQConfig
 from msfwk.utils.logging import get_logger
 
 from automoderation.modules.moderation_module import ModerationModule
+from automoderation.utils.cache import CACHE_HIT, CACHE_MISS, LocalCache
+from automoderation.utils.concurrency import KeyedLimiter, SingleFlight
+from automoderation.utils.domain_index import DomainReputation, ReloadingDomainIndex
+from automoderation.utils.http_client import get_http_client
+from automoderation.utils.metrics import CacheEventsTotal
+from automoderation.utils.settings import UrlVerdictCacheSettings, get_settings
 from automoderation.utils.status_utils import aggregate_status
+from automoderation.utils.timing import ERROR_FAILURE, ERROR_TIMEOUT, count_backend_error, timed_stage
+from automoderation.utils.url_utils import CachingResolver, normalize_url
 
 logger = get_logger(__name__)
 
 HTTP_SUCCESS_THRESHOLD = 400
+URL_BACKEND = "url_head"
+DOMAIN_INDEX_NAME = "domain_reputation"
 
 
 class UrlValidationModule(ModerationModule):
-    """Verify url"""
+    """Verify url
+
+    Urls of trusted domains Pass and urls of blocked domains Fail without any request.
+    The other urls of all the messages in progress are checked concurrently,
+    within a global limit and a limit per host.
+    Verdicts are cached by normalized url, for a time depending on the status,
+    and concurrent checks of the same url share one request.
+    """
 
     automoderation_type: AutoModerationType = AutoModerationType.Url_Validation
     content_type: MQContentType = MQContentType.Url
 
     def __init__(self) -> "UrlValidationModule":
+        settings = get_settings().url_validation
         self.consume_queue = RabbitMQConfig.URL_VALIDATION_AUTOMODERATION_QUEUE
         self.queue_rkey = RabbitMQConfig.TO_AUTO_URL_VALIDATION_RKEY
+        self.timeout = settings.timeout
+        self.global_limit = asyncio.Semaphore(settings.max_concurrency)
+        self.host_limit = KeyedLimiter(settings.max_per_host)
+        self.resolver = CachingResolver(settings.dns_cache)
+        self.domain_index = ReloadingDomainIndex(settings.domain_reputation)
+        self.in_flight: SingleFlight[tuple[AutoModerationStatus, str | None]] = SingleFlight("url")
+        self.verdict_cache = (
+            LocalCache("url_verdict", settings.verdict_cache.maxsize, self.make_verdict_ttl(settings.verdict_cache))
+            if settings.verdict_cache.enabled
+            else None
+        )
+
+    @staticmethod
+    def make_verdict_ttl(
+        settings: UrlVerdictCacheSettings,
+    ) -> Callable[[tuple[AutoModerationStatus, str | None]], float]:
+        """Return the function giving the time to live of a verdict"""
+        ttl_by_status = {
+            AutoModerationStatus.Pass: settings.pass_ttl,
+            AutoModerationStatus.Failed: settings.failed_ttl,
+            AutoModerationStatus.Need_Manual: settings.need_manual_ttl,
+        }
+        return lambda verdict: ttl_by_status.get(verdict[0], 0)
 
-    def analyze(self, content_list: list[MQContentModel]) -> AutoModerationStatus:
-        """Analyze content, and set reason of fails"""
+    async def analyze(self, content_list: list[MQContentModel]) -> AutoModerationStatus:
+        """Analyze content, and set reason of fails
+
+        With fail_fast, the checks still running are cancelled once an url Failed
+        """
+        urls = list(dict.fromkeys(content.value for content in content_list))
+        results = await self.check_urls(urls)
         all_status = []
         for content in content_list:
-            status, additionnal_infos = self.check_url_accessibility(content.value)
+            if content.value not in results:
+                continue
+            status, additionnal_info = results[content.value]
             all_status.append(status)
             if status != AutoModerationStatus.Pass:
-                self.generate_reason_message(status, content, additionnal_infos=additionnal_infos)
+                self.generate_reason_message(
+                    status, content, additionnal_infos=[additionnal_info] if additionnal_info else None
+                )
 
         return aggregate_status(all_status)
 
-    def check_url_accessibility(self, url: str) -> tuple[AutoModerationStatus, str | None]:
+    async def check_urls(self, urls: list[str]) -> dict[str, tuple[AutoModerationStatus, str | None]]:
+        """Check urls concurrently, the cancelled checks have no result"""
+        if not self.fail_fast:
+            return dict(zip(urls, await asyncio.gather(*(self.check_url(url) for url in urls)), strict=True))
+        tasks = {asyncio.create_task(self.check_url(url)): url for url in urls}
+        results = {}
+        try:
+            for done in asyncio.as_completed(tasks):
+                verdict = await done
+                if verdict[0] == AutoModerationStatus.Failed:
+                    break
+        finally:
+            for task, url in tasks.items():
+                if task.done() and not task.cancelled() and task.exception() is None:
+                    results[url] = task.result()
+                else:
+                    task.cancel()
+        return results
+
+    async def check_url(self, url: str) -> tuple[AutoModerationStatus, str | None]:
+        """Check the url accessibility once a slot is available for its host, then globally
+
+        Return the verdict of the domain index for trusted and blocked domains,
+        the cached verdict if the url was recently checked,
+        or wait for the check of the same url in progress
+        """
+        if (verdict := self.check_domain_reputation(url)) is not None:
+            return verdict
+        key = normalize_url(url)
+        if self.verdict_cache is not None and (verdict := self.verdict_cache.get(key)) is not None:
+            return verdict
+        return await self.in_flight.do(key, functools.partial(self.check_uncached_url, url, key))
+
+    def check_domain_reputation(self, url: str) -> tuple[AutoModerationStatus, str | None] | None:
+        """Return the verdict of the domain index on the host of an url, None if the host is not indexed"""
+        try:
+            host = urlparse(url).hostname
+        except ValueError:
+            return None
+        reputation = self.domain_index.lookup(host)
+        push_metric(CacheEventsTotal, [DOMAIN_INDEX_NAME, CACHE_MISS if reputation is None else CACHE_HIT])
+        if reputation is DomainReputation.Blocked:
+            return AutoModerationStatus.Failed, f"{url} is on a blocked domain"
+        if reputation is DomainReputation.Trusted:
+            return AutoModerationStatus.Pass, None
+        return None
+
+    async def check_uncached_url(self, url: str, key: str) -> tuple[AutoModerationStatus, str | None]:
+        """Check the url accessibility within the limits, and cache the verdict
+
+        Concurrent checks of the same normalized url share this call, see check_url
+        """
+        async with self.host_limit.acquire(urlparse(url).hostname), self.global_limit:
+            verdict = await self.check_url_accessibility(url)
+        if self.verdict_cache is not None:
+            self.verdict_cache.set(key, verdict)
+        return verdict
+
+    async def check_url_accessibility(self, url: str) -> tuple[AutoModerationStatus, str | None]:
         """Securely checks if the given URL is accessible.
 
         Returns An AutomoderationStatus, and a reason (for Fail or Need_Manual, None if Pass)
         """
         try:
-            with requests.Session() as session:
-                response = session.head(url, allow_redirects=True, timeout=2)
-                if response.status_code < HTTP_SUCCESS_THRESHOLD:
-                    return AutoModerationStatus.Pass, None
-                return (AutoModerationStatus.Failed, f"{url} returns {response.status_code}")
-        except requests.ConnectionError:
-            parsed_url = urlparse(url)
+            with timed_stage("backend"):
+                response = await get_http_client().head(url, follow_redirects=True, timeout=self.timeout)
+            if response.status_code < HTTP_SUCCESS_THRESHOLD:
+                return AutoModerationStatus.Pass, None
+            return (AutoModerationStatus.Failed, f"{url} returns {response.status_code}")
+        except httpx.ConnectError:
             message = f"Error during connection with: '{url}'"
-            try:
-                socket.gethostbyname(parsed_url.hostname)
-            except socket.gaierror:
+            if not await self.resolver.is_resolvable(urlparse(url).hostname):
                 message = f"Could not find URL: '{url}'"
                 logger.info(message)
             return AutoModerationStatus.Failed, message
-        except requests.Timeout as te:
+        except httpx.TimeoutException as te:
+            count_backend_error(URL_BACKEND, ERROR_TIMEOUT)
             message = f"Timeout error while checking URL: '{url}'"
             logger.exception(message, exc_info=te)
             return AutoModerationStatus.Need_Manual, message
-        except requests.RequestException as re:
+        except (httpx.HTTPError, httpx.InvalidURL) as re:
+            count_backend_error(URL_BACKEND, ERROR_FAILURE)
             message = f"General request error while checking URL: '{url}'"
             logger.exception(message, exc_info=re)
             return AutoModerationStatus.Need_Manual, message
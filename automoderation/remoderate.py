@@ -0,0 +1,237 @@
+"""Bulk re-moderation
+
+Re-run the moderation modules on dumps of DespMQMessage (one JSON payload per line),
+without RabbitMQ, to measure the effect of new thresholds or a new model.
+
+Lines are read in chunks, each chunk is moderated by a worker process: the messages of a chunk are
+analyzed concurrently, so their texts are scored in batches. At most max_in_flight chunks are in
+memory, and a JSON line is written for each message, in the input order:
+{"source", "line", "id", "content_id", "stored_status", "status", "changed", "auto_moderations", "rejected_reasons"}
+
+Usage: APP_CONFIG_FILE=<service config> python -m automoderation.remoderate dump.jsonl [...] [-o verdicts.jsonl]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from collections import Counter, deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import AbstractContextManager, nullcontext
+from pathlib import Path
+from typing import TextIO
+
+from msfwk.desp.rabbitmq.mq_message import (
+    AutoModerationStatus,
+    AutoModerationType,
+    DespMQMessage,
+    ModerationEventStatus,
+)
+from msfwk.utils.logging import get_logger
+
+from automoderation.modules.moderation_module import ModerationModule, automod_to_moderation_status, module_holder
+from automoderation.modules.registry import MODULE_CLASSES, create_modules
+from automoderation.utils.http_client import start_http_client
+from automoderation.utils.settings import load_settings
+
+logger = get_logger(__name__)
+
+STDIN = "-"
+
+# State of a worker process, see init_worker
+_loop: asyncio.AbstractEventLoop | None = None
+_modules: dict[AutoModerationType, ModerationModule] = {}
+
+
+def open_text(path: str, mode: str) -> AbstractContextManager[TextIO]:
+    """Open a text file, "-" for stdin or stdout, which are left open"""
+    if path == STDIN:
+        return nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    return Path(path).open(mode, encoding="utf-8")
+
+
+def read_chunks(paths: list[str], chunk_size: int) -> Iterator[list[tuple[str, int, str]]]:
+    """Stream the non empty lines of the dumps, chunk_size lines at a time
+
+    Args:
+        paths (list[str]): JSON lines files, "-" for stdin
+        chunk_size (int): number of lines of a chunk
+
+    Yields:
+        list[tuple[str, int, str]]: the source, line number and content of each line
+    """
+    chunk = []
+    for path in paths:
+        with open_text(path, "r") as dump:
+            for number, line in enumerate(dump, start=1):
+                if line.strip():
+                    chunk.append((path, number, line))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+    if chunk:
+        yield chunk
+
+
+def init_worker(automoderation_types: list[AutoModerationType], log_level: int) -> None:
+    """Create the event loop, the HTTP client and the modules of a worker process"""
+    global _loop, _modules
+    logging.disable(log_level - 1)
+    settings = load_settings()
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    _loop.run_until_complete(start_http_client(settings.http_client))
+    _modules = {module.automoderation_type: module for module in create_modules(automoderation_types)}
+    # Modules look up each other in fused and parallel pipeline modes
+    module_holder.update(_modules)
+
+
+async def remoderate_message(mq_message: DespMQMessage) -> dict:
+    """Run the selected modules routed for a message, the other auto moderations keep their stored status
+
+    Args:
+        mq_message (DespMQMessage): message as stored
+
+    Returns:
+        dict: the new verdict, and the stored one
+    """
+    stored_status = mq_message.status
+    stored = {moderation.moderation_type: moderation.status for moderation in mq_message.auto_mod_routing}
+    for moderation in mq_message.auto_mod_routing:
+        if (module := _modules.get(moderation.moderation_type)) is not None:
+            moderation.status = AutoModerationStatus.Pending
+            for content in mq_message.content.data_by_type.get(module.content_type) or []:
+                content.rejected_reasons = []
+    mq_message.status = ModerationEventStatus.Auto_Pending
+    for moderation in mq_message.auto_mod_routing:
+        if (module := _modules.get(moderation.moderation_type)) is not None:
+            await module.process(mq_message)
+    automod_to_moderation_status(mq_message)
+    return {
+        "id": mq_message.id,
+        "content_id": mq_message.content_id,
+        "stored_status": stored_status.value,
+        "status": mq_message.status.value,
+        "changed": mq_message.status != stored_status,
+        "auto_moderations": {
+            moderation.moderation_type.value: {
+                "stored": stored[moderation.moderation_type].value,
+                "status": moderation.status.value,
+            }
+            for moderation in mq_message.auto_mod_routing
+        },
+        "rejected_reasons": {
+            content.name: content.rejected_reasons
+            for contents in mq_message.content.data_by_type.values()
+            for content in contents
+            if content.rejected_reasons
+        },
+    }
+
+
+async def remoderate_line(source: str, number: int, line: str) -> dict:
+    """Decode and re-moderate a line of a dump, describe the error if it fails"""
+    record = {"source": source, "line": number}
+    try:
+        mq_message = DespMQMessage.from_dict(json.loads(line))
+        record.update(await remoderate_message(mq_message))
+    except Exception as e:
+        logger.warning("Could not re-moderate %s:%s: %s", source, number, e)
+        record["error"] = f"{e.__class__.__name__}: {e}"
+    return record
+
+
+def describe_transition(record: dict) -> str:
+    """Summary key of a record: its status transition, or error"""
+    return "error" if "error" in record else f"{record['stored_status']} -> {record['status']}"
+
+
+def remoderate_chunk(chunk: list[tuple[str, int, str]]) -> list[tuple[str, str]]:
+    """Re-moderate the lines of a chunk concurrently, in a worker process
+
+    Returns:
+        list[tuple[str, str]]: the JSON record and the transition of each line, in the same order
+    """
+
+    async def run() -> list[dict]:
+        return await asyncio.gather(*(remoderate_line(*line) for line in chunk))
+
+    return [(json.dumps(record), describe_transition(record)) for record in _loop.run_until_complete(run())]
+
+
+def write_records(records: list[tuple[str, str]], output: TextIO, summary: Counter) -> None:
+    """Write the records of a chunk, and count the status transitions"""
+    for record, transition in records:
+        output.write(record + "\n")
+        summary[transition] += 1
+
+
+def remoderate(
+    paths: list[str],
+    output: TextIO,
+    automoderation_types: list[AutoModerationType],
+    processes: int,
+    chunk_size: int,
+    max_in_flight: int,
+    log_level: int,
+) -> Counter:
+    """Re-moderate the dumps with a pool of processes, writing the records in the input order
+
+    Returns:
+        Counter: number of messages by status transition, and number of errors
+    """
+    summary = Counter()
+    pending: deque[Future] = deque()
+    with ProcessPoolExecutor(
+        max_workers=processes, initializer=init_worker, initargs=(automoderation_types, log_level)
+    ) as pool:
+        for chunk in read_chunks(paths, chunk_size):
+            pending.append(pool.submit(remoderate_chunk, chunk))
+            # Bound the memory: wait for the oldest chunk before reading more
+            while len(pending) >= max_in_flight:
+                write_records(pending.popleft().result(), output, summary)
+        while pending:
+            write_records(pending.popleft().result(), output, summary)
+    return summary
+
+
+def main() -> None:
+    """Run the re-moderation CLI"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dumps", nargs="+", help="JSON lines files of DespMQMessage payloads, - for stdin")
+    parser.add_argument("-o", "--output", default=STDIN, help="JSON lines file of the verdicts, - for stdout")
+    parser.add_argument(
+        "-m",
+        "--modules",
+        nargs="+",
+        choices=[automoderation_type.value for automoderation_type in MODULE_CLASSES],
+        default=[automoderation_type.value for automoderation_type in MODULE_CLASSES],
+        help="auto moderations to re-run, the other ones keep their stored status",
+    )
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=256, help="messages moderated together by a worker")
+    parser.add_argument("--max-in-flight", type=int, default=0, help="chunks in memory, default to 2 x processes")
+    parser.add_argument("--log-level", default="WARNING", help="logs below this level are disabled")
+    args = parser.parse_args()
+
+    log_level = logging.getLevelName(args.log_level)
+    logging.disable(log_level - 1)
+    with open_text(args.output, "w") as output:
+        summary = remoderate(
+            args.dumps,
+            output,
+            [AutoModerationType(module) for module in args.modules],
+            max(1, args.processes),
+            max(1, args.chunk_size),
+            args.max_in_flight or 2 * max(1, args.processes),
+            log_level,
+        )
+    for transition, count in sorted(summary.items()):
+        print(f"{transition:<40}{count:>10}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
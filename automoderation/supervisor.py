@@ -0,0 +1,257 @@
+"""Multi-process supervisor
+
+Run the consumers of the moderation modules in several worker processes, to use several cores:
+services.automoderation.modules.<AutoModerationType>.processes workers consume the queue of each module.
+In the chained pipeline mode a worker builds only its module, in the fused and parallel modes
+it holds all of them, to run the following modules in process.
+
+SIGTERM and SIGINT are forwarded to the workers, which stop consuming and finish their messages
+within supervisor.drain_timeout. Crashed workers are restarted after a growing delay.
+Workers failing supervisor.max_startup_failures times in a row before consuming stop the supervisor.
+The metrics of the workers are aggregated and served on supervisor.metrics_port.
+
+Usage: APP_CONFIG_FILE=<service config> python -m automoderation.supervisor
+"""
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+from multiprocessing.process import BaseProcess
+from multiprocessing.synchronize import Event
+from pathlib import Path
+
+from msfwk.context import current_config
+from msfwk.desp.rabbitmq.mq_message import AutoModerationType
+from msfwk.mqclient import load_default_rabbitmq_config
+from msfwk.utils.config import read_config
+from msfwk.utils.logging import get_logger
+from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+
+from automoderation.modules.moderation_module import add_module, module_holder
+from automoderation.modules.registry import MODULE_CLASSES, create_modules
+from automoderation.utils.http_client import close_http_client, start_http_client
+from automoderation.utils.settings import AutomoderationSettings, PipelineMode, SupervisorSettings, load_settings
+
+logger = get_logger(__name__)
+
+MULTIPROCESS_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+POLL_INTERVAL = 0.5
+STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+async def serve_module(automoderation_type: AutoModerationType, ready: Event | None = None) -> None:
+    """Consume the queue of one module until SIGTERM or SIGINT, then stop it
+
+    Args:
+        automoderation_type (AutoModerationType): module consuming in this worker
+        ready (Event | None): set once the module consumes. Default to None -> not signaled
+    """
+    config = read_config()
+    current_config.set(config)
+    if not load_default_rabbitmq_config():
+        logger.error("Failed to load rabbitmq config")
+        sys.exit(1)
+    settings = load_settings(config)
+    await start_http_client(settings.http_client)
+    # The fused and parallel modes run the following modules in process
+    automoderation_types = [automoderation_type] if settings.pipeline_mode == PipelineMode.Chained else None
+    for module in create_modules(automoderation_types):
+        add_module(module)
+    module = module_holder[automoderation_type]
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in STOP_SIGNALS:
+        loop.add_signal_handler(signum, stopping.set)
+    await module.start()
+    if ready is not None:
+        ready.set()
+    await stopping.wait()
+    logger.info("Worker %s of %s stopping", os.getpid(), automoderation_type.value)
+    await module.stop()
+    await close_http_client()
+
+
+def run_worker(automoderation_type: str, ready: Event | None = None) -> None:
+    """Entry point of a worker process"""
+    asyncio.run(serve_module(AutoModerationType(automoderation_type), ready))
+
+
+class WorkerSlot:
+    """A worker process of a module, restarted when it crashes"""
+
+    def __init__(self, automoderation_type: AutoModerationType, index: int) -> "WorkerSlot":
+        self.automoderation_type = automoderation_type
+        self.index = index
+        self.process: BaseProcess | None = None
+        self.ready: Event | None = None
+        self.started_at = 0.0
+        self.crashes = 0
+        self.startup_failures = 0
+        self.restart_at: float | None = None
+
+    def __str__(self) -> str:
+        return f"{self.automoderation_type.value}[{self.index}]"
+
+
+class Supervisor:
+    """Start the worker processes of the modules, restart the crashed ones, and stop them on a signal"""
+
+    def __init__(self, counts: dict[AutoModerationType, int], settings: SupervisorSettings) -> "Supervisor":
+        """Create the slots of the workers
+
+        Args:
+            counts (dict[AutoModerationType, int]): number of worker processes of each module
+            settings (SupervisorSettings): restart and drain delays
+        """
+        self.settings = settings
+        self.slots = [
+            WorkerSlot(automoderation_type, index)
+            for automoderation_type, count in counts.items()
+            for index in range(count)
+        ]
+        self.context = multiprocessing.get_context("spawn")
+        self.stopping = False
+        self.failed = False
+
+    def start_worker(self, slot: WorkerSlot) -> None:
+        """Start the process of a slot"""
+        slot.ready = self.context.Event()
+        slot.process = self.context.Process(
+            target=run_worker, args=(slot.automoderation_type.value, slot.ready), name=f"automoderation-{slot}"
+        )
+        slot.process.start()
+        slot.started_at = time.monotonic()
+        slot.restart_at = None
+        logger.info("Started worker %s, pid %s", slot, slot.process.pid)
+
+    def request_stop(self, signum: int, _frame: object) -> None:
+        """Stop supervising, and forward the signal to the workers"""
+        logger.info("Received %s, stopping the workers", signal.Signals(signum).name)
+        self.stop_workers()
+
+    def stop_workers(self) -> None:
+        """Stop supervising, and send SIGTERM to the workers"""
+        self.stopping = True
+        for slot in self.slots:
+            if slot.process is not None and slot.process.is_alive():
+                os.kill(slot.process.pid, signal.SIGTERM)
+
+    def check_worker(self, slot: WorkerSlot) -> None:
+        """Schedule the restart of a worker which exited, and restart it when its delay is over"""
+        if self.stopping:
+            return
+        now = time.monotonic()
+        if slot.restart_at is not None:
+            if now >= slot.restart_at:
+                self.start_worker(slot)
+            return
+        if slot.process.is_alive():
+            return
+        multiprocess.mark_process_dead(slot.process.pid)
+        if self.failed_to_start(slot):
+            return
+        # A worker which ran long enough is not crash looping, restart it quickly
+        if now - slot.started_at >= self.settings.max_restart_delay:
+            slot.crashes = 0
+        delay = min(self.settings.max_restart_delay, self.settings.restart_delay * 2**slot.crashes)
+        slot.crashes += 1
+        slot.restart_at = now + delay
+        logger.error("Worker %s exited with code %s, restarting in %ss", slot, slot.process.exitcode, delay)
+
+    def failed_to_start(self, slot: WorkerSlot) -> bool:
+        """Count the workers of a slot exiting with an error before they consume,
+        and stop the supervisor after max_startup_failures of them in a row
+
+        Returns:
+            bool: the supervisor is stopping
+        """
+        if slot.ready.is_set() or slot.process.exitcode == 0:
+            slot.startup_failures = 0
+            return False
+        slot.startup_failures += 1
+        max_failures = self.settings.max_startup_failures
+        if not max_failures or slot.startup_failures < max_failures:
+            return False
+        logger.error(
+            "Worker %s exited with code %s before consuming, %s times in a row: stopping",
+            slot,
+            slot.process.exitcode,
+            slot.startup_failures,
+        )
+        self.failed = True
+        self.stop_workers()
+        return True
+
+    def drain(self) -> None:
+        """Wait for the workers to stop, and kill the ones still running after drain_timeout"""
+        deadline = time.monotonic() + self.settings.drain_timeout
+        for slot in self.slots:
+            if slot.process is None:
+                continue
+            slot.process.join(max(0, deadline - time.monotonic()))
+            if slot.process.is_alive():
+                logger.warning("Worker %s did not stop within %ss, killing it", slot, self.settings.drain_timeout)
+                slot.process.kill()
+                slot.process.join()
+            multiprocess.mark_process_dead(slot.process.pid)
+
+    def run(self) -> None:
+        """Supervise the workers until SIGTERM or SIGINT"""
+        for signum in STOP_SIGNALS:
+            signal.signal(signum, self.request_stop)
+        for slot in self.slots:
+            self.start_worker(slot)
+        while not self.stopping:
+            for slot in self.slots:
+                self.check_worker(slot)
+            time.sleep(POLL_INTERVAL)
+        self.drain()
+        logger.info("All the workers stopped")
+
+
+def prepare_metrics(settings: SupervisorSettings) -> None:
+    """Make the workers write their metrics to files, and serve their aggregation
+
+    Must run before the workers are started, they read the directory from the environment when they start
+    """
+    directory = os.environ.get(MULTIPROCESS_DIR_ENV) or settings.metrics_dir
+    directory = Path(directory or tempfile.mkdtemp(prefix="automoderation-metrics-"))
+    directory.mkdir(parents=True, exist_ok=True)
+    # Files left by a previous run would be added to the new metrics
+    for stale in directory.glob("*.db"):
+        stale.unlink()
+    os.environ[MULTIPROCESS_DIR_ENV] = str(directory)
+    if not settings.metrics_port:
+        return
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(settings.metrics_port, registry=registry)
+    logger.info("Serving the metrics of the workers on port %s", settings.metrics_port)
+
+
+def get_worker_counts(settings: AutomoderationSettings) -> dict[AutoModerationType, int]:
+    """Return the number of worker processes of each module"""
+    return {
+        automoderation_type: max(0, settings.get_module_settings(automoderation_type.value).processes)
+        for automoderation_type in MODULE_CLASSES
+    }
+
+
+def main() -> None:
+    """Run the supervisor"""
+    settings = load_settings()
+    counts = get_worker_counts(settings)
+    logger.info("Starting workers: %s", {module_type.value: count for module_type, count in counts.items()})
+    prepare_metrics(settings.supervisor)
+    supervisor = Supervisor(counts, settings.supervisor)
+    supervisor.run()
+    if supervisor.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
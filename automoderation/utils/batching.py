@@ -0,0 +1,93 @@
+"""Micro batching"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Generic, TypeVar
+
+from msfwk.utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """Group the items submitted by concurrent callers into batches
+
+    A batch is flushed when it reaches max_batch_size items, or max_wait seconds
+    after its first item was submitted. Each caller receives the result matching its item,
+    or the exception raised while processing the batch, and is cancelled if the batch is.
+    """
+
+    def __init__(
+        self, process_batch: Callable[[list[T]], Awaitable[list[R]]], max_batch_size: int, max_wait: float
+    ) -> "MicroBatcher":
+        """Create a batcher
+
+        Args:
+            process_batch (Callable[[list[T]], Awaitable[list[R]]]): returns one result per item, in the same order
+            max_batch_size (int): max number of items in a batch
+            max_wait (float): max time (in seconds) an item waits for its batch to be flushed
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0, max_wait)
+        self._pending: list[tuple[T, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._running: set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> int:
+        """Number of batches being processed"""
+        return len(self._running)
+
+    async def submit(self, item: T) -> R:
+        """Add an item to the current batch and wait for its result
+
+        Args:
+            item (T): the item to process
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self.flush)
+        return await future
+
+    def flush(self) -> None:
+        """Send the pending items as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: list[tuple[T, asyncio.Future]]) -> None:
+        """Process a batch and dispatch the results to the callers"""
+        logger.debug("Processing a batch of %s items", len(batch))
+        try:
+            results = await self.process_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                message = f"Batch of {len(batch)} items returned {len(results)} results"
+                raise ValueError(message)
+        except Exception as e:
+            # Every caller of the batch receives the error
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results, strict=True):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            # A cancelled batch cancels its callers, instead of leaving them waiting forever
+            for _, future in batch:
+                if not future.done():
+                    future.cancel()
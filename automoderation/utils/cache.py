@@ -0,0 +1,78 @@
+"""In-process caches"""
+
+import time
+from collections.abc import Callable
+from typing import Any
+
+from cachetools import TLRUCache
+from msfwk.metrics import push_metric
+
+from automoderation.utils.metrics import CacheEventsTotal
+
+CACHE_HIT = "hit"
+CACHE_MISS = "miss"
+CACHE_EVICTION = "eviction"
+
+
+class _EvictionCountingCache(TLRUCache):
+    """TLRUCache notifying when an entry is evicted to make room"""
+
+    def __init__(self, maxsize: int, ttu: Callable, on_eviction: Callable[[], None]) -> "_EvictionCountingCache":
+        super().__init__(maxsize, ttu, timer=time.monotonic)
+        self._on_eviction = on_eviction
+
+    def popitem(self) -> tuple[Any, Any]:
+        """Evict the least recently used entry"""
+        item = super().popitem()
+        self._on_eviction()
+        return item
+
+
+class LocalCache:
+    """Bounded LRU cache whose entries expire after a time to live
+
+    The time to live is either a constant, or computed for each value.
+    Hits, misses and evictions are counted, and pushed to CacheEventsTotal with the cache name.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float | Callable[[Any], float]) -> "LocalCache":
+        """Create a cache
+
+        Args:
+            name (str): name of the cache in the metrics
+            maxsize (int): max number of entries
+            ttl (float | Callable[[Any], float]): time to live in seconds, or a function returning it for a value
+        """
+        self.name = name
+        self.ttl = ttl
+        self.stats = {CACHE_HIT: 0, CACHE_MISS: 0, CACHE_EVICTION: 0}
+        self._cache = _EvictionCountingCache(
+            maxsize, self._time_to_use, on_eviction=lambda: self._count(CACHE_EVICTION)
+        )
+
+    def _time_to_use(self, _key: Any, value: Any, now: float) -> float:
+        """Expiration time of a new entry"""
+        ttl = self.ttl(value) if callable(self.ttl) else self.ttl
+        return now + ttl
+
+    def _count(self, event: str) -> None:
+        """Count a cache event"""
+        self.stats[event] += 1
+        push_metric(CacheEventsTotal, [self.name, event])
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Return the value cached for key, or default if missing or expired"""
+        value = self._cache.get(key, default)
+        self._count(CACHE_MISS if value is default else CACHE_HIT)
+        return value
+
+    def set(self, key: Any, value: Any) -> None:
+        """Cache a value"""
+        self._cache[key] = value
+
+    def clear(self) -> None:
+        """Remove all the entries"""
+        self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
@@ -0,0 +1,106 @@
+"""Concurrency helpers"""
+
+import asyncio
+import functools
+from collections.abc import AsyncIterator, Awaitable, Callable, Hashable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Generic, TypeVar
+
+from msfwk.metrics import push_metric
+
+from automoderation.utils.metrics import CoalescedCallsTotal
+from automoderation.utils.settings import WorkerPool
+
+R = TypeVar("R")
+
+
+class KeyedLimiter:
+    """Limit the number of concurrent tasks sharing the same key
+
+    A semaphore is kept for each key only while tasks use it.
+    """
+
+    def __init__(self, limit: int) -> "KeyedLimiter":
+        """Create a limiter
+
+        Args:
+            limit (int): max number of concurrent tasks for one key
+        """
+        self.limit = max(1, limit)
+        self._semaphores: dict[Hashable, asyncio.Semaphore] = {}
+        self._users: dict[Hashable, int] = {}
+
+    @asynccontextmanager
+    async def acquire(self, key: Hashable) -> AsyncIterator[None]:
+        """Wait for a free slot for key, and hold it in the context"""
+        semaphore = self._semaphores.setdefault(key, asyncio.Semaphore(self.limit))
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with semaphore:
+                yield
+        finally:
+            self._users[key] -= 1
+            if self._users[key] == 0:
+                del self._users[key]
+                del self._semaphores[key]
+
+
+class SingleFlight(Generic[R]):
+    """Share one call between the concurrent callers asking for the same key
+
+    The first caller starts the call in its own task, the callers arriving before it completes
+    wait for the same task, and all receive its result or its exception.
+    A cancelled caller does not cancel the call of the others.
+    """
+
+    def __init__(self, name: str) -> "SingleFlight":
+        """Create a group of calls
+
+        Args:
+            name (str): label of the coalesced calls metric
+        """
+        self.name = name
+        self._calls: dict[Hashable, asyncio.Task[R]] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[R]]) -> R:
+        """Return the result of call(), or of the identical call in flight for key
+
+        Args:
+            key (Hashable): identify identical calls
+            call (Callable[[], Awaitable[R]]): the call to make if none is in flight for key
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(call())
+            self._calls[key] = task
+            task.add_done_callback(functools.partial(self._forget, key))
+        else:
+            push_metric(CoalescedCallsTotal, [self.name])
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task[R]) -> None:
+        """Remove a completed call, the next callers will make a new one"""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved, in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+
+def create_executor(worker_pool: WorkerPool, workers: int, name: str) -> Executor | None:
+    """Create a pool of workers, None for the default thread pool of the event loop
+
+    Args:
+        worker_pool (WorkerPool): threads or processes
+        workers (int): number of workers, 0 for the default thread pool
+        name (str): prefix of the thread names
+    """
+    if workers <= 0:
+        return None
+    if worker_pool == WorkerPool.Process:
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
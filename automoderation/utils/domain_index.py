@@ -0,0 +1,168 @@
+"""Domain reputation index"""
+
+import asyncio
+import time
+from enum import Enum
+from pathlib import Path
+
+import yaml
+from msfwk.utils.logging import get_logger
+
+from automoderation.utils.settings import DomainReputationSettings
+
+logger = get_logger(__name__)
+
+WILDCARD_PREFIX = "*."
+
+
+class DomainReputation(str, Enum):
+    """Verdict of the domain index on a host, without checking it"""
+
+    Trusted = "allow"
+    Blocked = "block"
+
+
+class _DomainNode:
+    """Node of the reversed label trie: the reputation of the host ending here, and of its subdomains"""
+
+    __slots__ = ("children", "host", "subdomains")
+
+    def __init__(self) -> "_DomainNode":
+        self.children: dict[str, _DomainNode] = {}
+        self.host: DomainReputation | None = None
+        self.subdomains: DomainReputation | None = None
+
+
+def normalize_host(host: str) -> str:
+    """Lower case a host, without its trailing dot"""
+    return host.strip().lower().rstrip(".")
+
+
+class DomainIndex:
+    """Reputation of hosts, indexed by their labels in reverse order (org -> example -> www)
+
+    An entry "example.org" matches this host only, "*.example.org" matches any of its subdomains.
+    The most specific matching entry wins, Blocked wins over Trusted on the same entry.
+    A lookup walks one node per label of the host.
+    """
+
+    def __init__(self, entries: dict[DomainReputation, list[str]] | None = None) -> "DomainIndex":
+        """Create an index
+
+        Args:
+            entries (dict[DomainReputation, list[str]] | None): hosts and wildcards of each reputation
+        """
+        self.root = _DomainNode()
+        self.size = 0
+        for reputation in (DomainReputation.Trusted, DomainReputation.Blocked):
+            for entry in (entries or {}).get(reputation) or []:
+                self.add(entry, reputation)
+
+    def add(self, entry: str, reputation: DomainReputation) -> None:
+        """Add a host, or a *.domain wildcard"""
+        entry = normalize_host(entry)
+        wildcard = entry.startswith(WILDCARD_PREFIX)
+        if wildcard:
+            entry = entry[len(WILDCARD_PREFIX) :]
+        node = self.root
+        for label in reversed(entry.split(".")):
+            node = node.children.setdefault(label, _DomainNode())
+        if wildcard:
+            node.subdomains = DomainReputation.Blocked if node.subdomains is DomainReputation.Blocked else reputation
+        else:
+            node.host = DomainReputation.Blocked if node.host is DomainReputation.Blocked else reputation
+        self.size += 1
+
+    def lookup(self, host: str | None) -> DomainReputation | None:
+        """Return the reputation of a host, None if it matches no entry"""
+        if not host:
+            return None
+        labels = normalize_host(host).split(".")
+        node = self.root
+        reputation = None
+        for depth in range(len(labels) - 1, -1, -1):
+            node = node.children.get(labels[depth])
+            if node is None:
+                return reputation
+            if depth and node.subdomains is not None:
+                reputation = node.subdomains
+        return node.host or reputation
+
+
+def load_domain_index(path: str) -> DomainIndex:
+    """Load an index from a YAML file with an allow and a block list of hosts and wildcards
+
+    Args:
+        path (str): path of the file
+    """
+    with Path(path).open(encoding="utf-8") as index_file:
+        content = yaml.safe_load(index_file) or {}
+    return DomainIndex({reputation: content.get(reputation.value) for reputation in DomainReputation})
+
+
+class ReloadingDomainIndex:
+    """Domain index read from a file, reloaded when the file is modified
+
+    The modification time of the file is checked at most every reload_interval seconds, during lookups.
+    The file is then read in a thread, the lookups use the previous index until the new one replaces it.
+    An invalid file is logged and the previous index is kept.
+    """
+
+    def __init__(self, settings: DomainReputationSettings) -> "ReloadingDomainIndex":
+        """Load the index, empty without a path
+
+        Args:
+            settings (DomainReputationSettings): file of the index and reload interval
+        """
+        self.path = settings.path
+        self.reload_interval = settings.reload_interval
+        self.index = DomainIndex()
+        self._mtime: float | None = None
+        self._checked_at = time.monotonic()
+        self._reload_task: asyncio.Task | None = None
+        if self.path:
+            self.reload()
+
+    def load_if_modified(self) -> DomainIndex | None:
+        """Load the file if it was modified since the last load, None if it was not or is invalid"""
+        try:
+            mtime = Path(self.path).stat().st_mtime
+            if mtime == self._mtime:
+                return None
+            # An invalid version is reported once
+            self._mtime = mtime
+            index = load_domain_index(self.path)
+        except (OSError, yaml.YAMLError, AttributeError, TypeError) as e:
+            message = f"Could not load the domain index {self.path}, keeping the previous one"
+            logger.exception(message, exc_info=e)
+            return None
+        logger.info("Loaded %s domains from %s", index.size, self.path)
+        return index
+
+    def reload(self) -> None:
+        """Load the file if it was modified since the last load, in the calling thread"""
+        if (index := self.load_if_modified()) is not None:
+            self.index = index
+
+    async def reload_in_thread(self) -> None:
+        """Load the file in a thread if it was modified, then replace the index"""
+        if (index := await asyncio.to_thread(self.load_if_modified)) is not None:
+            self.index = index
+
+    def schedule_reload(self) -> None:
+        """Start a reload without blocking the event loop, unless one is already running"""
+        if self._reload_task is not None and not self._reload_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.reload()
+            return
+        self._reload_task = loop.create_task(self.reload_in_thread())
+
+    def lookup(self, host: str | None) -> DomainReputation | None:
+        """Return the reputation of a host, None if it matches no entry"""
+        if self.path and time.monotonic() - self._checked_at >= self.reload_interval:
+            self._checked_at = time.monotonic()
+            self.schedule_reload()
+        return self.index.lookup(host)
@@ -0,0 +1,53 @@
+"""Shared HTTP client"""
+
+import httpx
+from msfwk.utils.logging import get_logger
+
+from automoderation.utils.settings import HttpClientSettings
+
+logger = get_logger(__name__)
+
+_client: httpx.AsyncClient | None = None
+
+
+def create_http_client(settings: HttpClientSettings) -> httpx.AsyncClient:
+    """Create a keep-alive HTTP client, with one connection pool per host
+
+    Args:
+        settings (HttpClientSettings): pool limits
+    """
+    limits = httpx.Limits(
+        max_connections=settings.max_connections,
+        max_keepalive_connections=settings.max_keepalive_connections,
+        keepalive_expiry=settings.keepalive_expiry,
+    )
+    return httpx.AsyncClient(limits=limits)
+
+
+async def start_http_client(settings: HttpClientSettings) -> httpx.AsyncClient:
+    """Create the client shared by the moderation modules
+
+    Args:
+        settings (HttpClientSettings): pool limits
+    """
+    global _client
+    await close_http_client()
+    _client = create_http_client(settings)
+    logger.info("Shared HTTP client started with %s", settings)
+    return _client
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared client, created with the default limits if it was not started"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client(HttpClientSettings())
+    return _client
+
+
+async def close_http_client() -> None:
+    """Close the shared client and its pooled connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
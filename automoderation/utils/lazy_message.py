@@ -0,0 +1,80 @@
+"""Partial decoding of DespMQMessage"""
+
+from collections.abc import Collection
+
+import aio_pika
+import orjson
+from msfwk.context import current_token, current_transaction
+from msfwk.desp.rabbitmq.mq_message import (
+    COOKIE_ACCESS_TOKEN_KEY,
+    TRANSACTION_ID_HEADER_KEY,
+    DespMQMessage,
+    MQContentType,
+    update_context,
+)
+from msfwk.utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class LazyDespMQMessage(DespMQMessage):
+    """DespMQMessage whose contents are validated only for some content types
+
+    The contents of the other types are kept as decoded JSON, never validated
+    nor visible in content.data_by_type, and are spliced back in the payload when the message is forwarded.
+    """
+
+    raw_data_by_type: dict[str, list] = {}
+
+    @classmethod
+    def from_body(cls, body: dict, content_types: Collection[MQContentType]) -> "LazyDespMQMessage":
+        """Build a message from its decoded JSON body
+
+        Args:
+            body (dict): decoded payload of a DespMQMessage
+            content_types (Collection[MQContentType]): types of the contents to validate
+        """
+        content = body.get("content") or {}
+        kept_types = {content_type.value for content_type in content_types}
+        kept, raw = {}, {}
+        for content_type, contents in (content.get("data_by_type") or {}).items():
+            (kept if content_type in kept_types else raw)[content_type] = contents
+        mq_message = cls.from_dict({**body, "content": {**content, "data_by_type": kept}})
+        mq_message.raw_data_by_type = raw
+        return mq_message
+
+    def to_dict(self) -> dict:
+        """Serialize the message, with the contents which were not validated"""
+        payload = super().to_dict()
+        payload["content"]["data_by_type"].update(self.raw_data_by_type)
+        return payload
+
+    def as_payload(self) -> str:
+        """Serialize the message to JSON"""
+        return orjson.dumps(self.to_dict(), option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def decode_lazy_message(
+    message: aio_pika.IncomingMessage, content_types: Collection[MQContentType]
+) -> LazyDespMQMessage | None:
+    """Decode a consumed message like decode_consume_message, validating only the contents of content_types
+
+    Args:
+        message (aio_pika.IncomingMessage): message delivered by the consumer
+        content_types (Collection[MQContentType]): types of the contents read by the modules
+
+    Returns:
+        LazyDespMQMessage | None: the message, None if it must go through decode_consume_message,
+            which reports the invalid messages
+    """
+    try:
+        transaction_id = message.headers[TRANSACTION_ID_HEADER_KEY]
+        token = message.headers[COOKIE_ACCESS_TOKEN_KEY]
+        mq_message = LazyDespMQMessage.from_body(orjson.loads(message.body), content_types)
+    except Exception as e:
+        logger.debug("Cannot decode the message lazily (%s), decoding it fully", e)
+        return None
+    current_transaction.set(transaction_id)
+    current_token.set(token)
+    update_context("transaction_id", transaction_id)
+    return mq_message
@@ -0,0 +1,139 @@
+"""Lexical pre-filter"""
+
+import re
+from collections import deque
+from collections.abc import Iterable, Iterator
+from enum import Enum
+
+from msfwk.metrics import push_metric
+
+from automoderation.utils.metrics import PrefilterDecisionsTotal
+from automoderation.utils.settings import LexicalPrefilterSettings
+from automoderation.utils.text_utils import normalize_text
+
+# Latin letters, digits and common punctuation, anything else may hide a term
+SAFE_CHARSET = re.compile(r"[A-Za-zÀ-ÖØ-öø-ÿ0-9\s.,;:!?'\"()\-]*")
+# Digits inside words, like in leetspeak
+MIXED_WORD = re.compile(r"[^\W\d_]\d|\d[^\W\d_]")
+
+
+def normalize_term(text: str) -> str:
+    """Normalize a text or a term for matching"""
+    return normalize_text(text).casefold()
+
+
+class TermMatcher:
+    """Find the whole word occurrences of several terms in a single pass over a text (Aho-Corasick automaton)"""
+
+    def __init__(self, terms: Iterable[str]) -> "TermMatcher":
+        """Build the automaton
+
+        Args:
+            terms (Iterable[str]): words or expressions to find, matched on their normalized form
+        """
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[tuple[str, ...]] = [()]
+        for term in map(normalize_term, terms):
+            if term:
+                self._add(term)
+        self._link()
+
+    def _add(self, term: str) -> None:
+        """Add the states spelling a term"""
+        state = 0
+        for char in term:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        if term not in self._output[state]:
+            self._output[state] += (term,)
+
+    def _link(self) -> None:
+        """Compute the failure links breadth first, and merge the outputs of the suffixes"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> Iterator[str]:
+        """Yield the terms found as whole words in a normalized text, in the order they end
+
+        Args:
+            text (str): text normalized with normalize_term
+        """
+        state = 0
+        goto, fail, output = self._goto, self._fail, self._output
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for term in output[state]:
+                start = end - len(term) + 1
+                before_is_boundary = start == 0 or not text[start - 1].isalnum()
+                after_is_boundary = end + 1 == len(text) or not text[end + 1].isalnum()
+                if before_is_boundary and after_is_boundary:
+                    yield term
+
+
+class PrefilterDecision(str, Enum):
+    """Decision of the pre-filter on a text, and why it goes to the model otherwise"""
+
+    Blocked = "blocked"
+    Passed = "passed"
+    SuspiciousTerm = "suspicious_term"
+    Long = "long"
+    Charset = "charset"
+
+
+class LexicalPrefilter:
+    """Decide the obvious texts without the toxicity model
+
+    Texts containing a blocked term are Blocked. Short texts made of latin letters and
+    common punctuation, without any blocked or suspicious term, are Passed.
+    Every other text is left to the model, the decisions are counted by path.
+    """
+
+    def __init__(self, settings: LexicalPrefilterSettings) -> "LexicalPrefilter":
+        """Build the matchers of the terms
+
+        Args:
+            settings (LexicalPrefilterSettings): terms and max length of the passed texts
+        """
+        self.max_pass_chars = settings.max_pass_chars
+        self.blocked = TermMatcher(settings.blocked_terms)
+        self.suspicious = TermMatcher(settings.suspicious_terms)
+
+    def decide(self, text: str) -> tuple[PrefilterDecision, str | None]:
+        """Return the decision on a text, and the blocked term it contains
+
+        Args:
+            text (str): plain text of a content
+        """
+        decision, term = self._decide(text)
+        push_metric(PrefilterDecisionsTotal, [decision.value])
+        return decision, term
+
+    def _decide(self, text: str) -> tuple[PrefilterDecision, str | None]:
+        """Return the decision on a text, and the blocked term it contains"""
+        normalized = normalize_term(text)
+        if (term := next(self.blocked.find(normalized), None)) is not None:
+            return PrefilterDecision.Blocked, term
+        if len(normalized) > self.max_pass_chars:
+            return PrefilterDecision.Long, None
+        if not SAFE_CHARSET.fullmatch(normalized) or MIXED_WORD.search(normalized):
+            return PrefilterDecision.Charset, None
+        if next(self.suspicious.find(normalized), None) is not None:
+            return PrefilterDecision.SuspiciousTerm, None
+        return PrefilterDecision.Passed, None
@@ -0,0 +1,225 @@
+"""Markdown to plain text"""
+
+import contextlib
+import re
+from collections.abc import Callable, Iterator
+from html.entities import html5
+from html.parser import HTMLParser
+
+TAB_LENGTH = 4
+HTML_FEED_SIZE = 64 * 1024
+LARGE_TEXT_SIZE = 256 * 1024
+
+# Anything that markdown could render differently than a plain paragraph,
+# trailing tabs included: expanded, they may end the line with the two spaces of a line break
+MARKDOWN_SYNTAX = re.compile(r"[\\`*_\[\]<>&#\x02\x03\f\v]|^[ \t]|^[-+=]|^\d+\.|  $|\t[ \t]*$", re.MULTILINE)
+# Blank lines followed by a block that cannot continue the previous one
+SAFE_BLOCK_BOUNDARY = re.compile(r"\n[ \t]*\n(?=[^\s\-+*>\[<\d])")
+# Raw html, entities and reference links are resolved across the whole document
+DOCUMENT_WIDE_SYNTAX = re.compile(r"[<&]|^ {0,3}\[[^\]]+\]:", re.MULTILINE)
+
+# Text nodes of BeautifulSoup(html, "html.parser")
+ASCII_SPACES = " \n\t\f\r"
+PRESERVE_WHITESPACE_TAGS = frozenset(("pre", "textarea"))
+
+# Numeric character references
+DECIMAL_CHARREF = re.compile(r"([0-9]+)(.*)", re.DOTALL)
+HEX_CHARREF = re.compile(r"([0-9a-f]+)(.*)", re.DOTALL)
+REPLACEMENT_CHARACTER = "\ufffd"
+MAX_CODE_POINT = 0x10FFFF
+SURROGATES = (0xD800, 0xDFFF)
+C1_CONTROLS = (0x80, 0x9F)
+
+
+def decode_charref(name: str) -> str:
+    """Decode the number of a numeric character reference like BeautifulSoup
+
+    Unlike html.unescape, the control characters and the noncharacters are kept.
+    A number followed by other characters (&#12ab) is decoded, and the characters are kept as text.
+
+    Args:
+        name (str): the reference without &# and ;
+    """
+    base, digits = 10, DECIMAL_CHARREF
+    if name[:1] in ("x", "X"):
+        base, digits, name = 16, HEX_CHARREF, name[1:]
+    extra = ""
+    try:
+        number = int(name, base)
+    except ValueError:
+        if (match := digits.match(name)) is None:
+            return name
+        number, extra = int(match.group(1), base), match.group(2)
+    if number == 0 or number > MAX_CODE_POINT or SURROGATES[0] <= number <= SURROGATES[1]:
+        return REPLACEMENT_CHARACTER + extra
+    if C1_CONTROLS[0] <= number <= C1_CONTROLS[1]:
+        # References to C1 controls are usually windows-1252 characters
+        with contextlib.suppress(UnicodeDecodeError):
+            return bytes([number]).decode("cp1252") + extra
+    return chr(number) + extra
+
+
+class HtmlTextCollector(HTMLParser):
+    """Stream the text nodes of an html document, without building a tree
+
+    Produces the same text as "".join(BeautifulSoup(html, "html.parser").findAll(text=True)):
+    comments, declarations and processing instructions are text nodes,
+    entities are decoded and whitespace-only nodes are collapsed outside of pre and textarea.
+    """
+
+    def __init__(self, sink: Callable[[str], None]) -> "HtmlTextCollector":
+        """Create a collector
+
+        Args:
+            sink (Callable[[str], None]): receives each text node
+        """
+        super().__init__(convert_charrefs=False)
+        self._sink = sink
+        self._node: list[str] = []
+        self._preserve_whitespace = 0
+
+    def _end_node(self) -> None:
+        """Send the current text node to the sink"""
+        if not self._node:
+            return
+        data = "".join(self._node)
+        self._node = []
+        if not self._preserve_whitespace and not data.strip(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+        self._sink(data)
+
+    def _add_node(self, data: str) -> None:
+        """Send a text node which is not plain data (comment, declaration...)"""
+        self._end_node()
+        self._node.append(data)
+        self._end_node()
+
+    def handle_starttag(self, tag: str, _attrs: list) -> None:
+        """Close the current node"""
+        self._end_node()
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_whitespace += 1
+
+    def handle_endtag(self, tag: str) -> None:
+        """Close the current node"""
+        self._end_node()
+        if tag in PRESERVE_WHITESPACE_TAGS and self._preserve_whitespace:
+            self._preserve_whitespace -= 1
+
+    def handle_startendtag(self, tag: str, attrs: list) -> None:
+        """Close the current node"""
+        self.handle_starttag(tag, attrs)
+        self.handle_endtag(tag)
+
+    def handle_data(self, data: str) -> None:
+        """Extend the current node"""
+        self._node.append(data)
+
+    def handle_charref(self, name: str) -> None:
+        """Decode a numeric character reference, a reference followed by other characters keeps them"""
+        self._node.append(decode_charref(name))
+
+    def handle_entityref(self, name: str) -> None:
+        """Decode a named character reference, unknown ones are kept without their semicolon"""
+        self._node.append(html5.get(f"{name};", f"&{name}"))
+
+    def handle_comment(self, data: str) -> None:
+        """A comment is a text node"""
+        self._add_node(data)
+
+    def handle_decl(self, decl: str) -> None:
+        """A doctype is a text node"""
+        self._add_node(decl[len("DOCTYPE ") :])
+
+    def unknown_decl(self, data: str) -> None:
+        """A CDATA section is a text node"""
+        self._add_node(data[len("CDATA[") :] if data.upper().startswith("CDATA[") else data)
+
+    def handle_pi(self, data: str) -> None:
+        """A processing instruction is a text node"""
+        self._add_node(data)
+
+    def close(self) -> None:
+        """Flush the last node"""
+        super().close()
+        self._end_node()
+
+
+def html_to_text(document: str) -> str:
+    """Return the text nodes of an html document
+
+    Args:
+        document (str): html document
+    """
+    nodes: list[str] = []
+    collector = HtmlTextCollector(nodes.append)
+    for start in range(0, len(document), HTML_FEED_SIZE):
+        collector.feed(document[start : start + HTML_FEED_SIZE])
+    collector.close()
+    return "".join(nodes)
+
+
+def plain_text_to_text(text: str) -> str:
+    """Return what markdown rendering keeps of a text without any markdown syntax
+
+    Paragraphs are separated by blank lines, and rendered one per line.
+
+    Args:
+        text (str): text without markdown syntax, with \\n line endings
+    """
+    paragraphs: list[str] = []
+    lines: list[str] = []
+    for line in [*text.split("\n"), ""]:
+        if line.strip(" \t"):
+            lines.append(line.expandtabs(TAB_LENGTH))
+        elif lines:
+            # Like markdown, strip the leading unicode whitespace of a paragraph, and drop it if nothing is left
+            if paragraph := "\n".join(lines).lstrip():
+                paragraphs.append(paragraph)
+            lines = []
+    return "\n".join(paragraphs)
+
+
+def split_markdown_blocks(text: str, max_size: int) -> Iterator[str]:
+    """Split a large markdown document into parts that render the same independently
+
+    Splits only on blank lines followed by a plain paragraph, and never documents
+    containing raw html, entities or reference links.
+
+    Args:
+        text (str): markdown text, with \\n line endings
+        max_size (int): size above which a part is split
+    """
+    if len(text) <= max_size or DOCUMENT_WIDE_SYNTAX.search(text):
+        yield text
+        return
+    start = 0
+    for boundary in SAFE_BLOCK_BOUNDARY.finditer(text):
+        if boundary.start() - start >= max_size:
+            yield text[start : boundary.start()]
+            start = boundary.end()
+    yield text[start:]
+
+
+def extract_text(text: str) -> str:
+    """Render a markdown text and keep only its text nodes
+
+    Equivalent to BeautifulSoup(markdown(text), "html.parser") text nodes. Texts without markdown
+    syntax are not rendered at all. The others are still rendered to html by markdown, then their
+    html is streamed through a parser instead of being built into a tree. Large documents are
+    rendered by parts, except the ones containing raw html, entities or reference links, which are
+    rendered whole: their memory grows with their size.
+
+    Args:
+        text (str): markdown text
+
+    Returns:
+        str: the plain text
+    """
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    if MARKDOWN_SYNTAX.search(text) is None:
+        return plain_text_to_text(text)
+    # Imported on the first markdown text, to keep it out of the startup of the service
+    from markdown import markdown
+
+    return "\n".join(html_to_text(markdown(part)) for part in split_markdown_blocks(text, LARGE_TEXT_SIZE))
@@ -0,0 +1,201 @@
+"""Automoderation metrics"""
+
+from msfwk.metrics import AcriCounter, AcriGauge, AcriHistogram, register_metric
+from prometheus_client import CollectorRegistry
+
+
+class CacheEventsTotal(AcriCounter):
+    """Counter: hits, misses and evictions of the automoderation caches"""
+
+    _id = "automoderation_cache_events_total"
+
+    @classmethod
+    def custom_init(cls, registry: CollectorRegistry) -> "CacheEventsTotal":
+        """Create the metric"""
+        return cls(
+            name=cls._id,
+            documentation="Counter: Number of hit, miss and eviction for each automoderation cache",
+            labelnames=["cache", "event"],
+            registry=registry,
+        )
+
+
+register_metric(CacheEventsTotal)
+
+
+class StageDurationSeconds(AcriHistogram):
+    """Histogram: duration of each stage of the processing of a message, by module"""
+
+    _id = "automoderation_stage_duration_seconds"
+
+    @classmethod
+    def custom_init(cls, registry: CollectorRegistry) -> "StageDurationSeconds":
+        """Create the metric"""
+        return cls(
+            name=cls._id,
+            documentation="Histogram: Duration of the decode, preprocess, backend, analyze, ack and publish stages",
+            labelnames=["module", "stage"],
+            registry=registry,
+        )
+
+
+class ModuleMessagesTotal(AcriCounter):
+    """Counter: messages analyzed by each module, by resulting status"""
+
+    _id = "automoderation_messages_total"
+
+    @classmethod
+    def custom_init(cls, registry: CollectorRegistry) -> "ModuleMessagesTotal":
+        """Create the metric"""
+        return cls(
+            name=cls._id,
+            documentation="Counter: Number of messages analyzed by each module, by status",
+            labelnames=["module", "status"],
+            registry=registry,
+        )
+
+
+class ModuleContentsTotal(AcriCounter):
+    """Counter: contents analyzed by each module"""
+
+    _id = "automoderation_contents_total"
+
+    @classmethod
+    def custom_init(cls, registry: CollectorRegistry) -> "ModuleContentsTotal":
+        """Create the metric"""
+        return cls(
+            name=cls._id,
+            documentation="Counter: Number of contents analyzed by each module",
+            labelnames=["module"],
+            registry=registry,
+        )
+
+
+class ModuleInFlight(AcriGauge):
+    """Gauge: messages being analyzed by each module"""
+
+    _id = "automoderation_messages_in_flight"
+
+    @classmethod
+    def custom_init(cls, registry: CollectorRegistry) -> "ModuleInFlight":
+        """Create the metric"""
+        return cls(
+            name=cls._id,
+            documentation="Gauge: Number of messages being analyzed by each module",
+            labelnames=["module"],
+            registry=registry,
+        )
+
+
+class BackendErrorsTotal(AcriCounter):
+    """Counter: errors and timeouts of the backends called by the modules"""
+
+    _id = "automoderation_backend_errors_total"
+
+    @classmethod
+    def custom_init(cls, registry: CollectorRegistry) -> "BackendErrorsTotal":
+        """Create the metric"""
+        return cls(
+            name=cls._id,
+            documentation="Counter: Number of errors and timeouts of each backend (toxicity model, url checks)",
+            labelnames=["module", "backend", "error"],
+            registry=registry,
+        )
+
+
+register_metric(StageDurationSeconds)
+register_metric(ModuleMessagesTotal)
+register_metric(ModuleContentsTotal)
+register_metric(ModuleInFlight)
+register_metric(BackendErrorsTotal)
+
+
+class CoalescedCallsTotal(AcriCounter):
+    """Counter: calls which shared the result of an identical call in flight"""
+
+    _id = "automoderation_coalesced_calls_total"
+
+    @classmethod
+    def custom_init(cls, registry: CollectorRegistry) -> "CoalescedCallsTotal":
+        """Create the metric"""
+        return cls(
+            name=cls._id,
+            documentation="Counter: Number of calls which waited for an identical call in flight instead of a backend",
+            labelnames=["name"],
+            registry=registry,
+        )
+
+
+register_metric(CoalescedCallsTotal)
+
+
+class CircuitStateGauge(AcriGauge):
+    """Gauge: state of each circuit breaker, 0 closed, 1 half open, 2 open"""
+
+    _id = "automoderation_circuit_state"
+
+    @classmethod
+    def custom_init(cls, registry: CollectorRegistry) -> "CircuitStateGauge":
+        """Create the metric"""
+        return cls(
+            name=cls._id,
+            documentation="Gauge: State of each circuit breaker, 0 closed, 1 half open, 2 open",
+            labelnames=["name"],
+            registry=registry,
+        )
+
+
+class CircuitTransitionsTotal(AcriCounter):
+    """Counter: transitions of each circuit breaker, by new state"""
+
+    _id = "automoderation_circuit_transitions_total"
+
+    @classmethod
+    def custom_init(cls, registry: CollectorRegistry) -> "CircuitTransitionsTotal":
+        """Create the metric"""
+        return cls(
+            name=cls._id,
+            documentation="Counter: Number of transitions of each circuit breaker, by new state",
+            labelnames=["name", "state"],
+            registry=registry,
+        )
+
+
+class HedgedRequestsTotal(AcriCounter):
+    """Counter: second requests sent to a slow backend, by request which answered first"""
+
+    _id = "automoderation_hedged_requests_total"
+
+    @classmethod
+    def custom_init(cls, registry: CollectorRegistry) -> "HedgedRequestsTotal":
+        """Create the metric"""
+        return cls(
+            name=cls._id,
+            documentation="Counter: Number of hedged requests to each backend, by winner (primary, hedge, none)",
+            labelnames=["backend", "winner"],
+            registry=registry,
+        )
+
+
+register_metric(CircuitStateGauge)
+register_metric(CircuitTransitionsTotal)
+register_metric(HedgedRequestsTotal)
+
+
+class PrefilterDecisionsTotal(AcriCounter):
+    """Counter: texts decided by the lexical pre-filter, or left to the model, by decision path"""
+
+    _id = "automoderation_prefilter_decisions_total"
+
+    @classmethod
+    def custom_init(cls, registry: CollectorRegistry) -> "PrefilterDecisionsTotal":
+        """Create the metric"""
+        return cls(
+            name=cls._id,
+            documentation="Counter: Number of texts blocked, passed or left to the model by the lexical pre-filter",
+            labelnames=["decision"],
+            registry=registry,
+        )
+
+
+register_metric(PrefilterDecisionsTotal)
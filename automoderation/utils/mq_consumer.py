@@ -0,0 +1,109 @@
+"""RabbitMQ consumer"""
+
+import asyncio
+import contextlib
+from collections.abc import Awaitable, Callable
+
+import aio_pika
+from msfwk.mqclient import AMQPConnectionError, MQClient, MQClientConnectionError, send_error_message
+from msfwk.utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+RECONNECT_DELAY = 5
+
+
+async def consume_queue(
+    queue_name: str,
+    on_message: Callable[[aio_pika.IncomingMessage], Awaitable[None]],
+    prefetch_count: int,
+    stopping: asyncio.Event | None = None,
+    drain_timeout: float = 0,
+) -> None:
+    """Consume a queue until stopping is set, with prefetch_count unacked messages at most
+
+    Same as msfwk consume_mq_queue, which always prefetches a single message.
+    Each delivered message is handled in its own task. Reconnects if the connection is lost.
+    A message whose handling raises is requeued once, then sent to the error queue and acked,
+    so it does not hold a prefetch slot and is not lost.
+    Once stopping is set, no more message is delivered, and the messages being handled have
+    drain_timeout seconds to finish before the connection is closed. The unfinished ones are redelivered.
+
+    Args:
+        queue_name (str): The name of the RabbitMQ queue to consume from.
+        on_message (Callable[[aio_pika.IncomingMessage], Awaitable[None]]): handles an incoming message
+        prefetch_count (int): max number of messages delivered and not acked yet
+        stopping (asyncio.Event | None): stops the consumer when set. Default to None -> consume until cancelled
+        drain_timeout (float): max time (in seconds) waited for the messages being handled once stopping
+    """
+    stopping = stopping or asyncio.Event()
+    in_flight: set[asyncio.Task] = set()
+
+    async def handle(message: aio_pika.IncomingMessage) -> None:
+        task = asyncio.current_task()
+        in_flight.add(task)
+        try:
+            await on_message(message)
+        except Exception as e:
+            await reject(queue_name, message, e)
+        finally:
+            in_flight.discard(task)
+
+    while not stopping.is_set():
+        client = MQClient()
+        try:
+            await client.setup()
+            channel = await client.connection.channel()
+            await channel.set_qos(prefetch_count=max(1, prefetch_count))
+            queue = await channel.declare_queue(queue_name, durable=True)
+            consumer_tag = await queue.consume(handle)
+            logger.info("Consuming %s with a prefetch of %s messages", queue_name, prefetch_count)
+            await stopping.wait()
+            await queue.cancel(consumer_tag)
+            await drain(queue_name, in_flight, drain_timeout)
+        except (MQClientConnectionError, AMQPConnectionError, aio_pika.exceptions.ChannelClosed) as e:
+            message = f"Lost connection to RabbitMQ while consuming {queue_name}, reconnecting in {RECONNECT_DELAY}s"
+            logger.exception(message, exc_info=e)
+        finally:
+            await client.close()
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(stopping.wait(), RECONNECT_DELAY)
+    logger.info("Stopped consuming %s", queue_name)
+
+
+async def reject(queue_name: str, message: aio_pika.IncomingMessage, error: Exception) -> None:
+    """Settle a message which could not be handled
+
+    Requeued on its first delivery. On its redelivery, sent to the error queue like the messages
+    decode_consume_message cannot decode, then acked.
+    """
+    requeue = not message.redelivered
+    action = "requeuing it" if requeue else "sending it to the error queue"
+    log_message = f"Failed to handle a message of {queue_name}, {action}"
+    logger.exception(log_message, exc_info=error)
+    if message.processed:
+        return
+    try:
+        if requeue:
+            await message.nack(requeue=True)
+            return
+        await send_error_message(message.body.decode(errors="replace"), f"{error.__class__.__name__}: {error}")
+        await message.ack()
+    except (AMQPConnectionError, aio_pika.exceptions.ChannelClosed) as e:
+        # The message is redelivered anyway once the connection is closed
+        logger.warning("Could not settle a message of %s: %s", queue_name, e)
+
+
+async def drain(queue_name: str, in_flight: set[asyncio.Task], timeout: float) -> None:
+    """Wait for the messages being handled, at most timeout seconds"""
+    if not in_flight:
+        return
+    logger.info("Waiting for %s messages of %s to be handled", len(in_flight), queue_name)
+    _, pending = await asyncio.wait(set(in_flight), timeout=max(0, timeout))
+    if pending:
+        # Messages are acked after their publish: the cancelled ones are redelivered once the connection is closed,
+        # and one cancelled between its publish and its ack may be published twice, but none is lost
+        logger.warning("%s messages of %s were not handled within %ss", len(pending), queue_name, timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.wait(pending)
@@ -0,0 +1,132 @@
+"""Backend resilience"""
+
+import math
+import time
+from collections import deque
+from enum import Enum
+
+from msfwk.metrics import push_metric
+from msfwk.utils.logging import get_logger
+
+from automoderation.utils.metrics import CircuitStateGauge, CircuitTransitionsTotal
+
+logger = get_logger(__name__)
+
+
+class LatencyTracker:
+    """Latencies of the last calls to a backend, and their percentiles"""
+
+    def __init__(self, window: int) -> "LatencyTracker":
+        """Create a tracker
+
+        Args:
+            window (int): number of latencies kept
+        """
+        self._latencies: deque[float] = deque(maxlen=max(1, window))
+        self._sorted: list[float] | None = None
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def add(self, latency: float) -> None:
+        """Record the latency (in seconds) of a call"""
+        self._latencies.append(latency)
+        self._sorted = None
+
+    def percentile(self, quantile: float) -> float | None:
+        """Return the latency below which quantile of the calls answered, None without any call
+
+        Args:
+            quantile (float): between 0 and 1, 0.99 for the p99
+        """
+        if not self._latencies:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self._latencies)
+        rank = math.ceil(quantile * len(self._sorted)) - 1
+        return self._sorted[min(max(rank, 0), len(self._sorted) - 1)]
+
+
+class CircuitState(str, Enum):
+    """State of a circuit breaker"""
+
+    Closed = "closed"
+    HalfOpen = "half_open"
+    Open = "open"
+
+
+CIRCUIT_STATE_VALUES = {CircuitState.Closed: 0, CircuitState.HalfOpen: 1, CircuitState.Open: 2}
+
+
+class CircuitBreaker:
+    """Stop calling a failing backend for a while
+
+    Closed: calls go through, failure_threshold consecutive failures open the circuit
+    Open: calls are rejected, recovery_timeout seconds after opening the circuit is half open
+    HalfOpen: a single probe call goes through, its success closes the circuit and its failure opens it again
+    """
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float) -> "CircuitBreaker":
+        """Create a closed circuit breaker
+
+        Args:
+            name (str): label of the circuit metrics
+            failure_threshold (int): number of consecutive failures opening the circuit
+            recovery_timeout (float): time (in seconds) before probing the backend of an open circuit
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.state = CircuitState.Closed
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        push_metric(CircuitStateGauge, [name], CIRCUIT_STATE_VALUES[self.state])
+
+    def _transition(self, state: CircuitState) -> None:
+        """Change the state, and make it observable"""
+        if state is self.state:
+            return
+        log = logger.warning if state is CircuitState.Open else logger.info
+        log("Circuit %s: %s -> %s", self.name, self.state.value, state.value)
+        push_metric(CircuitStateGauge, [self.name], CIRCUIT_STATE_VALUES[state] - CIRCUIT_STATE_VALUES[self.state])
+        push_metric(CircuitTransitionsTotal, [self.name, state.value])
+        self.state = state
+
+    @property
+    def rejecting(self) -> bool:
+        """Whether the circuit is open and still recovering, calls are rejected"""
+        return self.state is CircuitState.Open and time.monotonic() - self._opened_at < self.recovery_timeout
+
+    def allow(self) -> bool:
+        """Whether a call can go through now, a call allowed on a half open circuit is its probe
+
+        The caller must then record_success, record_failure or release.
+        """
+        if self.rejecting:
+            return False
+        if self.state is CircuitState.Open:
+            self._transition(CircuitState.HalfOpen)
+        if self.state is CircuitState.HalfOpen:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        """A call succeeded, close the circuit"""
+        self.failures = 0
+        self._probing = False
+        self._transition(CircuitState.Closed)
+
+    def record_failure(self) -> None:
+        """A call failed, open the circuit after failure_threshold failures or a failed probe"""
+        self.failures += 1
+        if self.state is CircuitState.HalfOpen or self.failures >= self.failure_threshold:
+            self._probing = False
+            self._opened_at = time.monotonic()
+            self._transition(CircuitState.Open)
+
+    def release(self) -> None:
+        """A call was cancelled without an outcome, let another call probe the backend"""
+        self._probing = False
@@ -0,0 +1,293 @@
+"""Automoderation settings"""
+
+from enum import Enum
+
+from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus
+from msfwk.utils.config import read_config
+from pydantic import BaseModel, ConfigDict, model_validator
+
+# Time (in seconds) given to a consumer to close its connection, after its drain_timeout
+STOP_MARGIN = 5
+
+
+class HttpClientSettings(BaseModel):
+    """Connection pool of the shared HTTP client"""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30
+
+
+class ResultCacheSettings(BaseModel):
+    """Cache of the toxicity status of already evaluated texts"""
+
+    enabled: bool = True
+    maxsize: int = 10000
+    ttl: float = 3600
+    redis_host: str = ""
+    redis_port: int = 6379
+    redis_db: int = 0
+
+
+class ChunkingSettings(BaseModel):
+    """Split of long texts into chunks of sentences, scored batch_size chunks at a time"""
+
+    enabled: bool = True
+    max_chunk_chars: int = 1000
+    batch_size: int = 8
+
+
+class LexicalPrefilterSettings(BaseModel):
+    """Decision of the obvious texts without the toxicity model, see LexicalPrefilter
+
+    blocked_terms: texts containing one of these words or expressions Fail
+    suspicious_terms: texts containing one of these always go to the model
+    max_pass_chars: texts up to this length, in latin letters and without any term, Pass
+    """
+
+    enabled: bool = False
+    blocked_terms: list[str] = []
+    suspicious_terms: list[str] = []
+    max_pass_chars: int = 40
+
+
+class IncrementalModerationSettings(BaseModel):
+    """Re-moderation of edited texts, see SentenceStatusStore
+
+    The texts longer than toxicity_chunking.max_chunk_chars are scored sentence by sentence,
+    and the status of each sentence of the last version of a content is stored, so that
+    only the new or changed sentences of an edit are scored.
+    """
+
+    enabled: bool = False
+    maxsize: int = 10000
+    ttl: float = 7 * 24 * 3600
+    redis_host: str = ""
+    redis_port: int = 6379
+    redis_db: int = 0
+
+
+class UrlVerdictCacheSettings(BaseModel):
+    """Cache of the url checks, with a time to live for each status"""
+
+    enabled: bool = True
+    maxsize: int = 10000
+    pass_ttl: float = 3600
+    failed_ttl: float = 600
+    need_manual_ttl: float = 30
+
+
+class DnsCacheSettings(BaseModel):
+    """Cache of the hostname resolutions, unknown hosts are kept negative_ttl seconds"""
+
+    maxsize: int = 2048
+    ttl: float = 300
+    negative_ttl: float = 60
+
+
+class DomainReputationSettings(BaseModel):
+    """File of the trusted and blocked domains, see DomainIndex
+
+    path: YAML file with an "allow" and a "block" list of hosts and *.domain wildcards, empty for none
+    reload_interval: seconds between two checks of the modification of the file
+    """
+
+    path: str = ""
+    reload_interval: float = 30
+
+
+class UrlValidationSettings(BaseModel):
+    """Limits and caches of the url checks"""
+
+    timeout: float = 2
+    max_concurrency: int = 64
+    max_per_host: int = 4
+    verdict_cache: UrlVerdictCacheSettings = UrlVerdictCacheSettings()
+    dns_cache: DnsCacheSettings = DnsCacheSettings()
+    domain_reputation: DomainReputationSettings = DomainReputationSettings()
+
+
+class ModelBackend(str, Enum):
+    """Where the toxicity model runs"""
+
+    Remote = "remote"
+    Local = "local"
+
+
+class PipelineMode(str, Enum):
+    """How a message goes through its auto moderations
+
+    Chained: each module consumes its own queue and publishes the message to the next module queue
+    Fused: the module consuming a message runs the following modules in process, and publishes once to handling
+    Parallel: like Fused, but all the routed modules run concurrently, each within module_timeout
+    """
+
+    Chained = "chained"
+    Fused = "fused"
+    Parallel = "parallel"
+
+
+class WorkerPool(str, Enum):
+    """Pool running the CPU bound preprocessing of a module"""
+
+    Thread = "thread"
+    Process = "process"
+
+
+class ModuleSettings(BaseModel):
+    """Consumer of a moderation module, read from services.automoderation.modules.<AutoModerationType>
+
+    prefetch_count: max number of unacked messages delivered by RabbitMQ
+    max_concurrency: max number of messages analyzed at once
+    workers: size of the pool of the CPU bound preprocessing, 0 to use the default thread pool
+    processes: number of processes consuming the queue of the module under automoderation.supervisor
+    """
+
+    prefetch_count: int = 10
+    max_concurrency: int = 10
+    workers: int = 0
+    worker_pool: WorkerPool = WorkerPool.Thread
+    processes: int = 1
+
+
+class SupervisorSettings(BaseModel):
+    """Worker processes of automoderation.supervisor
+
+    metrics_port: port serving the metrics aggregated over the workers, 0 to disable
+    metrics_dir: directory of the metric files written by the workers. Default to a temporary directory
+    restart_delay: delay before restarting a crashed worker, doubled at each consecutive crash up to max_restart_delay
+    drain_timeout: time given to the workers to finish their messages after a SIGTERM, before they are killed
+    max_startup_failures: consecutive workers of a slot exiting with an error before they start consuming,
+        after which the supervisor stops: the error comes from the configuration. 0 to always restart them
+    """
+
+    metrics_port: int = 9100
+    metrics_dir: str = ""
+    restart_delay: float = 1
+    max_restart_delay: float = 60
+    drain_timeout: float = 30
+    max_startup_failures: int = 5
+
+
+class LocalModelSettings(BaseModel):
+    """Toxicity model running in process, see OnnxToxicityModel"""
+
+    # model_path and model_version are not pydantic attributes
+    model_config = ConfigDict(protected_namespaces=())
+
+    model_path: str = ""
+    tokenizer_path: str = ""
+    model_version: str = ""
+    labels: list[str] = ["toxicity", "severe_toxicity", "obscene", "threat", "insult", "identity_attack"]
+    apply_sigmoid: bool = True
+    max_length: int = 256
+    batch_size: int = 32
+    batch_max_wait_ms: float = 5
+    inference_threads: int = 1
+    intra_op_threads: int = 0
+
+
+class DetoxifyResilienceSettings(BaseModel):
+    """Latency aware handling of the Detoxify requests
+
+    adaptive_timeout: time out requests after timeout_multiplier x the timeout_percentile of the last
+        latency_window latencies, between min_timeout and detoxify_timeout, once min_samples are known
+    hedging: send a second request to the next endpoint when the first one takes longer than
+        the hedge_percentile latency (at least min_hedge_delay seconds), the first answer wins
+    max_in_flight_batches: texts are shed to Need_Manual while this number of batches are in flight, 0 for no limit
+    breaker_failure_threshold: consecutive failed batches opening the circuit, texts are then set to Need_Manual
+        without calling Detoxify, for breaker_recovery_timeout seconds before a probe batch is sent
+    """
+
+    adaptive_timeout: bool = True
+    timeout_percentile: float = 0.99
+    timeout_multiplier: float = 3
+    min_timeout: float = 1
+    latency_window: int = 500
+    min_samples: int = 20
+    hedging: bool = False
+    hedge_percentile: float = 0.95
+    min_hedge_delay: float = 0.05
+    max_in_flight_batches: int = 0
+    breaker_enabled: bool = True
+    breaker_failure_threshold: int = 5
+    breaker_recovery_timeout: float = 30
+
+
+class AutomoderationSettings(BaseModel):
+    """Settings read from the services.automoderation config section"""
+
+    # model_backend is not a pydantic attribute
+    model_config = ConfigDict(protected_namespaces=())
+
+    model_backend: ModelBackend = ModelBackend.Remote
+    fail_fast: bool = False
+    pipeline_mode: PipelineMode = PipelineMode.Chained
+    module_timeout: float = 60
+    timing_logs: bool = False
+    # Send a synthetic request through each module before it consumes, so the first messages find warm pools
+    warm_up: bool = True
+    # Time given to the messages being handled to finish when a module stops, the other ones are redelivered.
+    # With STOP_MARGIN, it must fit in supervisor.drain_timeout, after which the worker processes are killed
+    drain_timeout: float = 20
+    # Validate only the contents read by the modules, see LazyDespMQMessage
+    lazy_decoding: bool = True
+    local_model: LocalModelSettings = LocalModelSettings()
+    detoxify_service: str = ""
+    # Other endpoints serving the same model, the requests are spread over all the endpoints
+    detoxify_services: list[str] = []
+    detoxify_model_version: str = ""
+    detoxify_timeout: float = 30
+    detoxify_batch_size: int = 16
+    detoxify_batch_max_wait_ms: float = 10
+    detoxify_resilience: DetoxifyResilienceSettings = DetoxifyResilienceSettings()
+    http_client: HttpClientSettings = HttpClientSettings()
+    toxicity_cache: ResultCacheSettings = ResultCacheSettings()
+    toxicity_chunking: ChunkingSettings = ChunkingSettings()
+    toxicity_incremental: IncrementalModerationSettings = IncrementalModerationSettings()
+    toxicity_prefilter: LexicalPrefilterSettings = LexicalPrefilterSettings()
+    # Min score of each status, for each label. Empty -> the thresholds of the model on the toxicity label
+    toxicity_thresholds: dict[str, dict[AutoModerationStatus, float]] = {}
+    url_validation: UrlValidationSettings = UrlValidationSettings()
+    modules: dict[str, ModuleSettings] = {}
+    supervisor: SupervisorSettings = SupervisorSettings()
+
+    @model_validator(mode="after")
+    def check_drain_timeouts(self) -> "AutomoderationSettings":
+        """Refuse a drain of the modules longer than the time the supervisor gives to its workers"""
+        if self.drain_timeout + STOP_MARGIN > self.supervisor.drain_timeout:
+            message = (
+                f"drain_timeout ({self.drain_timeout}s) + {STOP_MARGIN}s must not exceed "
+                f"supervisor.drain_timeout ({self.supervisor.drain_timeout}s)"
+            )
+            raise ValueError(message)
+        return self
+
+    def get_module_settings(self, automoderation_type: str) -> ModuleSettings:
+        """Return the consumer settings of a module, the defaults if it has none
+
+        Args:
+            automoderation_type (str): value of the AutoModerationType of the module
+        """
+        return self.modules.get(automoderation_type) or ModuleSettings()
+
+
+_settings: AutomoderationSettings | None = None
+
+
+def load_settings(config: dict | None = None) -> AutomoderationSettings:
+    """Resolve the automoderation settings, once, from the config
+
+    Args:
+        config (dict | None): the service config. Default to None -> read the config file
+    """
+    global _settings
+    if config is None:
+        config = read_config()
+    _settings = AutomoderationSettings.model_validate(config.get("services", {}).get("automoderation") or {})
+    return _settings
+
+
+def get_settings() -> AutomoderationSettings:
+    """Return the loaded settings, loading them from the config file if needed"""
+    return _settings if _settings is not None else load_settings()
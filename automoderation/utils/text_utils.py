@@ -1,4 +1,5 @@
 import re
+import unicodedata
 
 
 def split_into_sentences(text: str) -> list:
@@ -15,3 +16,47 @@ def split_into_sentences(text: str) -> list:
 
     # Remove empty strings from the result
     return [s for s in sentences if s]
+
+
+def normalize_text(text: str) -> str:
+    """Normalize unicode and whitespaces, so equivalent texts compare equal
+
+    Args:
+        text (str): text to normalize
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def split_into_chunks(text: str, max_chars: int) -> list[str]:
+    """Pack the sentences of a text into chunks of at most max_chars characters
+
+    Sentences longer than max_chars are cut on whitespaces, or anywhere if they have none.
+
+    Args:
+        text (str): The input text to split.
+        max_chars (int): max size of a chunk
+
+    Returns:
+        list: A list of chunks, in the order of the text.
+    """
+    max_chars = max(1, max_chars)
+    chunks: list[str] = []
+    current = ""
+    for sentence in split_into_sentences(text):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 1, max_chars + 1)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut].rstrip())
+            sentence = sentence[cut:].lstrip()
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
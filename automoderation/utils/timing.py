@@ -0,0 +1,67 @@
+"""Stage timing"""
+
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from msfwk.metrics import push_metric
+
+from automoderation.utils.metrics import BackendErrorsTotal, StageDurationSeconds
+
+UNKNOWN_MODULE = "unknown"
+
+ERROR_TIMEOUT = "timeout"
+ERROR_FAILURE = "error"
+
+
+class MessageTiming:
+    """Cumulated duration of each stage of the processing of one message"""
+
+    def __init__(self) -> "MessageTiming":
+        self.durations: dict[tuple[str, str], float] = {}
+
+    def add(self, module: str, stage: str, duration: float) -> None:
+        """Add the duration of a stage"""
+        self.durations[module, stage] = self.durations.get((module, stage), 0) + duration
+
+    def summary(self) -> str:
+        """Durations in milliseconds, in the order the stages started"""
+        return " ".join(
+            f"{module}.{stage}={duration * 1000:.1f}ms" for (module, stage), duration in self.durations.items()
+        )
+
+
+current_module: ContextVar[str] = ContextVar("current_module", default=UNKNOWN_MODULE)
+current_timing: ContextVar[MessageTiming | None] = ContextVar("current_timing", default=None)
+
+
+@contextmanager
+def timed_stage(stage: str, module: str | None = None) -> Iterator[None]:
+    """Observe the duration of a stage, and add it to the timing of the current message
+
+    Concurrent stages of a message (url checks...) are cumulated.
+
+    Args:
+        stage (str): decode, preprocess, backend, analyze, ack, publish...
+        module (str | None): the module running the stage. Default to None -> current_module
+    """
+    module = module or current_module.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        push_metric(StageDurationSeconds, [module, stage], duration)
+        if (timing := current_timing.get()) is not None:
+            timing.add(module, stage, duration)
+
+
+def count_backend_error(backend: str, error: str) -> None:
+    """Count an error of a backend called by the current module
+
+    Args:
+        backend (str): name of the backend
+        error (str): ERROR_TIMEOUT, ERROR_FAILURE, or the error of a ModelError
+    """
+    push_metric(BackendErrorsTotal, [current_module.get(), backend, error])
@@ -0,0 +1,59 @@
+"""Url utils"""
+
+import asyncio
+import socket
+from urllib.parse import urlsplit, urlunsplit
+
+from automoderation.utils.cache import LocalCache
+from automoderation.utils.settings import DnsCacheSettings
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Normalize an url, so equivalent urls compare equal
+
+    Lower case scheme and host, remove the default port and the fragment.
+
+    Args:
+        url (str): url to normalize
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+    if parts.username or parts.password:
+        netloc = f"{parts.username or ''}:{parts.password or ''}@{netloc}"
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+class CachingResolver:
+    """Resolve hostnames without blocking the event loop, and remember the answers
+
+    Unknown hostnames are cached too, with a shorter time to live.
+    """
+
+    def __init__(self, settings: DnsCacheSettings) -> "CachingResolver":
+        self.cache = LocalCache(
+            "dns", settings.maxsize, lambda resolvable: settings.ttl if resolvable else settings.negative_ttl
+        )
+
+    async def is_resolvable(self, hostname: str | None) -> bool:
+        """Return True if the hostname has an address"""
+        if not hostname:
+            return False
+        hostname = hostname.lower()
+        if (resolvable := self.cache.get(hostname)) is not None:
+            return resolvable
+        try:
+            await asyncio.get_running_loop().getaddrinfo(hostname, None)
+            resolvable = True
+        except socket.gaierror:
+            resolvable = False
+        self.cache.set(hostname, resolvable)
+        return resolvable
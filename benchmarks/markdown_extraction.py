@@ -0,0 +1,106 @@
+"""Markdown extraction benchmark
+
+Compare extract_text with the markdown + BeautifulSoup pipeline it replaces:
+the outputs must be identical on the whole corpus, and the timings are reported per kind of text.
+
+Usage: python -m benchmarks.markdown_extraction [--seed 0] [--count 2000]
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from collections.abc import Callable
+
+from bs4 import BeautifulSoup
+from markdown import markdown
+
+from automoderation.utils.markdown_text import extract_text
+
+WORDS = ["data", "model", "ocean", "forecast", "the", "dataset", "is", "available", "for", "climate", "use", "great"]
+MARKDOWN_LINES = [
+    "# {w} {w}",
+    "## {w}",
+    "- {w} {w} {w}",
+    "1. {w} **{w}** {w}",
+    "> {w} {w}",
+    "    {w} = {w}({w})",
+    "See [{w}](https://example.org/{w}) and `{w}`.",
+    "![{w}](https://example.org/{w}.png)",
+    "<div>{w} &amp; {w}</div>",
+    "{w} {w} _{w}_ {w}.",
+    "{w} {w}, {w} {w}. {w}!",
+]
+
+
+def reference_extract_text(text: str) -> str:
+    """The extraction extract_text replaces"""
+    html = markdown(text)
+    return "".join(BeautifulSoup(html, features="html.parser").find_all(string=True))
+
+
+def make_sentence(rng: random.Random, size: int) -> str:
+    """Random plain sentence"""
+    return " ".join(rng.choice(WORDS) for _ in range(size)).capitalize() + "."
+
+
+def make_markdown(rng: random.Random, lines: int) -> str:
+    """Random README-like document"""
+    blocks = [rng.choice(MARKDOWN_LINES).replace("{w}", rng.choice(WORDS)) for _ in range(lines)]
+    return "\n".join(block if rng.random() < 0.7 else block + "\n" for block in blocks)
+
+
+def make_corpus(seed: int, count: int) -> dict[str, list[str]]:
+    """Texts grouped by kind"""
+    rng = random.Random(seed)
+    return {
+        "title": [make_sentence(rng, rng.randint(2, 8)) for _ in range(count)],
+        "description": ["\n\n".join(make_sentence(rng, 15) for _ in range(5)) for _ in range(count)],
+        "readme": [make_markdown(rng, 60) for _ in range(count // 10)],
+        "large": [make_markdown(rng, 20000) for _ in range(2)],
+    }
+
+
+def measure(extract: Callable[[str], str], texts: list[str]) -> tuple[float, list[str]]:
+    """Time an extraction over texts"""
+    start = time.perf_counter()
+    outputs = [extract(text) for text in texts]
+    return time.perf_counter() - start, outputs
+
+
+def peak_memory(extract: Callable[[str], str], text: str) -> int:
+    """Peak allocated memory (in bytes) while extracting a text"""
+    tracemalloc.start()
+    extract(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main() -> None:
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--count", type=int, default=2000)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.seed, args.count)
+    print(f"{'kind':<12}{'texts':>8}{'reference (s)':>16}{'extract (s)':>14}{'speedup':>10}{'mismatches':>12}")
+    for kind, texts in corpus.items():
+        reference_time, expected = measure(reference_extract_text, texts)
+        extract_time, outputs = measure(extract_text, texts)
+        mismatches = sum(output != reference for output, reference in zip(outputs, expected, strict=True))
+        print(
+            f"{kind:<12}{len(texts):>8}{reference_time:>16.3f}{extract_time:>14.3f}"
+            f"{reference_time / extract_time:>9.1f}x{mismatches:>12}"
+        )
+    large = corpus["large"][0]
+    print(
+        f"peak memory on a {len(large) / 1e6:.1f}MB document: "
+        f"reference {peak_memory(reference_extract_text, large) / 1e6:.0f}MB, "
+        f"extract {peak_memory(extract_text, large) / 1e6:.0f}MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
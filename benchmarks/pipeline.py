@@ -0,0 +1,359 @@
+"""Pipeline benchmark
+
+Drive the moderation modules with a synthetic corpus, without RabbitMQ nor Detoxify:
+- an in-memory broker replaces the RabbitMQ queues (publish, prefetch, ack)
+- a fake Detoxify service answers batches of texts after a configurable latency
+- a fake url target answers the HEAD requests, 404 for the urls containing "missing"
+
+Reports messages/s, p50/p95/p99 end-to-end latency and CPU time per message,
+and appends the results to a JSON lines file to compare commits.
+
+Usage: APP_CONFIG_FILE=<service config> python -m benchmarks.pipeline [--messages 2000] [--pipeline-mode chained]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import UTC, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from msfwk.desp.rabbitmq.mq_message import DespMQMessage
+from msfwk.mqclient import MQMessage, RabbitMQConfig
+
+from automoderation.modules import moderation_module
+from automoderation.modules.moderation_module import add_module, module_holder, start_modules, stop_modules
+from automoderation.modules.text_toxicity import TextToxicityModule
+from automoderation.modules.url_validation import UrlValidationModule
+from automoderation.utils.http_client import close_http_client, start_http_client
+from automoderation.utils.settings import load_settings
+
+HOST = "127.0.0.1"
+TOXIC_WORDS = ("idiot", "stupid", "hate")
+WORDS = ["data", "model", "ocean", "forecast", "the", "dataset", "is", "available", "for", "climate", "great"]
+LABELS = ["toxicity", "severe_toxicity", "obscene", "threat", "insult", "identity_attack"]
+QUEUE_PREFIX = "bench."
+RABBITMQ_CONFIG = {
+    "mq_server": HOST,
+    "mq_port": 5672,
+    "user": "bench",
+    "password": "bench",
+    **{
+        f"{name}_queue_name": f"{QUEUE_PREFIX}{name}"
+        for name in (
+            "manual_moderation",
+            "handling_moderation",
+            "error_moderation",
+            "text_toxicity_automoderation",
+            "url_validation_automoderation",
+            "mail_notification",
+            "error_notification",
+        )
+    },
+    "moderation_exchange": f"{QUEUE_PREFIX}moderation",
+    "notification_exchange": f"{QUEUE_PREFIX}notification",
+    # Routing keys are the names of the queues they lead to
+    "to_manual_routing_key": f"{QUEUE_PREFIX}manual_moderation",
+    "to_handling_routing_key": f"{QUEUE_PREFIX}handling_moderation",
+    "to_error_routing_key": f"{QUEUE_PREFIX}error_moderation",
+    "to_auto_text_toxicity_routing_key": f"{QUEUE_PREFIX}text_toxicity_automoderation",
+    "to_auto_url_validation_routing_key": f"{QUEUE_PREFIX}url_validation_automoderation",
+    "to_notification_routing_key": f"{QUEUE_PREFIX}mail_notification",
+    "to_error_notification_routing_key": f"{QUEUE_PREFIX}error_notification",
+}
+
+
+class FakeDetoxifyHandler(BaseHTTPRequestHandler):
+    """POST {"texts": [...]} -> one score dict per text, after latency + latency_per_text * len(texts)"""
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    latency_per_text = 0.0
+
+    def do_POST(self) -> None:
+        """Score a batch of texts"""
+        texts = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["texts"]
+        time.sleep(self.latency + self.latency_per_text * len(texts))
+        scores = [
+            {text: {label: 0.9 if any(word in text for word in TOXIC_WORDS) else 0.02 for label in LABELS}}
+            for text in texts
+        ]
+        body = json.dumps(scores).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_: object) -> None:
+        """Silence the access log"""
+
+
+class FakeUrlHandler(BaseHTTPRequestHandler):
+    """HEAD -> 404 if the path contains "missing", 200 otherwise, after latency"""
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def do_HEAD(self) -> None:
+        """Answer a url check"""
+        time.sleep(self.latency)
+        self.send_response(404 if "missing" in self.path else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *_: object) -> None:
+        """Silence the access log"""
+
+
+def serve(handler: type[BaseHTTPRequestHandler], port: int, attributes: dict) -> None:
+    """Run a fake server until the process is terminated"""
+    for name, value in attributes.items():
+        setattr(handler, name, value)
+    ThreadingHTTPServer((HOST, port), handler).serve_forever()
+
+
+class BenchIncomingMessage:
+    """The parts of aio_pika.IncomingMessage used by the modules"""
+
+    def __init__(self, body: bytes, on_ack: asyncio.Semaphore) -> "BenchIncomingMessage":
+        self.body = body
+        self.headers = {"X-Transaction-ID": str(uuid.uuid4()), "access_token": "bench"}
+        self.message_id = None
+        self._on_ack = on_ack
+
+    async def ack(self) -> None:
+        """Free a prefetch slot"""
+        self._on_ack.release()
+
+    async def nack(self, *_: object, **__: object) -> None:
+        """Free a prefetch slot"""
+        self._on_ack.release()
+
+    async def reject(self, *_: object, **__: object) -> None:
+        """Free a prefetch slot"""
+        self._on_ack.release()
+
+
+class InMemoryBroker:
+    """Queues named after their routing keys, consumed with a prefetch limit"""
+
+    def __init__(self) -> "InMemoryBroker":
+        self.queues: dict[str, asyncio.Queue[bytes]] = {}
+        self.handled: dict[str, float] = {}
+        self.all_handled = asyncio.Event()
+        self.expected = 0
+
+    def queue(self, name: str) -> asyncio.Queue[bytes]:
+        """Return a queue, created on first use"""
+        return self.queues.setdefault(name, asyncio.Queue())
+
+    async def publish(self, message: MQMessage, _exchange: str | None = None, routing_key: str | None = None) -> None:
+        """Replaces msfwk send_mq_message, the messages sent to handling are timestamped"""
+        payload = message.as_payload()
+        if routing_key == RabbitMQConfig.TO_HANDLING_RKEY:
+            self.handled[json.loads(payload)["id"]] = time.perf_counter()
+            if len(self.handled) >= self.expected:
+                self.all_handled.set()
+            return
+        await self.queue(routing_key).put(payload.encode() if isinstance(payload, str) else payload)
+
+    async def consume(
+        self, queue_name: str, on_message: object, prefetch_count: int, stopping: asyncio.Event, drain_timeout: float
+    ) -> None:
+        """Replaces consume_queue: each message runs in its own task, with prefetch_count unacked messages at most"""
+        unacked = asyncio.Semaphore(max(1, prefetch_count))
+        running: set[asyncio.Task] = set()
+        queue = self.queue(queue_name)
+        stopped = asyncio.create_task(stopping.wait())
+        while not stopping.is_set():
+            await unacked.acquire()
+            body = asyncio.create_task(queue.get())
+            await asyncio.wait({body, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            if not body.done():
+                body.cancel()
+                break
+            task = asyncio.create_task(on_message(BenchIncomingMessage(body.result(), unacked)))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        if running:
+            await asyncio.wait(running, timeout=drain_timeout)
+
+
+def make_contents(prefix: str, values: list[str]) -> list[dict]:
+    """Payloads of the contents of a message"""
+    return [{"name": f"{prefix}-{i}", "value": value, "rejected_reasons": []} for i, value in enumerate(values)]
+
+
+def make_corpus(seed: int, count: int, toxic_ratio: float, missing_ratio: float, url_port: int) -> list[dict]:
+    """Generate the payloads of count messages routed to the text toxicity then url validation modules"""
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        texts = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))).capitalize()]
+        texts.append("\n\n".join(f"## {rng.choice(WORDS)}\n\n{'**data** ' * rng.randint(1, 30)}" for _ in range(3)))
+        if rng.random() < toxic_ratio:
+            texts.append(f"You are {rng.choice(TOXIC_WORDS)}.")
+        urls = [f"http://{HOST}:{url_port}/{rng.choice(WORDS)}/{rng.randint(0, 50)}" for _ in range(rng.randint(0, 3))]
+        if rng.random() < missing_ratio:
+            urls.append(f"http://{HOST}:{url_port}/missing/{i}")
+        messages.append(
+            {
+                "id": f"bench-{i}",
+                "status": "AutoPending",
+                "content_id": f"content-{i}",
+                "user_id": "bench",
+                "date": "2024-01-01T00:00:00",
+                "fonctionnal_area": "DiscussionPost",
+                "content": {"data_by_type": {"Text": make_contents("text", texts), "Url": make_contents("url", urls)}},
+                "url": "",
+                "auto_mod_routing": [
+                    {"moderation_type": "Text_Toxicity", "status": "Pending"},
+                    {"moderation_type": "Url_Validation", "status": "Pending"},
+                ],
+                "reject_callbacks": [],
+                "accept_callbacks": [],
+                "history": [],
+                "routing_key": "",
+                "exchange": "",
+            }
+        )
+    return messages
+
+
+def percentile(values: list[float], percent: int) -> float:
+    """Return a percentile of values"""
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1] if len(values) > 1 else values[0]
+
+
+async def run(args: argparse.Namespace) -> dict:
+    """Send the corpus through the modules and measure it"""
+    settings = load_settings(
+        {
+            "services": {
+                "automoderation": {
+                    "detoxify_service": f"http://{HOST}:{args.detoxify_port}/",
+                    "pipeline_mode": args.pipeline_mode,
+                    "fail_fast": args.fail_fast,
+                    "toxicity_cache": {"enabled": not args.no_cache},
+                    "url_validation": {"verdict_cache": {"enabled": not args.no_cache}},
+                    "modules": {
+                        module_type: {"prefetch_count": args.prefetch, "max_concurrency": args.concurrency}
+                        for module_type in ("Text_Toxicity", "Url_Validation")
+                    },
+                }
+            }
+        }
+    )
+    RabbitMQConfig.load_from_dict(RABBITMQ_CONFIG)
+    broker = InMemoryBroker()
+    moderation_module.send_mq_message = broker.publish
+    moderation_module.consume_queue = broker.consume
+    await start_http_client(settings.http_client)
+    add_module(TextToxicityModule())
+    add_module(UrlValidationModule())
+    await start_modules()
+
+    corpus = make_corpus(args.seed, args.messages, args.toxic_ratio, args.missing_ratio, args.url_port)
+    broker.expected = len(corpus)
+    first_queue = module_holder[DespMQMessage.from_dict(corpus[0]).auto_mod_routing[0].moderation_type].queue_rkey
+    sent: dict[str, float] = {}
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for payload in corpus:
+        sent[payload["id"]] = time.perf_counter()
+        await broker.queue(first_queue).put(json.dumps(payload).encode())
+    await asyncio.wait_for(broker.all_handled.wait(), args.timeout)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    await stop_modules()
+    await close_http_client()
+    latencies = [broker.handled[message_id] - start for message_id, start in sent.items()]
+    return {
+        "messages": len(corpus),
+        "messages_per_second": round(len(corpus) / wall, 1),
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "latency_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "cpu_ms_per_message": round(cpu / len(corpus) * 1000, 3),
+    }
+
+
+def git_commit() -> str:
+    """Current commit of the repository, to compare the results"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pipeline-mode", choices=["chained", "fused", "parallel"], default="chained")
+    parser.add_argument("--fail-fast", action="store_true")
+    parser.add_argument("--no-cache", action="store_true", help="disable the toxicity and url verdict caches")
+    parser.add_argument("--prefetch", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--toxic-ratio", type=float, default=0.1)
+    parser.add_argument("--missing-ratio", type=float, default=0.05)
+    parser.add_argument("--detoxify-latency-ms", type=float, default=20)
+    parser.add_argument("--detoxify-latency-per-text-ms", type=float, default=1)
+    parser.add_argument("--url-latency-ms", type=float, default=10)
+    parser.add_argument("--detoxify-port", type=int, default=18765)
+    parser.add_argument("--url-port", type=int, default=18766)
+    parser.add_argument("--timeout", type=float, default=600, help="max duration of the run, in seconds")
+    parser.add_argument("--output", type=Path, default=Path("benchmarks/results/pipeline.jsonl"))
+    parser.add_argument("--log-level", default="WARNING", help="logs below this level are disabled")
+    args = parser.parse_args()
+    logging.disable(logging.getLevelName(args.log_level) - 1)
+
+    servers = [
+        multiprocessing.Process(
+            target=serve,
+            args=(
+                FakeDetoxifyHandler,
+                args.detoxify_port,
+                {
+                    "latency": args.detoxify_latency_ms / 1000,
+                    "latency_per_text": args.detoxify_latency_per_text_ms / 1000,
+                },
+            ),
+            daemon=True,
+        ),
+        multiprocessing.Process(
+            target=serve, args=(FakeUrlHandler, args.url_port, {"latency": args.url_latency_ms / 1000}), daemon=True
+        ),
+    ]
+    for server in servers:
+        server.start()
+    time.sleep(0.5)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        for server in servers:
+            server.terminate()
+
+    parameters = {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()}
+    record = {"date": datetime.now(UTC).isoformat(), "commit": git_commit(), "parameters": parameters, **results}
+    for key, value in results.items():
+        print(f"{key:<22}{value:>12}")
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open("a") as output:
+        output.write(json.dumps(record) + "\n")
+    print(f"results appended to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""Fixtures of the automoderation tests"""
+
+import os
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+import pytest
+
+RESOURCES = Path(__file__).parent / "resources"
+
+# msfwk reads its config file when it is imported, the test modules import it after this conftest
+os.environ.setdefault("APP_CONFIG_FILE", str(RESOURCES / "config.yaml"))
+
+
+@pytest.fixture
+def automoderation_settings() -> Iterator[Callable[..., object]]:
+    """Load the services.automoderation settings from keyword arguments, back to the defaults after the test"""
+    from automoderation.utils.settings import load_settings
+
+    def load(**settings: object) -> object:
+        return load_settings({"services": {"automoderation": settings}})
+
+    yield load
+    load_settings({})
@@ -0,0 +1,57 @@
+"""Generate the tiny toxicity model and tokenizer of the tests
+
+The logit of each label grows with the largest token id of the text: "hello" Pass,
+"rude" Need_Manual and "idiot" Failed with the default thresholds.
+
+Usage: python tests/resources/make_tiny_model.py (requires onnx and tokenizers)
+"""
+
+from pathlib import Path
+
+import onnx
+from onnx import TensorProto, helper
+from tokenizers import Tokenizer, models, normalizers, pre_tokenizers
+
+RESOURCES = Path(__file__).parent
+VOCABULARY = {"[PAD]": 0, "[UNK]": 1, "hello": 2, "nice": 3, "rude": 6, "idiot": 10}
+
+
+def make_model() -> onnx.ModelProto:
+    """logits = (max(input_ids * attention_mask) - 5) * label_weights, one logit per Detoxify label"""
+    graph = helper.make_graph(
+        [
+            helper.make_node("Mul", ["input_ids", "attention_mask"], ["masked"]),
+            helper.make_node("ReduceMax", ["masked", "axes"], ["max_id"], keepdims=1),
+            helper.make_node("Cast", ["max_id"], ["max_score"], to=TensorProto.FLOAT),
+            helper.make_node("Sub", ["max_score", "offset"], ["logit"]),
+            helper.make_node("Mul", ["logit", "label_weights"], ["logits"]),
+        ],
+        "tiny_toxicity",
+        [
+            helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"]),
+            helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "sequence"]),
+        ],
+        [helper.make_tensor_value_info("logits", TensorProto.FLOAT, ["batch", 6])],
+        [
+            helper.make_tensor("axes", TensorProto.INT64, [1], [1]),
+            helper.make_tensor("offset", TensorProto.FLOAT, [], [5.0]),
+            helper.make_tensor("label_weights", TensorProto.FLOAT, [1, 6], [1.0, 0.5, 0.5, 0.5, 0.5, 0.5]),
+        ],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 18)], producer_name="automoderation-tests")
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    return model
+
+
+def make_tokenizer() -> Tokenizer:
+    """Lowercased words of VOCABULARY, the other words are [UNK]"""
+    tokenizer = Tokenizer(models.WordLevel(VOCABULARY, unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.Lowercase()
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    return tokenizer
+
+
+if __name__ == "__main__":
+    onnx.save(make_model(), RESOURCES / "tiny_toxicity.onnx")
+    make_tokenizer().save(str(RESOURCES / "tiny_tokenizer.json"))
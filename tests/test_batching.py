@@ -0,0 +1,51 @@
+"""Tests of the micro batching of concurrent items"""
+
+import asyncio
+
+import pytest
+
+from automoderation.utils.batching import MicroBatcher
+
+pytestmark = pytest.mark.unit
+
+
+async def test_concurrent_items_are_processed_in_one_batch() -> None:
+    batches = []
+
+    async def double(items: list[int]) -> list[int]:
+        batches.append(items)
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=3, max_wait=1)
+
+    assert await asyncio.gather(*(batcher.submit(item) for item in range(4))) == [0, 2, 4, 6]
+    assert batches == [[0, 1, 2], [3]]
+
+
+async def test_every_caller_receives_the_error_of_its_batch() -> None:
+    async def fail(_items: list[int]) -> list[int]:
+        message = "backend down"
+        raise RuntimeError(message)
+
+    batcher = MicroBatcher(fail, max_batch_size=2, max_wait=0)
+    results = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+    assert [str(result) for result in results] == ["backend down", "backend down"]
+
+
+async def test_cancelled_batch_cancels_its_callers() -> None:
+    started = asyncio.Event()
+
+    async def hang(items: list[int]) -> list[int]:
+        started.set()
+        await asyncio.Event().wait()
+        return items
+
+    batcher = MicroBatcher(hang, max_batch_size=2, max_wait=0)
+    callers = [asyncio.create_task(batcher.submit(item)) for item in range(2)]
+    await started.wait()
+    (batch,) = batcher._running
+    batch.cancel()
+
+    results = await asyncio.wait_for(asyncio.gather(*callers, return_exceptions=True), timeout=1)
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
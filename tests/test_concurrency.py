@@ -0,0 +1,94 @@
+"""Tests of the calls shared between concurrent callers"""
+
+import asyncio
+
+import pytest
+
+from automoderation.utils.concurrency import SingleFlight
+
+pytestmark = pytest.mark.unit
+
+CALL_LATENCY = 0.02
+
+
+class CountedCall:
+    """A call answering after CALL_LATENCY, or raising error"""
+
+    def __init__(self, error: Exception | None = None) -> "CountedCall":
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self) -> int:
+        self.calls += 1
+        await asyncio.sleep(CALL_LATENCY)
+        if self.error is not None:
+            raise self.error
+        return self.calls
+
+
+async def test_concurrent_callers_share_one_call() -> None:
+    flight: SingleFlight[int] = SingleFlight("test")
+    call = CountedCall()
+
+    results = await asyncio.gather(*(flight.do("key", call) for _ in range(5)))
+
+    assert results == [1] * 5
+    assert call.calls == 1
+    assert len(flight) == 0
+
+
+async def test_calls_of_different_keys_are_not_shared() -> None:
+    flight: SingleFlight[int] = SingleFlight("test")
+    call = CountedCall()
+
+    await asyncio.gather(flight.do("a", call), flight.do("b", call))
+
+    assert call.calls == 2
+
+
+async def test_completed_call_is_not_reused() -> None:
+    flight: SingleFlight[int] = SingleFlight("test")
+    call = CountedCall()
+
+    assert await flight.do("key", call) == 1
+    assert await flight.do("key", call) == 2
+
+
+async def test_every_caller_receives_the_exception() -> None:
+    flight: SingleFlight[int] = SingleFlight("test")
+    call = CountedCall(ValueError("backend failed"))
+
+    results = await asyncio.gather(*(flight.do("key", call) for _ in range(3)), return_exceptions=True)
+
+    assert call.calls == 1
+    assert [type(result) for result in results] == [ValueError] * 3
+    assert len({id(result) for result in results}) == 1
+    assert len(flight) == 0
+
+
+async def test_cancelled_caller_does_not_cancel_the_others() -> None:
+    flight: SingleFlight[int] = SingleFlight("test")
+    call = CountedCall()
+    first = asyncio.create_task(flight.do("key", call))
+    second = asyncio.create_task(flight.do("key", call))
+    await asyncio.sleep(0)
+
+    first.cancel()
+
+    assert await second == 1
+    assert first.cancelled()
+    assert call.calls == 1
+
+
+async def test_call_completes_after_all_its_callers_are_cancelled() -> None:
+    flight: SingleFlight[int] = SingleFlight("test")
+    call = CountedCall()
+    caller = asyncio.create_task(flight.do("key", call))
+    await asyncio.sleep(0)
+
+    caller.cancel()
+    await asyncio.sleep(2 * CALL_LATENCY)
+
+    assert call.calls == 1
+    assert len(flight) == 0
+    assert await flight.do("key", call) == 2
@@ -0,0 +1,267 @@
+"""Tests of the requests of the Detoxify model: batched POST, timeouts, hedging and circuit breaker"""
+
+import asyncio
+import time
+from collections.abc import Callable
+
+import httpx
+import orjson
+import pytest
+from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus
+
+from automoderation.ai_models.detoxify import model as detoxify_module
+from automoderation.ai_models.exceptions import CircuitOpenError, ModelError
+from automoderation.utils import resilience as resilience_module
+from automoderation.utils.resilience import CircuitState
+
+pytestmark = pytest.mark.unit
+
+PRIMARY = "http://primary"
+HEDGE = "http://hedge"
+SLOW_LATENCY = 0.3
+FAST_LATENCY = 0.01
+HEDGE_DELAY = 0.05
+MIN_SAMPLES = 3
+DETOXIFY_TIMEOUT = 30
+RECOVERY_TIMEOUT = 0.1
+TOXICITY = {"kind words": 0.01, "rude words": 0.5, "insults": 0.9}
+
+
+@pytest.fixture
+def endpoint_latencies() -> dict[str, float]:
+    """Latency of each endpoint, the primary one is slow"""
+    return {PRIMARY: SLOW_LATENCY, HEDGE: FAST_LATENCY}
+
+
+@pytest.fixture
+def resilience() -> dict[str, object]:
+    """detoxify_resilience settings of the model"""
+    return {"hedging": True, "min_samples": MIN_SAMPLES, "min_hedge_delay": HEDGE_DELAY}
+
+
+@pytest.fixture
+def failing() -> set[str]:
+    """Endpoints answering with an error"""
+    return set()
+
+
+@pytest.fixture
+def requests() -> list[tuple[str, float, float]]:
+    """Endpoint, send time (perf_counter) and timeout of each request"""
+    return []
+
+
+@pytest.fixture
+def model(
+    automoderation_settings: Callable[..., object],
+    endpoint_latencies: dict[str, float],
+    resilience: dict[str, object],
+    failing: set[str],
+    requests: list[tuple[str, float, float]],
+) -> object:
+    """A Detoxify model on two endpoints, hedging once it knows MIN_SAMPLES latencies"""
+    from automoderation.ai_models.detoxify.model import DetoxifyModel
+
+    automoderation_settings(
+        detoxify_service=PRIMARY,
+        detoxify_services=[HEDGE],
+        detoxify_timeout=DETOXIFY_TIMEOUT,
+        toxicity_cache={"enabled": False},
+        detoxify_resilience=resilience,
+    )
+    model = DetoxifyModel()
+
+    async def post(endpoint: str, texts: list[str], timeout: float) -> list[dict[str, dict[str, float]]]:
+        start = time.perf_counter()
+        requests.append((endpoint, start, timeout))
+        await asyncio.sleep(endpoint_latencies[endpoint])
+        model.latencies.add(time.perf_counter() - start)
+        if endpoint in failing:
+            message = f"{endpoint} failed"
+            raise ModelError(message)
+        return [{text: {"toxicity": 0.0}} for text in texts]
+
+    model.post = post
+    for _ in range(MIN_SAMPLES):
+        model.latencies.add(FAST_LATENCY)
+    return model
+
+
+async def test_cancelled_primary_records_a_lower_bound_of_its_latency(model: object) -> None:
+    assert await model.request_scores(["hello"]) == [{"hello": {"toxicity": 0.0}}]
+
+    # The hedge answered, the slow primary request was cancelled after it
+    recorded = sorted(model.latencies._latencies)[MIN_SAMPLES:]
+    assert len(recorded) == 2
+    assert recorded[0] >= FAST_LATENCY
+    assert HEDGE_DELAY + FAST_LATENCY <= recorded[1] < SLOW_LATENCY
+
+
+async def test_cancelled_hedge_is_not_recorded(model: object, endpoint_latencies: dict[str, float]) -> None:
+    endpoint_latencies.update({PRIMARY: 2 * HEDGE_DELAY, HEDGE: SLOW_LATENCY})
+
+    assert await model.request_scores(["hello"]) == [{"hello": {"toxicity": 0.0}}]
+
+    # Only the primary request answered
+    (recorded,) = sorted(model.latencies._latencies)[MIN_SAMPLES:]
+    assert recorded >= 2 * HEDGE_DELAY
+
+
+async def test_hedge_is_sent_after_the_tracked_latency(
+    model: object, endpoint_latencies: dict[str, float], requests: list[tuple[str, float, float]]
+) -> None:
+    tracked = 2 * HEDGE_DELAY
+    for _ in range(10 * MIN_SAMPLES):
+        model.latencies.add(tracked)
+    endpoint_latencies[PRIMARY] = 2 * tracked
+
+    await model.request_scores(["hello"])
+
+    (_, primary_sent, _), (endpoint, hedge_sent, _) = requests
+    assert endpoint == HEDGE
+    assert tracked <= hedge_sent - primary_sent < 2 * tracked
+
+
+async def test_request_faster_than_the_tracked_latency_is_not_hedged(
+    model: object, endpoint_latencies: dict[str, float], requests: list[tuple[str, float, float]]
+) -> None:
+    endpoint_latencies[PRIMARY] = FAST_LATENCY
+
+    await model.request_scores(["hello"])
+
+    assert [endpoint for endpoint, _, _ in requests] == [PRIMARY]
+
+
+@pytest.mark.parametrize("resilience", [{"min_samples": MIN_SAMPLES, "min_timeout": 0.1, "timeout_multiplier": 3}])
+def test_timeout_adapts_to_the_tracked_latency(model: object) -> None:
+    def timeout_after(latencies: list[float]) -> float:
+        model.latencies = resilience_module.LatencyTracker(100)
+        for latency in latencies:
+            model.latencies.add(latency)
+        return model.request_timeout()
+
+    # Not enough samples yet
+    assert timeout_after([0.5]) == DETOXIFY_TIMEOUT
+    assert timeout_after([0.2, 0.3, 0.5]) == pytest.approx(3 * 0.5)
+    assert timeout_after([0.001] * MIN_SAMPLES) == pytest.approx(0.1)
+    assert timeout_after([DETOXIFY_TIMEOUT] * MIN_SAMPLES) == DETOXIFY_TIMEOUT
+
+
+@pytest.mark.parametrize(
+    "resilience",
+    [{"hedging": False, "breaker_failure_threshold": 2, "breaker_recovery_timeout": RECOVERY_TIMEOUT}],
+)
+async def test_breaker_opens_after_the_failures_then_probes_after_the_recovery_timeout(
+    model: object,
+    failing: set[str],
+    endpoint_latencies: dict[str, float],
+    requests: list[tuple[str, float, float]],
+) -> None:
+    failing.update({PRIMARY, HEDGE})
+    endpoint_latencies.update({PRIMARY: 0, HEDGE: 0})
+
+    for _ in range(2):
+        with pytest.raises(ModelError):
+            await model.score_batch(["hello"])
+    assert model.breaker.state is CircuitState.Open
+
+    # Open: Detoxify is not called
+    with pytest.raises(CircuitOpenError):
+        await model.score_batch(["hello"])
+    with pytest.raises(CircuitOpenError):
+        model.check_available()
+    assert len(requests) == 2
+
+    # Half open after the recovery timeout: a single probe goes through
+    await asyncio.sleep(RECOVERY_TIMEOUT)
+    failing.clear()
+    endpoint_latencies.update({PRIMARY: HEDGE_DELAY, HEDGE: HEDGE_DELAY})
+    model.check_available()
+    probe = asyncio.create_task(model.score_batch(["hello"]))
+    await asyncio.sleep(0)
+    assert model.breaker.state is CircuitState.HalfOpen
+    with pytest.raises(CircuitOpenError):
+        await model.score_batch(["hello"])
+
+    assert await probe == [{"hello": {"toxicity": 0.0}}]
+    assert model.breaker.state is CircuitState.Closed
+    assert len(requests) == 3
+
+
+@pytest.mark.parametrize(
+    "resilience", [{"hedging": False, "breaker_failure_threshold": 1, "breaker_recovery_timeout": RECOVERY_TIMEOUT}]
+)
+async def test_failed_probe_opens_the_breaker_again(
+    model: object, failing: set[str], endpoint_latencies: dict[str, float]
+) -> None:
+    failing.update({PRIMARY, HEDGE})
+    endpoint_latencies.update({PRIMARY: 0, HEDGE: 0})
+    with pytest.raises(ModelError):
+        await model.score_batch(["hello"])
+
+    await asyncio.sleep(RECOVERY_TIMEOUT)
+    with pytest.raises(ModelError):
+        await model.score_batch(["hello"])
+
+    assert model.breaker.state is CircuitState.Open
+    with pytest.raises(CircuitOpenError):
+        await model.score_batch(["hello"])
+
+
+@pytest.fixture
+def posted(monkeypatch: pytest.MonkeyPatch) -> list[httpx.Request]:
+    """Requests received by a Detoxify service scoring the TOXICITY texts"""
+    requests = []
+
+    def answer(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        texts = orjson.loads(request.content)["texts"]
+        return httpx.Response(200, json=[{text: {"toxicity": TOXICITY[text]}} for text in texts])
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(answer))
+    monkeypatch.setattr(detoxify_module, "get_http_client", lambda: client)
+    return requests
+
+
+@pytest.fixture
+def served_model(automoderation_settings: Callable[..., object]) -> object:
+    """A Detoxify model on a single endpoint, without cache"""
+    automoderation_settings(detoxify_service=PRIMARY, toxicity_cache={"enabled": False}, detoxify_batch_max_wait_ms=50)
+    return detoxify_module.DetoxifyModel()
+
+
+async def test_concurrent_texts_are_scored_in_one_post(served_model: object, posted: list[httpx.Request]) -> None:
+    statuses = await asyncio.gather(*(served_model.evaluate_text(text) for text in TOXICITY))
+
+    assert statuses == [AutoModerationStatus.Pass, AutoModerationStatus.Need_Manual, AutoModerationStatus.Failed]
+    (request,) = posted
+    assert (request.method, str(request.url)) == ("POST", PRIMARY)
+    assert orjson.loads(request.content) == {"texts": list(TOXICITY)}
+
+
+@pytest.mark.parametrize(
+    ("response", "error"),
+    [
+        (httpx.Response(200, json={"kind words": {"toxicity": 0.0}}), detoxify_module.DetoxifyResponseError),
+        (httpx.Response(200, text="not json"), detoxify_module.DetoxifyResponseError),
+        (httpx.Response(503, text="overloaded"), ModelError),
+    ],
+)
+async def test_unexpected_answer_is_a_model_error(
+    served_model: object, monkeypatch: pytest.MonkeyPatch, response: httpx.Response, error: type[ModelError]
+) -> None:
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda _request: response))
+    monkeypatch.setattr(detoxify_module, "get_http_client", lambda: client)
+
+    with pytest.raises(error):
+        await served_model.post(PRIMARY, ["kind words"], DETOXIFY_TIMEOUT)
+    assert await served_model.evaluate_text("kind words") == AutoModerationStatus.Need_Manual
+
+
+async def test_missing_scores_are_a_model_error(served_model: object, monkeypatch: pytest.MonkeyPatch) -> None:
+    answer = httpx.Response(200, json=[{"kind words": {"toxicity": 0.0}}])
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda _request: answer))
+    monkeypatch.setattr(detoxify_module, "get_http_client", lambda: client)
+
+    with pytest.raises(ModelError, match="1 scores for 2 texts"):
+        await served_model.status_batch(["kind words", "rude words"])
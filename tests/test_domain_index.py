@@ -0,0 +1,124 @@
+"""Tests of the domain reputation index"""
+
+import asyncio
+import os
+import threading
+from pathlib import Path
+
+import pytest
+
+from automoderation.utils import domain_index
+from automoderation.utils.domain_index import DomainReputation, ReloadingDomainIndex
+from automoderation.utils.settings import DomainReputationSettings
+
+pytestmark = pytest.mark.unit
+
+
+def write_index(path: Path, allow: list[str], block: list[str], mtime: float) -> None:
+    """Write an index file, with a distinct modification time"""
+    path.write_text(f"allow: {allow}\nblock: {block}\n", encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def index_path(tmp_path: Path) -> Path:
+    path = tmp_path / "domains.yaml"
+    write_index(path, ["trusted.org"], ["blocked.org"], 1000)
+    return path
+
+
+async def wait_reload(index: ReloadingDomainIndex) -> None:
+    """Wait for the reload started by a lookup"""
+    assert index._reload_task is not None
+    await index._reload_task
+
+
+async def test_modified_file_is_reloaded_in_a_thread(index_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    index = ReloadingDomainIndex(DomainReputationSettings(path=str(index_path), reload_interval=0))
+    assert index.lookup("blocked.org") == DomainReputation.Blocked
+    threads = []
+    load = domain_index.load_domain_index
+
+    def record_load(path: str) -> domain_index.DomainIndex:
+        threads.append(threading.current_thread())
+        return load(path)
+
+    monkeypatch.setattr(domain_index, "load_domain_index", record_load)
+    write_index(index_path, ["blocked.org"], [], 2000)
+
+    # The lookup does not wait for the reload, it uses the previous index
+    assert index.lookup("blocked.org") == DomainReputation.Blocked
+    await wait_reload(index)
+
+    assert index.lookup("blocked.org") == DomainReputation.Trusted
+    assert threads and threads[0] is not threading.main_thread()
+
+
+async def test_one_reload_at_a_time(index_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    index = ReloadingDomainIndex(DomainReputationSettings(path=str(index_path), reload_interval=0))
+    loading = threading.Event()
+    loads = []
+    load = domain_index.load_domain_index
+
+    def slow_load(path: str) -> domain_index.DomainIndex:
+        loads.append(path)
+        loading.wait(5)
+        return load(path)
+
+    monkeypatch.setattr(domain_index, "load_domain_index", slow_load)
+    write_index(index_path, [], ["trusted.org"], 2000)
+    for _ in range(10):
+        index.lookup("trusted.org")
+        await asyncio.sleep(0)
+    loading.set()
+    await wait_reload(index)
+
+    assert len(loads) == 1
+    assert index.lookup("trusted.org") == DomainReputation.Blocked
+
+
+async def test_invalid_file_keeps_the_previous_index(index_path: Path) -> None:
+    index = ReloadingDomainIndex(DomainReputationSettings(path=str(index_path), reload_interval=0))
+    index_path.write_text("allow: [unclosed\n", encoding="utf-8")
+    os.utime(index_path, (2000, 2000))
+
+    index.lookup("trusted.org")
+    await wait_reload(index)
+
+    assert index.lookup("trusted.org") == DomainReputation.Trusted
+
+
+def test_reload_without_event_loop_is_synchronous(index_path: Path) -> None:
+    index = ReloadingDomainIndex(DomainReputationSettings(path=str(index_path), reload_interval=0))
+    write_index(index_path, [], ["trusted.org"], 2000)
+
+    assert index.lookup("trusted.org") == DomainReputation.Blocked
+
+
+@pytest.mark.parametrize(
+    ("host", "reputation"),
+    [
+        ("example.org", DomainReputation.Trusted),
+        ("EXAMPLE.org.", DomainReputation.Trusted),
+        ("www.example.org", None),
+        ("cdn.static.org", DomainReputation.Trusted),
+        ("deep.cdn.static.org", DomainReputation.Trusted),
+        ("static.org", None),
+        ("bad.static.org", DomainReputation.Blocked),
+        ("sub.bad.static.org", DomainReputation.Blocked),
+        ("good.bad.static.org", DomainReputation.Trusted),
+        ("both.org", DomainReputation.Blocked),
+        ("org", None),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_lookup_of_hosts_and_wildcards(host: str | None, reputation: DomainReputation | None) -> None:
+    index = domain_index.DomainIndex(
+        {
+            DomainReputation.Trusted: ["example.org", "*.static.org", "good.bad.static.org", "both.org"],
+            DomainReputation.Blocked: ["bad.static.org", "*.bad.static.org", "both.org"],
+        }
+    )
+
+    assert index.lookup(host) == reputation
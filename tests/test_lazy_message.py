@@ -0,0 +1,76 @@
+"""Tests of the lazy decoding of the consumed messages, against decode_consume_message"""
+
+import orjson
+import pytest
+from msfwk.desp.rabbitmq.mq_message import (
+    COOKIE_ACCESS_TOKEN_KEY,
+    TRANSACTION_ID_HEADER_KEY,
+    DespMQMessage,
+    MQContentType,
+    decode_consume_message,
+)
+
+from automoderation.utils.lazy_message import LazyDespMQMessage, decode_lazy_message
+from benchmarks.pipeline import make_corpus
+
+pytestmark = pytest.mark.unit
+
+CORPUS = make_corpus(0, 20, toxic_ratio=0.5, missing_ratio=0.5, url_port=8000)
+
+
+class ConsumedMessage:
+    """The parts of aio_pika.IncomingMessage read by the decoders"""
+
+    def __init__(self, body: dict, headers: dict | None = None) -> "ConsumedMessage":
+        self.body = orjson.dumps(body)
+        self.headers = {TRANSACTION_ID_HEADER_KEY: "transaction", COOKIE_ACCESS_TOKEN_KEY: "token"}
+        self.headers.update(headers or {})
+        self.message_id = None
+
+
+@pytest.mark.parametrize(
+    "content_types",
+    [[MQContentType.Text], [MQContentType.Url], [MQContentType.Text, MQContentType.Url], []],
+)
+async def test_lazy_message_forwards_the_payload_of_the_full_message(content_types: list[MQContentType]) -> None:
+    for body in CORPUS:
+        full = await decode_consume_message(ConsumedMessage(body), DespMQMessage)
+        lazy = decode_lazy_message(ConsumedMessage(body), content_types)
+
+        assert isinstance(lazy, LazyDespMQMessage)
+        assert lazy.to_dict() == full.to_dict()
+        assert orjson.loads(lazy.json()) == orjson.loads(full.json())
+
+
+async def test_only_the_contents_of_the_read_types_are_validated() -> None:
+    body = CORPUS[0]
+    full = await decode_consume_message(ConsumedMessage(body), DespMQMessage)
+
+    lazy = decode_lazy_message(ConsumedMessage(body), [MQContentType.Text])
+
+    assert list(lazy.content.data_by_type) == [MQContentType.Text]
+    assert lazy.content.data_by_type[MQContentType.Text] == full.content.data_by_type[MQContentType.Text]
+    assert lazy.raw_data_by_type == {"Url": body["content"]["data_by_type"]["Url"]}
+
+
+def test_edited_contents_are_forwarded_with_the_raw_ones() -> None:
+    body = CORPUS[0]
+    lazy = decode_lazy_message(ConsumedMessage(body), [MQContentType.Text])
+
+    lazy.content.data_by_type[MQContentType.Text][0].rejected_reasons.append("toxic")
+
+    payload = lazy.to_dict()["content"]["data_by_type"]
+    assert payload["Text"][0]["rejected_reasons"] == ["toxic"]
+    assert payload["Url"] == body["content"]["data_by_type"]["Url"]
+
+
+@pytest.mark.parametrize("body", [{"id": "not a message"}, {**CORPUS[0], "date": "not a date"}])
+def test_invalid_message_is_left_to_decode_consume_message(body: dict) -> None:
+    assert decode_lazy_message(ConsumedMessage(body), [MQContentType.Text]) is None
+
+
+def test_message_without_headers_is_left_to_decode_consume_message() -> None:
+    message = ConsumedMessage(CORPUS[0])
+    message.headers = {}
+
+    assert decode_lazy_message(message, [MQContentType.Text]) is None
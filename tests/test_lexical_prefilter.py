@@ -0,0 +1,46 @@
+"""Tests of the lexical pre-filter"""
+
+import pytest
+
+from automoderation.utils.lexical_prefilter import LexicalPrefilter, PrefilterDecision, TermMatcher
+from automoderation.utils.settings import LexicalPrefilterSettings
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture
+def prefilter() -> LexicalPrefilter:
+    return LexicalPrefilter(
+        LexicalPrefilterSettings(
+            enabled=True, blocked_terms=["idiot", "shut up"], suspicious_terms=["kill"], max_pass_chars=40
+        )
+    )
+
+
+@pytest.mark.parametrize(
+    ("text", "decision", "term"),
+    [
+        ("You idiot", PrefilterDecision.Blocked, "idiot"),
+        ("IDIOT!", PrefilterDecision.Blocked, "idiot"),
+        ("Ｉｄｉｏｔ", PrefilterDecision.Blocked, "idiot"),
+        ("just   shut\nup", PrefilterDecision.Blocked, "shut up"),
+        (f"{'A long text. ' * 10}idiot", PrefilterDecision.Blocked, "idiot"),
+        ("Idiotic ideas", PrefilterDecision.Passed, None),
+        ("Shutting up", PrefilterDecision.Passed, None),
+        ("Nice to meet you!", PrefilterDecision.Passed, None),
+        ("Éléphant très gentil", PrefilterDecision.Passed, None),
+        ("A long text. " * 10, PrefilterDecision.Long, None),
+        ("You 1d10t", PrefilterDecision.Charset, None),
+        ("Hello 😀", PrefilterDecision.Charset, None),
+        ("I will kill this bug", PrefilterDecision.SuspiciousTerm, None),
+        ("Skills", PrefilterDecision.Passed, None),
+    ],
+)
+def test_decide(prefilter: LexicalPrefilter, text: str, decision: PrefilterDecision, term: str | None) -> None:
+    assert prefilter.decide(text) == (decision, term)
+
+
+def test_matcher_finds_overlapping_terms_as_whole_words() -> None:
+    matcher = TermMatcher(["he", "she", "hers", "his", "she sells"])
+
+    assert list(matcher.find("ushers and she sells his hers")) == ["she", "she sells", "his", "hers"]
@@ -0,0 +1,101 @@
+"""Tests of the markdown to plain text extraction, against the markdown + BeautifulSoup pipeline it replaces"""
+
+import random
+
+import pytest
+
+from automoderation.utils import markdown_text
+from automoderation.utils.markdown_text import decode_charref, extract_text
+
+# The reference pipeline needs BeautifulSoup, from the benchmark extra
+markdown_extraction = pytest.importorskip("benchmarks.markdown_extraction")
+
+pytestmark = pytest.mark.unit
+
+EDGE_CASES = [
+    "",
+    "hello",
+    "\xa0hello",
+    "\xa0",
+    " x ",
+    " \xa0 hi",
+    "hello\xa0",
+    "x\n\xa0\ny",
+    "x\n\n\xa0\ny",
+    "　\n \n\nword",
+    "a　",
+    "\u200bword",
+    "\x1cb\txb",
+    "line\t\nnext",
+    "1 \t\nnext",
+    "two spaces  \nbreak",
+    "one\r\ntwo\rthree",
+    "first\n\n\n\nsecond",
+    "tab\tinside",
+    "a &#1 b",
+    "&#1;",
+    "&#0;",
+    "&#65",
+    "&#x41;&#X41;&#xzz;",
+    "&#128;&#129;&#150;",
+    "&#x110000;",
+    "&#xD800;",
+    "&#12ab;",
+    "&amp; &unknown; &copy",
+    "<p>raw</p>\n\n<!-- comment -->",
+    "<pre>  kept  </pre>",
+    "# Title\n\n- item\n- *item*",
+]
+
+
+def assert_same_text(texts: list[str]) -> None:
+    """extract_text returns the text of the reference pipeline on each text"""
+    expected = [markdown_extraction.reference_extract_text(text) for text in texts]
+    assert [extract_text(text) for text in texts] == expected
+
+
+def test_edge_cases_match_the_reference() -> None:
+    assert_same_text(EDGE_CASES)
+
+
+@pytest.mark.parametrize("kind", ["title", "description", "readme"])
+def test_benchmark_corpus_matches_the_reference(kind: str) -> None:
+    texts = markdown_extraction.make_corpus(0, 200)[kind]
+
+    assert_same_text(texts)
+
+
+def test_large_documents_rendered_by_parts_match_the_reference(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(markdown_text, "LARGE_TEXT_SIZE", 2048)
+    rng = random.Random(0)
+    texts = [markdown_extraction.make_markdown(rng, 500) for _ in range(5)]
+
+    assert_same_text(texts)
+
+
+def test_random_whitespace_and_references_match_the_reference() -> None:
+    rng = random.Random(0)
+    alphabet = ["a", "b", " ", "\n", "\t", "\r", "\xa0", " ", "　", "\x1c", "\x85", " ", "&", "#", "1", ";"]
+    texts = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 12))) for _ in range(2000)]
+
+    assert_same_text(texts)
+
+
+@pytest.mark.parametrize(
+    ("name", "text"),
+    [
+        ("65", "A"),
+        ("x41", "A"),
+        ("X41", "A"),
+        ("1", "\x01"),
+        ("0", "�"),
+        ("x110000", "�"),
+        ("xD800", "�"),
+        ("128", "€"),
+        ("129", "\x81"),
+        ("65ab", "Aab"),
+        ("xzz", "zz"),
+    ],
+)
+def test_decode_charref(name: str, text: str) -> None:
+    assert decode_charref(name) == text
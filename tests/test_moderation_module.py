@@ -0,0 +1,225 @@
+"""Tests of the routing of a message through the moderation modules, in each pipeline mode"""
+
+import asyncio
+from collections.abc import Callable
+
+import orjson
+import pytest
+from msfwk.desp.rabbitmq.mq_message import (
+    COOKIE_ACCESS_TOKEN_KEY,
+    TRANSACTION_ID_HEADER_KEY,
+    AutoModerationStatus,
+    AutoModerationType,
+    DespMQMessage,
+    ModerationEventStatus,
+    MQContentModel,
+    MQContentType,
+)
+from msfwk.mqclient import RabbitMQConfig
+
+from automoderation.modules import moderation_module
+from automoderation.modules.moderation_module import ModerationModule, add_module, automod_to_moderation_status
+from benchmarks.pipeline import RABBITMQ_CONFIG, make_corpus
+
+pytestmark = pytest.mark.unit
+
+TEXT = AutoModerationType.Text_Toxicity
+URL = AutoModerationType.Url_Validation
+IMAGE = AutoModerationType.Image_Toxicity
+CONTENT_TYPES = {TEXT: MQContentType.Text, URL: MQContentType.Url, IMAGE: MQContentType.Image}
+
+
+class StaticModule(ModerationModule):
+    """A module giving the same status to every message, after delay seconds"""
+
+    def __init__(
+        self, automoderation_type: AutoModerationType, status: AutoModerationStatus, delay: float = 0
+    ) -> "StaticModule":
+        self.automoderation_type = automoderation_type
+        self.content_type = CONTENT_TYPES[automoderation_type]
+        self.status = status
+        self.delay = delay
+        self.analyzed = 0
+
+    async def analyze(self, _content_list: list[MQContentModel]) -> AutoModerationStatus:
+        await asyncio.sleep(self.delay)
+        self.analyzed += 1
+        return self.status
+
+
+class DeliveredMessage:
+    """The parts of aio_pika.IncomingMessage read by the modules"""
+
+    def __init__(self, routing: list[AutoModerationType]) -> "DeliveredMessage":
+        body = make_corpus(0, 1, toxic_ratio=0, missing_ratio=0, url_port=8000)[0]
+        body["auto_mod_routing"] = [{"moderation_type": routed.value, "status": "Pending"} for routed in routing]
+        self.body = orjson.dumps(body)
+        self.headers = {TRANSACTION_ID_HEADER_KEY: "transaction", COOKIE_ACCESS_TOKEN_KEY: "token"}
+        self.message_id = None
+        self.acked = False
+
+    async def ack(self) -> None:
+        self.acked = True
+
+
+@pytest.fixture
+def published(monkeypatch: pytest.MonkeyPatch) -> list[tuple[str, DespMQMessage]]:
+    """Routing key and message of each publish, without any module registered"""
+    RabbitMQConfig.load_from_dict(RABBITMQ_CONFIG)
+    monkeypatch.setattr(moderation_module, "module_holder", {})
+    messages = []
+
+    async def publish(mq_message: DespMQMessage, _exchange: str, routing_key: str) -> None:
+        messages.append((routing_key, mq_message))
+
+    monkeypatch.setattr(moderation_module, "send_mq_message", publish)
+    return messages
+
+
+def register(
+    automoderation_type: AutoModerationType, status: AutoModerationStatus = AutoModerationStatus.Pass, delay: float = 0
+) -> StaticModule:
+    """Register a module in the process"""
+    module = StaticModule(automoderation_type, status, delay)
+    add_module(module)
+    return module
+
+
+def statuses(mq_message: DespMQMessage) -> dict[AutoModerationType, AutoModerationStatus]:
+    """Status of each auto moderation of a message"""
+    return {moderation.moderation_type: moderation.status for moderation in mq_message.auto_mod_routing}
+
+
+@pytest.mark.parametrize("pipeline_mode", ["fused", "parallel"])
+async def test_in_process_modes_run_the_routed_modules(
+    pipeline_mode: str, published: list, automoderation_settings: Callable[..., object]
+) -> None:
+    automoderation_settings(pipeline_mode=pipeline_mode)
+    text, url = register(TEXT), register(URL)
+    message = DeliveredMessage([TEXT, URL])
+
+    await text.handle_message(message)
+
+    ((routing_key, mq_message),) = published
+    assert routing_key == RabbitMQConfig.TO_HANDLING_RKEY
+    assert mq_message.status == ModerationEventStatus.Accepted
+    assert (text.analyzed, url.analyzed) == (1, 1)
+    assert message.acked
+
+
+@pytest.mark.parametrize("pipeline_mode", ["fused", "parallel"])
+async def test_routed_moderation_without_module_is_need_manual(
+    pipeline_mode: str, published: list, automoderation_settings: Callable[..., object]
+) -> None:
+    automoderation_settings(pipeline_mode=pipeline_mode)
+    text = register(TEXT)
+
+    await text.handle_message(DeliveredMessage([TEXT, IMAGE]))
+
+    ((routing_key, mq_message),) = published
+    assert routing_key == RabbitMQConfig.TO_HANDLING_RKEY
+    assert statuses(mq_message) == {TEXT: AutoModerationStatus.Pass, IMAGE: AutoModerationStatus.Need_Manual}
+    assert mq_message.status == ModerationEventStatus.Manual_Pending
+    assert any(IMAGE.value in entry and "no module" in entry for entry in mq_message.history)
+
+
+def test_pending_moderation_is_never_accepted() -> None:
+    body = make_corpus(0, 1, toxic_ratio=0, missing_ratio=0, url_port=8000)[0]
+    body["auto_mod_routing"] = [
+        {"moderation_type": TEXT.value, "status": "Pass"},
+        {"moderation_type": IMAGE.value, "status": "Pending"},
+    ]
+    mq_message = DespMQMessage.from_dict(body)
+
+    automod_to_moderation_status(mq_message)
+
+    assert mq_message.status == ModerationEventStatus.Manual_Pending
+
+
+async def test_chained_worker_forwards_to_the_queue_of_the_next_module(
+    published: list, automoderation_settings: Callable[..., object]
+) -> None:
+    automoderation_settings(pipeline_mode="chained")
+    # A supervisor worker holds only its own module
+    text = register(TEXT)
+
+    await text.handle_message(DeliveredMessage([TEXT, URL]))
+
+    ((routing_key, mq_message),) = published
+    assert routing_key == RabbitMQConfig.TO_AUTO_URL_VALIDATION_RKEY
+    assert statuses(mq_message) == {TEXT: AutoModerationStatus.Pass, URL: AutoModerationStatus.Pending}
+    assert mq_message.status == ModerationEventStatus.Auto_Pending
+
+
+async def test_chained_moderation_without_queue_is_need_manual(
+    published: list, automoderation_settings: Callable[..., object]
+) -> None:
+    automoderation_settings(pipeline_mode="chained")
+    text = register(TEXT)
+
+    await text.handle_message(DeliveredMessage([TEXT, IMAGE, URL]))
+
+    ((routing_key, mq_message),) = published
+    assert routing_key == RabbitMQConfig.TO_AUTO_URL_VALIDATION_RKEY
+    assert statuses(mq_message)[IMAGE] == AutoModerationStatus.Need_Manual
+
+    published.clear()
+    await text.handle_message(DeliveredMessage([TEXT, IMAGE]))
+
+    ((routing_key, mq_message),) = published
+    assert routing_key == RabbitMQConfig.TO_HANDLING_RKEY
+    assert mq_message.status == ModerationEventStatus.Manual_Pending
+
+
+def skipped(mq_message: DespMQMessage) -> list[str]:
+    """History entries of the auto moderations skipped once the verdict was final"""
+    return [entry for entry in mq_message.history if "skipped" in entry]
+
+
+@pytest.mark.parametrize("pipeline_mode", ["chained", "fused", "parallel"])
+async def test_fail_fast_sends_a_failed_message_straight_to_handling(
+    pipeline_mode: str, published: list, automoderation_settings: Callable[..., object]
+) -> None:
+    automoderation_settings(pipeline_mode=pipeline_mode, fail_fast=True)
+    text = register(TEXT, AutoModerationStatus.Failed)
+    url = register(URL, delay=0.5)
+
+    await text.handle_message(DeliveredMessage([TEXT, URL]))
+
+    ((routing_key, mq_message),) = published
+    assert routing_key == RabbitMQConfig.TO_HANDLING_RKEY
+    assert mq_message.status == ModerationEventStatus.Rejected
+    assert statuses(mq_message) == {TEXT: AutoModerationStatus.Failed, URL: AutoModerationStatus.Pending}
+    assert skipped(mq_message) == [f"Automoderation [{URL.value}]: skipped, verdict is final"]
+    assert url.analyzed == 0
+
+
+@pytest.mark.parametrize("pipeline_mode", ["fused", "parallel"])
+async def test_without_fail_fast_every_routed_module_runs(
+    pipeline_mode: str, published: list, automoderation_settings: Callable[..., object]
+) -> None:
+    automoderation_settings(pipeline_mode=pipeline_mode, fail_fast=False)
+    text = register(TEXT, AutoModerationStatus.Failed)
+    url = register(URL, delay=0.01)
+
+    await text.handle_message(DeliveredMessage([TEXT, URL]))
+
+    ((routing_key, mq_message),) = published
+    assert routing_key == RabbitMQConfig.TO_HANDLING_RKEY
+    assert mq_message.status == ModerationEventStatus.Rejected
+    assert statuses(mq_message) == {TEXT: AutoModerationStatus.Failed, URL: AutoModerationStatus.Pass}
+    assert skipped(mq_message) == []
+    assert url.analyzed == 1
+
+
+async def test_without_fail_fast_a_failed_message_is_forwarded_to_the_next_queue(
+    published: list, automoderation_settings: Callable[..., object]
+) -> None:
+    automoderation_settings(pipeline_mode="chained", fail_fast=False)
+    text = register(TEXT, AutoModerationStatus.Failed)
+
+    await text.handle_message(DeliveredMessage([TEXT, URL]))
+
+    ((routing_key, mq_message),) = published
+    assert routing_key == RabbitMQConfig.TO_AUTO_URL_VALIDATION_RKEY
+    assert skipped(mq_message) == []
@@ -0,0 +1,118 @@
+"""Tests of the settlement of the messages whose handling raises"""
+
+import asyncio
+
+import pytest
+
+from automoderation.utils import mq_consumer
+
+pytestmark = pytest.mark.unit
+
+QUEUE_NAME = "text_toxicity"
+
+
+class DeliveredMessage:
+    """The parts of aio_pika.IncomingMessage settled by the consumer"""
+
+    def __init__(self, redelivered: bool) -> "DeliveredMessage":
+        self.body = b'{"id": "message-1"}'
+        self.redelivered = redelivered
+        self.processed = False
+        self.settled: list[str] = []
+
+    async def ack(self) -> None:
+        self.settled.append("ack")
+        self.processed = True
+
+    async def nack(self, requeue: bool = True) -> None:
+        self.settled.append("requeue" if requeue else "nack")
+        self.processed = True
+
+
+class FakeQueue:
+    """Queue delivering the messages to the callback of its consumer"""
+
+    def __init__(self) -> "FakeQueue":
+        self.on_message = None
+        self.consuming = asyncio.Event()
+
+    async def consume(self, on_message: object) -> str:
+        self.on_message = on_message
+        self.consuming.set()
+        return "consumer"
+
+    async def cancel(self, _consumer_tag: str) -> None:
+        pass
+
+
+@pytest.fixture
+def queue(monkeypatch: pytest.MonkeyPatch) -> FakeQueue:
+    """The queue consumed by consume_queue, without RabbitMQ"""
+    queue = FakeQueue()
+
+    class Channel:
+        async def set_qos(self, prefetch_count: int) -> None:
+            pass
+
+        async def declare_queue(self, _name: str, durable: bool) -> FakeQueue:
+            return queue
+
+    class Connection:
+        async def channel(self) -> Channel:
+            return Channel()
+
+    class Client:
+        async def setup(self) -> None:
+            self.connection = Connection()
+
+        async def close(self) -> None:
+            pass
+
+    monkeypatch.setattr(mq_consumer, "MQClient", Client)
+    return queue
+
+
+@pytest.fixture
+def error_queue(monkeypatch: pytest.MonkeyPatch) -> list[tuple[str, str]]:
+    """Content and error of the messages sent to the error queue"""
+    errors = []
+
+    async def send_error_message(content: str, error: str) -> None:
+        errors.append((content, error))
+
+    monkeypatch.setattr(mq_consumer, "send_error_message", send_error_message)
+    return errors
+
+
+async def test_failing_message_is_requeued_once_then_sent_to_the_error_queue(
+    queue: FakeQueue, error_queue: list[tuple[str, str]]
+) -> None:
+    async def on_message(_message: DeliveredMessage) -> None:
+        message = "poison message"
+        raise ValueError(message)
+
+    stopping = asyncio.Event()
+    consumer = asyncio.create_task(mq_consumer.consume_queue(QUEUE_NAME, on_message, 1, stopping))
+    await queue.consuming.wait()
+    delivery, redelivery = DeliveredMessage(redelivered=False), DeliveredMessage(redelivered=True)
+
+    await queue.on_message(delivery)
+    assert delivery.settled == ["requeue"]
+    assert error_queue == []
+
+    await queue.on_message(redelivery)
+    assert redelivery.settled == ["ack"]
+    assert error_queue == [('{"id": "message-1"}', "ValueError: poison message")]
+
+    stopping.set()
+    await consumer
+
+
+async def test_message_settled_by_its_handler_is_left_alone(error_queue: list[tuple[str, str]]) -> None:
+    message = DeliveredMessage(redelivered=True)
+    await message.ack()
+
+    await mq_consumer.reject(QUEUE_NAME, message, ValueError("after the ack"))
+
+    assert message.settled == ["ack"]
+    assert error_queue == []
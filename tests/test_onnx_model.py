@@ -0,0 +1,150 @@
+"""Tests of the local ONNX toxicity model, on the tiny model of tests/resources"""
+
+import asyncio
+import math
+from collections.abc import Callable
+
+import pytest
+from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus, MQContentModel, MQContentType
+
+from tests.conftest import RESOURCES
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+
+pytestmark = pytest.mark.unit
+
+LABELS = ["toxicity", "severe_toxicity", "obscene", "threat", "insult", "identity_attack"]
+
+
+def load_model(
+    automoderation_settings: Callable[..., object], chunking: dict | None = None, **local_model: object
+) -> object:
+    """Create an OnnxToxicityModel on the tiny model, without the status cache"""
+    from automoderation.ai_models.onnx.model import OnnxToxicityModel
+
+    automoderation_settings(
+        model_backend="local",
+        local_model={
+            "model_path": str(RESOURCES / "tiny_toxicity.onnx"),
+            "tokenizer_path": str(RESOURCES / "tiny_tokenizer.json"),
+            **local_model,
+        },
+        toxicity_cache={"enabled": False},
+        toxicity_chunking=chunking or {},
+    )
+    return OnnxToxicityModel()
+
+
+@pytest.fixture
+def model(automoderation_settings: Callable[..., object]) -> object:
+    """The tiny model with the default settings"""
+    return load_model(automoderation_settings)
+
+
+def test_infer_scores_each_label_of_each_text(model: object) -> None:
+    scores = model.infer(["hello", "you idiot", "rude and nice"])
+
+    assert [list(text_scores) for text_scores in scores] == [["hello"], ["you idiot"], ["rude and nice"]]
+    hello, idiot, rude = (next(iter(text_scores.values())) for text_scores in scores)
+    assert list(hello) == LABELS
+    assert hello["toxicity"] == pytest.approx(1 / (1 + math.exp(3)))
+    assert idiot["toxicity"] == pytest.approx(1 / (1 + math.exp(-5)))
+    assert rude["insult"] == pytest.approx(1 / (1 + math.exp(-0.5)))
+
+
+def test_infer_ignores_the_padding(model: object) -> None:
+    alone = model.infer(["idiot"])[0]["idiot"]
+    padded = model.infer(["idiot", "hello hello hello hello hello"])[0]["idiot"]
+
+    assert padded == pytest.approx(alone)
+
+
+def test_infer_without_sigmoid_returns_logits(automoderation_settings: Callable[..., object]) -> None:
+    model = load_model(automoderation_settings, apply_sigmoid=False)
+
+    assert model.infer(["hello"])[0]["hello"]["toxicity"] == pytest.approx(-3)
+
+
+@pytest.mark.parametrize(
+    ("text", "status"),
+    [
+        ("hello", AutoModerationStatus.Pass),
+        ("that is rude", AutoModerationStatus.Need_Manual),
+        ("you idiot", AutoModerationStatus.Failed),
+    ],
+)
+async def test_evaluate_text(model: object, text: str, status: AutoModerationStatus) -> None:
+    assert await model.evaluate_text(text) == status
+
+
+async def test_concurrent_texts_are_scored_in_one_batch(model: object) -> None:
+    batches = []
+    infer = model.infer
+
+    def record_infer(texts: list[str]) -> list[dict[str, dict[str, float]]]:
+        batches.append(texts)
+        return infer(texts)
+
+    model.infer = record_infer
+    statuses = await asyncio.gather(*(model.evaluate_text(text) for text in ["hello", "rude", "idiot"]))
+
+    assert statuses == [AutoModerationStatus.Pass, AutoModerationStatus.Need_Manual, AutoModerationStatus.Failed]
+    assert batches == [["hello", "rude", "idiot"]]
+
+
+async def test_wrong_number_of_labels_is_need_manual(automoderation_settings: Callable[..., object]) -> None:
+    model = load_model(automoderation_settings, labels=["toxicity", "insult"])
+
+    assert await model.evaluate_text("idiot") == AutoModerationStatus.Need_Manual
+
+
+def test_version_defaults_to_the_model_file(model: object, automoderation_settings: Callable[..., object]) -> None:
+    assert model.version.endswith("tiny_toxicity.onnx")
+    assert load_model(automoderation_settings, model_version="v2").version.endswith("v2")
+
+
+async def test_risky_sentences_are_located_in_their_chunks(automoderation_settings: Callable[..., object]) -> None:
+    from automoderation.modules.text_toxicity import TextToxicityModule
+
+    model = load_model(automoderation_settings, chunking={"max_chunk_chars": 40})
+    text = "Hello there. Nice to see you. You idiot. Hello again. Hello hello. That is rude. Nice day."
+    content = MQContentModel(name="text", type=MQContentType.Text, value=text)
+
+    risks = await model.evaluate_risks(content)
+    located = await model.locate_risks(risks)
+
+    # The chunks pack several sentences
+    assert 1 < len(risks.sentences) < text.count(".")
+    assert TextToxicityModule.risky_sentences(located) == ["[Failed] You idiot.", "[Need_Manual] That is rude."]
+
+
+def test_risky_sentences_are_shortened() -> None:
+    from automoderation.models.interfaces import SentenceStatusModel, TextToxicityRiskModel
+    from automoderation.modules.text_toxicity import MAX_REASON_CHARS, TextToxicityModule
+
+    risks = TextToxicityRiskModel(
+        sentences=[SentenceStatusModel(sentence="idiot " * 100, risk=AutoModerationStatus.Failed)]
+    )
+
+    (reason,) = TextToxicityModule.risky_sentences(risks)
+    assert reason.startswith("[Failed] idiot idiot")
+    assert len(reason) <= len("[Failed] ") + MAX_REASON_CHARS
+    assert reason.endswith("…")
+
+
+@pytest.mark.parametrize("error", ["Fail", "InvalidArgument", "RuntimeException"])
+async def test_inference_error_is_need_manual(model: object, error: str) -> None:
+    from onnxruntime.capi import onnxruntime_pybind11_state
+
+    from automoderation.ai_models.exceptions import ModelError
+
+    class FailingSession:
+        def run(self, *_: object) -> None:
+            raise getattr(onnxruntime_pybind11_state, error)("inference failed")
+
+    model.session = FailingSession()
+
+    with pytest.raises(ModelError):
+        await model.score_batch(["hello"])
+    assert await model.evaluate_text("you idiot") == AutoModerationStatus.Need_Manual
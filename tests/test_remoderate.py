@@ -0,0 +1,88 @@
+"""Tests of the bulk re-moderation CLI, on the url validation of a small dump"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from benchmarks.pipeline import make_corpus
+
+pytestmark = pytest.mark.unit
+
+ROOT = Path(__file__).parent.parent
+
+
+def make_message(number: int, stored_status: str, url: str) -> dict:
+    """A stored message whose text passed, linking to url"""
+    message = make_corpus(number, 1, toxic_ratio=0, missing_ratio=0, url_port=8000)[0]
+    message.update(id=f"message-{number}", status=stored_status)
+    message["content"]["data_by_type"]["Url"] = [{"name": "link", "value": url, "rejected_reasons": []}]
+    message["auto_mod_routing"] = [
+        {"moderation_type": "Text_Toxicity", "status": "Pass"},
+        {"moderation_type": "Url_Validation", "status": "Pass" if stored_status == "Accepted" else "Failed"},
+    ]
+    return message
+
+
+@pytest.fixture
+def config_file(tmp_path: Path) -> Path:
+    """Service config whose domain index decides the url checks, without any request"""
+    domains = tmp_path / "domains.yaml"
+    domains.write_text("allow: [trusted.org]\nblock: [blocked.org]\n", encoding="utf-8")
+    config = {"services": {"automoderation": {"url_validation": {"domain_reputation": {"path": str(domains)}}}}}
+    path = tmp_path / "config.yaml"
+    # JSON is valid YAML
+    path.write_text(json.dumps(config), encoding="utf-8")
+    return path
+
+
+def test_dump_is_remoderated_in_order(tmp_path: Path, config_file: Path) -> None:
+    dump = tmp_path / "dump.jsonl"
+    lines = [
+        json.dumps(make_message(1, "Accepted", "https://blocked.org/page")),
+        "",
+        "{not json",
+        json.dumps(make_message(2, "Rejected", "https://trusted.org/page")),
+    ]
+    dump.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    output = tmp_path / "verdicts.jsonl"
+
+    result = subprocess.run(
+        [sys.executable, "-m", "automoderation.remoderate", str(dump), "-o", str(output), "-m", "Url_Validation"]
+        + ["--processes", "1", "--chunk-size", "2"],
+        cwd=ROOT,
+        env={**os.environ, "APP_CONFIG_FILE": str(config_file)},
+        capture_output=True,
+        text=True,
+        timeout=60,
+        check=False,
+    )
+
+    assert result.returncode == 0, result.stderr
+    blocked, malformed, trusted = (json.loads(line) for line in output.read_text(encoding="utf-8").splitlines())
+    assert {key: blocked[key] for key in ["source", "line", "id", "stored_status", "status", "changed"]} == {
+        "source": str(dump),
+        "line": 1,
+        "id": "message-1",
+        "stored_status": "Accepted",
+        "status": "Rejected",
+        "changed": True,
+    }
+    assert blocked["auto_moderations"] == {
+        "Text_Toxicity": {"stored": "Pass", "status": "Pass"},
+        "Url_Validation": {"stored": "Pass", "status": "Failed"},
+    }
+    assert list(blocked["rejected_reasons"]) == ["link"]
+    assert malformed["line"] == 3
+    assert malformed["error"].startswith("JSONDecodeError")
+    assert (trusted["line"], trusted["status"], trusted["changed"], trusted["rejected_reasons"]) == (
+        4,
+        "Accepted",
+        True,
+        {},
+    )
+    summary = [line.split() for line in result.stderr.splitlines() if line.strip()]
+    assert summary[-3:] == [["Accepted", "->", "Rejected", "1"], ["Rejected", "->", "Accepted", "1"], ["error", "1"]]
@@ -0,0 +1,100 @@
+"""Tests of the toxicity result cache and of its redis tier"""
+
+import asyncio
+
+import msfwk.redis
+import pytest
+from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus
+
+from automoderation.ai_models.result_cache import ToxicityResultCache
+from automoderation.utils.settings import ResultCacheSettings
+
+pytestmark = pytest.mark.unit
+
+VERSION = "model-1"
+TTL = 0.05
+
+
+class FakeRedis:
+    """The RedisClient calls of the cache, on a dict"""
+
+    def __init__(self, host: str, port: str, ttl: int | None = None, db: int = 0) -> "FakeRedis":
+        self.address = (host, port, ttl, db)
+        self.values: dict[str, str | bytes] = {}
+        self.reads = 0
+
+    async def get(self, key: str) -> str | bytes | None:
+        self.reads += 1
+        return self.values.get(key)
+
+    async def set(self, key: str, value: str) -> None:
+        self.values[key] = value
+
+
+@pytest.fixture
+def redis_cache(monkeypatch: pytest.MonkeyPatch) -> ToxicityResultCache:
+    """A cache with a redis tier"""
+    monkeypatch.setattr(msfwk.redis, "RedisClient", FakeRedis)
+    return ToxicityResultCache(ResultCacheSettings(ttl=TTL, redis_host="redis", redis_port=6380), VERSION)
+
+
+async def test_status_is_cached_by_normalized_text() -> None:
+    cache = ToxicityResultCache(ResultCacheSettings(), VERSION)
+    assert await cache.get("some  text") is None
+
+    await cache.set("some  text", AutoModerationStatus.Failed)
+
+    assert await cache.get("some text\n") == AutoModerationStatus.Failed
+    assert await cache.get("other text") is None
+    assert cache.local.stats == {"hit": 1, "miss": 2, "eviction": 0}
+
+
+async def test_statuses_of_another_version_are_not_reused() -> None:
+    settings = ResultCacheSettings()
+    cache = ToxicityResultCache(settings, VERSION)
+
+    assert cache.make_key("text") != ToxicityResultCache(settings, "model-2").make_key("text")
+    assert cache.make_key("text") == ToxicityResultCache(settings, VERSION).make_key("text")
+
+
+async def test_disabled_cache_stores_nothing() -> None:
+    cache = ToxicityResultCache(ResultCacheSettings(enabled=False), VERSION)
+
+    await cache.set("text", AutoModerationStatus.Pass)
+
+    assert await cache.get("text") is None
+    assert len(cache.local) == 0
+
+
+async def test_status_is_stored_in_both_tiers(redis_cache: ToxicityResultCache) -> None:
+    await redis_cache.set("text", AutoModerationStatus.Need_Manual)
+
+    host, port, _ttl, db = redis_cache.redis.address
+    assert (host, port, db) == ("redis", "6380", 0)
+    assert redis_cache.redis.values == {redis_cache.make_key("text"): "Need_Manual"}
+    assert await redis_cache.get("text") == AutoModerationStatus.Need_Manual
+    assert redis_cache.redis.reads == 0
+
+
+async def test_local_miss_falls_back_to_redis(redis_cache: ToxicityResultCache) -> None:
+    await redis_cache.set("text", AutoModerationStatus.Failed)
+    await asyncio.sleep(TTL)
+
+    # Expired locally, read from redis then cached locally again
+    assert await redis_cache.get("text") == AutoModerationStatus.Failed
+    assert await redis_cache.get("text") == AutoModerationStatus.Failed
+    assert redis_cache.redis.reads == 1
+
+
+@pytest.mark.parametrize(
+    ("value", "status"),
+    [(b"Pass", AutoModerationStatus.Pass), ("Failed", AutoModerationStatus.Failed), (b"Unknown", None), (None, None)],
+)
+async def test_redis_value_is_decoded(
+    redis_cache: ToxicityResultCache, value: str | bytes | None, status: AutoModerationStatus | None
+) -> None:
+    if value is not None:
+        redis_cache.redis.values[redis_cache.make_key("text")] = value
+
+    assert await redis_cache.get("text") == status
+    assert len(redis_cache.local) == (status is not None)
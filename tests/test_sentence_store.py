@@ -0,0 +1,85 @@
+"""Tests of the incremental moderation of edited texts, reusing the status of their unchanged sentences"""
+
+import pytest
+from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus, MQContentModel
+
+from automoderation.ai_models.abstract_model import AbstractModel
+from automoderation.ai_models.detoxify.threshold import DetoxifyToxicityThresholds
+from automoderation.ai_models.sentence_store import fingerprint
+from automoderation.utils.settings import ChunkingSettings, IncrementalModerationSettings, ResultCacheSettings
+
+pytestmark = pytest.mark.unit
+
+CONTENT_KEY = "content-1:text"
+
+
+class KeywordModel(AbstractModel):
+    """Score the texts containing "idiot" as highly toxic, and record the scored texts"""
+
+    toxic_thresholds = DetoxifyToxicityThresholds
+
+    def __init__(self) -> "KeywordModel":
+        self.scored: list[str] = []
+        super().__init__(
+            batch_size=8,
+            batch_max_wait=0,
+            cache_settings=ResultCacheSettings(enabled=False),
+            chunking=ChunkingSettings(max_chunk_chars=40),
+            incremental=IncrementalModerationSettings(enabled=True),
+        )
+
+    async def score_batch(self, texts: list[str]) -> list[dict[str, dict[str, float]]]:
+        self.scored.extend(texts)
+        return [{text: {"toxicity": 0.9 if "idiot" in text else 0.1}} for text in texts]
+
+
+async def evaluate(model: KeywordModel, text: str) -> list[str]:
+    """Moderate a version of the content, return the sentences scored by the model"""
+    model.scored.clear()
+    await model.evaluate_risks(MQContentModel(name="text", value=text), CONTENT_KEY)
+    return sorted(model.scored)
+
+
+@pytest.mark.parametrize(
+    ("first", "second"),
+    [
+        ("Hello there.", "Hello  there."),
+        ("Hello there.", "Hello\nthere."),
+        ("Ｈｅｌｌｏ there.", "Hello there."),
+    ],
+)
+def test_fingerprint_ignores_unicode_forms_and_whitespaces(first: str, second: str) -> None:
+    assert fingerprint(first) == fingerprint(second)
+
+
+def test_fingerprint_of_different_sentences_differ() -> None:
+    assert fingerprint("Hello there.") != fingerprint("Hello there!")
+
+
+async def test_edit_scores_only_the_new_sentences() -> None:
+    model = KeywordModel()
+    text = "The first sentence is fine. The second sentence too. The third one as well."
+
+    assert await evaluate(model, text) == [
+        "The first sentence is fine.",
+        "The second sentence too.",
+        "The third one as well.",
+    ]
+    edited = "The first sentence is fine. The second  sentence too. You idiot. The third one as well."
+
+    assert await evaluate(model, edited) == ["You idiot."]
+    assert await evaluate(model, edited) == []
+
+
+async def test_status_of_the_reused_sentences_is_kept() -> None:
+    model = KeywordModel()
+    text = "You are such an idiot, really. The rest of the text is fine."
+    await evaluate(model, text)
+    model.scored.clear()
+
+    risks = await model.evaluate_risks(
+        MQContentModel(name="text", value=f"{text} A new sentence is added."), CONTENT_KEY
+    )
+
+    assert risks.status == AutoModerationStatus.Failed
+    assert model.scored == ["A new sentence is added."]
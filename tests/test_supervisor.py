@@ -0,0 +1,83 @@
+"""Tests of the restart of the worker processes by the supervisor"""
+
+import multiprocessing
+from pathlib import Path
+
+import pytest
+from msfwk.desp.rabbitmq.mq_message import AutoModerationType
+
+from automoderation import supervisor
+from automoderation.supervisor import Supervisor, WorkerSlot
+from automoderation.utils.settings import SupervisorSettings
+
+pytestmark = pytest.mark.unit
+
+
+class ExitedProcess:
+    """A worker process which exited"""
+
+    pid = 1234
+
+    def __init__(self, exitcode: int) -> "ExitedProcess":
+        self.exitcode = exitcode
+
+    def is_alive(self) -> bool:
+        return False
+
+
+@pytest.fixture(autouse=True)
+def metrics_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """The metric files of the dead workers are looked up in a temporary directory"""
+    monkeypatch.setenv(supervisor.MULTIPROCESS_DIR_ENV, str(tmp_path))
+
+
+def exit_worker(slot: WorkerSlot, exitcode: int, ready: bool) -> None:
+    """Make the process of a slot exit, after it consumed or not"""
+    slot.ready = multiprocessing.get_context("spawn").Event()
+    if ready:
+        slot.ready.set()
+    slot.process = ExitedProcess(exitcode)
+    slot.restart_at = None
+
+
+def test_repeated_startup_failures_stop_the_supervisor() -> None:
+    manager = Supervisor({AutoModerationType.Text_Toxicity: 1}, SupervisorSettings(max_startup_failures=3))
+    (slot,) = manager.slots
+
+    for _ in range(2):
+        exit_worker(slot, 1, ready=False)
+        manager.check_worker(slot)
+        assert slot.restart_at is not None
+    exit_worker(slot, 1, ready=False)
+    manager.check_worker(slot)
+
+    assert manager.failed
+    assert manager.stopping
+    assert slot.restart_at is None
+
+
+def test_crash_after_startup_is_restarted() -> None:
+    manager = Supervisor({AutoModerationType.Text_Toxicity: 1}, SupervisorSettings(max_startup_failures=2))
+    (slot,) = manager.slots
+
+    exit_worker(slot, 1, ready=False)
+    manager.check_worker(slot)
+    for _ in range(3):
+        exit_worker(slot, 1, ready=True)
+        manager.check_worker(slot)
+
+    assert not manager.failed
+    assert slot.startup_failures == 0
+    assert slot.restart_at is not None
+
+
+def test_startup_failures_are_not_counted_without_limit() -> None:
+    manager = Supervisor({AutoModerationType.Text_Toxicity: 1}, SupervisorSettings(max_startup_failures=0))
+    (slot,) = manager.slots
+
+    for _ in range(10):
+        exit_worker(slot, 1, ready=False)
+        manager.check_worker(slot)
+
+    assert not manager.failed
+    assert slot.restart_at is not None
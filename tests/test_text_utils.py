@@ -0,0 +1,43 @@
+"""Tests of the split of texts into sentences and chunks"""
+
+import random
+
+import pytest
+
+from automoderation.utils.text_utils import split_into_chunks
+
+pytestmark = pytest.mark.unit
+
+
+def test_sentences_are_packed_into_chunks() -> None:
+    text = "First one. Second one! Third one? Fourth."
+
+    assert split_into_chunks(text, 25) == ["First one. Second one!", "Third one? Fourth."]
+
+
+def test_long_sentence_is_cut_on_whitespaces() -> None:
+    chunks = split_into_chunks("Short. one two three four five six", 10)
+
+    assert chunks == ["Short.", "one two", "three four", "five six"]
+
+
+def test_sentence_without_whitespace_is_cut_anywhere() -> None:
+    assert split_into_chunks("abcdefghij", 4) == ["abcd", "efgh", "ij"]
+
+
+@pytest.mark.parametrize("text", ["", "   ", "\n\n"])
+def test_empty_text_has_no_chunk(text: str) -> None:
+    assert split_into_chunks(text, 10) == []
+
+
+def test_chunks_keep_the_characters_of_the_text_in_order() -> None:
+    rng = random.Random(0)
+    words = ["a", "word", "longerword", "x" * 30, "end.", "stop!", "why?"]
+    for _ in range(500):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(1, 60)))
+        max_chars = rng.randint(1, 80)
+
+        chunks = split_into_chunks(text, max_chars)
+
+        assert all(0 < len(chunk) <= max_chars for chunk in chunks)
+        assert "".join(chunks).replace(" ", "") == text.replace(" ", "")
@@ -0,0 +1,76 @@
+"""Tests of the threshold matrix, against the per text matching of the scores it replaces"""
+
+import math
+import random
+
+import pytest
+from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus
+
+from automoderation.ai_models.detoxify.threshold import DetoxifyToxicityThresholds
+from automoderation.ai_models.threshold_matrix import ThresholdMatrix
+from automoderation.utils.status_utils import aggregate_status
+
+pytestmark = pytest.mark.unit
+
+TOXICITY_MATRIX = ThresholdMatrix({"toxicity": DetoxifyToxicityThresholds.to_status_thresholds()})
+
+
+def per_text_status(text_scores: dict[str, dict[str, float]]) -> AutoModerationStatus:
+    """Status of a text, matching the toxicity score of each of its parts one by one"""
+    return aggregate_status(
+        [DetoxifyToxicityThresholds.match_score_to_status(scores["toxicity"]) for scores in text_scores.values()]
+    )
+
+
+def test_batch_matches_the_per_text_statuses() -> None:
+    rng = random.Random(0)
+    # The thresholds themselves are reached
+    values = [0, 0.25, 0.75, 1, math.nextafter(0.25, 0), math.nextafter(0.75, 0)]
+    batch = [
+        {
+            f"part {part}": {"toxicity": rng.choice(values) if rng.random() < 0.3 else rng.random()}
+            for part in range(rng.randint(1, 5))
+        }
+        for _ in range(2000)
+    ]
+
+    assert TOXICITY_MATRIX.evaluate_batch(batch) == [per_text_status(text_scores) for text_scores in batch]
+
+
+def test_text_reaches_the_most_important_status_of_its_labels() -> None:
+    matrix = ThresholdMatrix(
+        {
+            "toxicity": DetoxifyToxicityThresholds.to_status_thresholds(),
+            "threat": {AutoModerationStatus.Need_Manual: 0.1, AutoModerationStatus.Failed: 0.5},
+        }
+    )
+
+    statuses = matrix.evaluate_batch(
+        [
+            {"a": {"toxicity": 0.1, "threat": 0.05}},
+            {"a": {"toxicity": 0.1, "threat": 0.2}},
+            {"a": {"toxicity": 0.3, "threat": 0}, "b": {"toxicity": 0, "threat": 0.6}},
+        ]
+    )
+
+    assert statuses == [AutoModerationStatus.Pass, AutoModerationStatus.Need_Manual, AutoModerationStatus.Failed]
+
+
+@pytest.mark.parametrize(
+    "text_scores",
+    [
+        {},
+        "not scores",
+        {"a": {"insult": 0.9}},
+        {"a": {"toxicity": None}},
+        {"a": {"toxicity": True}},
+        {"a": {"toxicity": "0.1"}},
+        {"a": {"toxicity": math.nan}},
+        {"a": {"toxicity": 0.1}, "b": {}},
+    ],
+)
+def test_text_without_every_score_gets_no_status(text_scores: object) -> None:
+    assert TOXICITY_MATRIX.evaluate_batch([{"a": {"toxicity": 0.9}}, text_scores]) == [
+        AutoModerationStatus.Failed,
+        None,
+    ]
@@ -0,0 +1,142 @@
+"""Tests of the concurrent url checks of the url validation module"""
+
+import asyncio
+from collections import Counter
+from collections.abc import Callable
+from urllib.parse import urlparse
+
+import pytest
+from msfwk.desp.rabbitmq.mq_message import AutoModerationStatus
+from msfwk.mqclient import RabbitMQConfig
+
+from automoderation.modules.url_validation import UrlValidationModule
+from benchmarks.pipeline import RABBITMQ_CONFIG
+
+pytestmark = pytest.mark.unit
+
+MAX_PER_HOST = 2
+CHECK_LATENCY = 0.02
+
+
+class FakeAccessibilityCheck:
+    """Check of the url accessibility, answering the status of each url after CHECK_LATENCY"""
+
+    def __init__(self) -> "FakeAccessibilityCheck":
+        self.statuses: dict[str, AutoModerationStatus] = {}
+        self.checked: Counter[str] = Counter()
+        self.running: Counter[str] = Counter()
+        self.max_running: Counter[str] = Counter()
+
+    async def __call__(self, url: str) -> tuple[AutoModerationStatus, str | None]:
+        host = urlparse(url).hostname
+        self.checked[url] += 1
+        self.running[host] += 1
+        self.max_running[host] = max(self.max_running[host], self.running[host])
+        try:
+            await asyncio.sleep(CHECK_LATENCY)
+        finally:
+            self.running[host] -= 1
+        status = self.statuses.get(url, AutoModerationStatus.Pass)
+        return status, None if status == AutoModerationStatus.Pass else f"{url} is {status.value}"
+
+
+@pytest.fixture
+def accessibility() -> FakeAccessibilityCheck:
+    return FakeAccessibilityCheck()
+
+
+@pytest.fixture
+def make_module(
+    automoderation_settings: Callable[..., object], accessibility: FakeAccessibilityCheck
+) -> Callable[..., UrlValidationModule]:
+    """Create a url validation module from url_validation settings, checking the urls with accessibility"""
+    RabbitMQConfig.load_from_dict(RABBITMQ_CONFIG)
+
+    def make(**url_validation: object) -> UrlValidationModule:
+        automoderation_settings(url_validation={"max_per_host": MAX_PER_HOST, **url_validation})
+        module = UrlValidationModule()
+        module.check_url_accessibility = accessibility
+        return module
+
+    return make
+
+
+async def test_checks_of_a_host_are_limited(
+    make_module: Callable[..., UrlValidationModule], accessibility: FakeAccessibilityCheck
+) -> None:
+    module = make_module(max_concurrency=64)
+    urls = [f"https://{host}.org/page/{page}" for host in ["slow", "fast"] for page in range(3 * MAX_PER_HOST)]
+
+    results = await module.check_urls(urls)
+
+    assert set(results) == set(urls)
+    assert accessibility.max_running == {"slow.org": MAX_PER_HOST, "fast.org": MAX_PER_HOST}
+    assert not module.host_limit._semaphores
+
+
+async def test_checks_are_limited_globally(
+    make_module: Callable[..., UrlValidationModule], accessibility: FakeAccessibilityCheck
+) -> None:
+    module = make_module(max_concurrency=1)
+    urls = [f"https://host-{host}.org/" for host in range(4)]
+
+    async def check_alone(url: str) -> tuple[AutoModerationStatus, str | None]:
+        assert sum(accessibility.running.values()) == 0
+        return await accessibility(url)
+
+    module.check_url_accessibility = check_alone
+    await module.check_urls(urls)
+
+    assert sum(accessibility.checked.values()) == len(urls)
+
+
+async def test_verdicts_are_cached_for_the_ttl_of_their_status(
+    make_module: Callable[..., UrlValidationModule], accessibility: FakeAccessibilityCheck
+) -> None:
+    short_ttl = 5 * CHECK_LATENCY
+    module = make_module(verdict_cache={"pass_ttl": 60, "failed_ttl": 60, "need_manual_ttl": short_ttl})
+    passing, failing, unsure = "https://ok.org/", "https://ko.org/", "https://unsure.org/"
+    accessibility.statuses.update({failing: AutoModerationStatus.Failed, unsure: AutoModerationStatus.Need_Manual})
+
+    first = await module.check_urls([passing, failing, unsure])
+    assert await module.check_urls([passing, failing, unsure]) == first
+    assert accessibility.checked == {passing: 1, failing: 1, unsure: 1}
+
+    await asyncio.sleep(short_ttl)
+    await module.check_urls([passing, failing, unsure])
+    assert accessibility.checked == {passing: 1, failing: 1, unsure: 2}
+
+
+async def test_equivalent_urls_share_their_verdict(
+    make_module: Callable[..., UrlValidationModule], accessibility: FakeAccessibilityCheck
+) -> None:
+    module = make_module()
+
+    await module.check_urls(["https://Example.org:443/#top"])
+    results = await module.check_urls(["HTTPS://example.org"])
+
+    assert results == {"HTTPS://example.org": (AutoModerationStatus.Pass, None)}
+    assert sum(accessibility.checked.values()) == 1
+
+
+async def test_verdicts_are_not_cached_when_disabled(
+    make_module: Callable[..., UrlValidationModule], accessibility: FakeAccessibilityCheck
+) -> None:
+    module = make_module(verdict_cache={"enabled": False})
+
+    for _ in range(2):
+        await module.check_urls(["https://ok.org/"])
+
+    assert accessibility.checked == {"https://ok.org/": 2}
+
+
+async def test_concurrent_checks_of_an_url_share_one_request(
+    make_module: Callable[..., UrlValidationModule], accessibility: FakeAccessibilityCheck
+) -> None:
+    module = make_module(verdict_cache={"enabled": False})
+    accessibility.statuses["https://ko.org/"] = AutoModerationStatus.Failed
+
+    verdicts = await asyncio.gather(*(module.check_url(url) for url in ["https://ko.org/", "https://KO.org/#top"] * 3))
+
+    assert {verdict[0] for verdict in verdicts} == {AutoModerationStatus.Failed}
+    assert sum(accessibility.checked.values()) == 1